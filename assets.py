@@ -0,0 +1,57 @@
+"""画面に埋め込む静的な CSS・説明文
+
+モジュールとして読み込むことで、再実行ごとではなくプロセスで1回だけ作られる。
+"""
+
+# カスタム CSS
+APP_CSS = """
+<style>
+    .stButton>button {
+        width: 100%;
+        margin-top: 10px;
+    }
+    .speaker-info {
+        padding: 10px;
+        background-color: #e8f0fe;
+        border-radius: 5px;
+        margin: 10px 0;
+    }
+    .text-display {
+        padding: 20px;
+        background-color: #f8f9fa;
+        border-radius: 8px;
+        border: 2px solid #e8eaed;
+        font-size: 16px;
+        line-height: 1.8;
+        min-height: 200px;
+    }
+    .study-guide {
+        padding: 20px;
+        background-color: #fff9e6;
+        border-radius: 8px;
+        border: 2px solid #ffd966;
+        margin-top: 20px;
+    }
+</style>
+"""
+
+# 使い方
+USAGE_MARKDOWN = """
+1. **サイドバー**でCEFRレベルと単語数を設定
+2. **文章を生成**ボタンをクリック
+3. 生成された文章が表示されます
+4. **読み上げ速度**と**話者**を選択
+5. **読み上げ開始**ボタンで音声再生
+6. **テキストを表示**ボタンでテキストの確認
+7. **単語を隠す**ボタンでリスニング練習
+8. **練習問題**で穴埋め・並べ替え・ディクテーション(その場で採点)
+9. **学習ガイド作成**で詳しい解説を表示
+
+※ ブラウザのWeb Speech APIを使用しているため、インターネット接続が必要です
+※ 「サーバーで音声を作成」をオンにすると、サーバーで合成した音声を再生・ダウンロードできます(最初の文ができた時点で再生を始められます)
+※ 過去のテーマ(全利用者分)から互いに似ていないものを選んで自動的に避けます
+※ 学習ガイドは一つ下のCEFRレベルの学習者を対象に作成されます
+※ 生成した文章はライブラリに保存され、「ライブラリから出題」や検索で再利用できます(API が使えないときも出題します)
+"""
+
+FOOTER_MARKDOWN = "Made with Streamlit 🎈 | Powered by Gemini AI 🤖 | Speech by Web Speech API 🗣️"
@@ -0,0 +1,206 @@
+"""教材の一括生成 CLI(Streamlit 不要)
+
+レベル・単語数ごとに指定件数の文章(と任意で学習ガイド)を asyncio で並行生成し、
+できたものから1件ずつ JSONL に追記する。途中で落ちても、同じコマンドを
+再実行すれば書き込み済みのレコードを飛ばして続きから生成する。
+
+    GEMINI_API_KEY=... python batch_generate.py --levels A2 B1 --word-counts 100 300 \\
+        --count 20 --guides --concurrency 4 --rate 2 --output worksheets.jsonl
+
+    # ネットワーク無しで動作確認
+    python batch_generate.py --backend fake --count 5
+
+    # 本物の応答をカセットに録画し、後から API キー無しで同じ内容を再生する
+    GEMINI_API_KEY=... python batch_generate.py --backend record --count 5
+    python batch_generate.py --backend replay --count 5 --replay-latency recorded
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+from gemini_client import create_client
+from prompts import (
+    PassageResult,
+    build_passage_prompt,
+    build_study_guide_prompt,
+    build_theme_prompt,
+    parse_theme_and_gender,
+    validate_passage_result,
+)
+
+LEVELS = ["A0", "A1", "A2", "B1", "B2", "C1"]
+
+
+class AsyncRateLimiter:
+    """1秒あたりのリクエスト数を制限するトークンバケット"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def record_id(cefr_level, word_count, index):
+    return f"{cefr_level}-{word_count}-{index:04d}"
+
+
+def truncate_partial_line(path):
+    """クラッシュで途中まで書かれた最終行を取り除く"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_completed_ids(path):
+    """書き込み済みのレコード ID(途中で切れた最終行は無視する)"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return completed
+
+
+async def generate_passage(client, limiter, cefr_level, word_count, recent_themes):
+    """構造化出力で生成し、失敗したら文章生成 → テーマ抽出の2回呼び出しにフォールバック"""
+    await limiter.acquire()
+    prompt = build_passage_prompt(cefr_level, word_count, list(recent_themes), structured=True)
+    try:
+        result = validate_passage_result(
+            await client.agenerate('gemini-2.0-flash-lite', prompt, schema=PassageResult)
+        )
+    except Exception:
+        result = None
+    if result is not None:
+        return result.passage, result.theme, result.speaker_gender
+
+    await limiter.acquire()
+    prompt = build_passage_prompt(cefr_level, word_count, list(recent_themes))
+    passage = (await client.agenerate('gemini-2.0-flash-lite', prompt)).text.strip()
+    await limiter.acquire()
+    response = await client.agenerate('gemini-2.0-flash-lite', build_theme_prompt(passage))
+    theme, gender = parse_theme_and_gender(response.text)
+    return passage, theme, gender
+
+
+async def generate_record(client, limiter, semaphore, job, with_guide, recent_themes):
+    cefr_level, word_count, index = job
+    async with semaphore:
+        passage, theme, gender = await generate_passage(
+            client, limiter, cefr_level, word_count, recent_themes[cefr_level]
+        )
+        recent_themes[cefr_level].append(theme)
+        guide = None
+        if with_guide:
+            await limiter.acquire()
+            response = await client.agenerate('gemini-2.0-flash', build_study_guide_prompt(passage, cefr_level))
+            guide = response.text.strip()
+    return {
+        "id": record_id(cefr_level, word_count, index),
+        "created_at": datetime.now().isoformat(),
+        "cefr_level": cefr_level,
+        "word_count": word_count,
+        "actual_word_count": len(passage.split()),
+        "theme": theme,
+        "speaker_gender": gender,
+        "passage": passage,
+        "study_guide": guide,
+    }
+
+
+async def run(args):
+    client = create_client(
+        args.backend,
+        api_key=os.environ.get("GEMINI_API_KEY"),
+        fake_latency=args.fake_latency,
+        cassette_path=args.cassette,
+        replay_latency=args.replay_latency,
+        max_concurrency=args.concurrency,
+    )
+    truncate_partial_line(args.output)
+    completed = load_completed_ids(args.output)
+    jobs = [
+        (cefr_level, word_count, index)
+        for cefr_level in args.levels
+        for word_count in args.word_counts
+        for index in range(args.count)
+        if record_id(cefr_level, word_count, index) not in completed
+    ]
+    total = len(jobs) + len(completed)
+    print(f"{len(completed)} 件は生成済み, {len(jobs)} 件を生成します → {args.output}", file=sys.stderr)
+
+    limiter = AsyncRateLimiter(args.rate, burst=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # 同じレベルで直近のテーマを避ける(プロンプトが長くならないよう5件まで)
+    recent_themes = {cefr_level: deque(maxlen=5) for cefr_level in args.levels}
+    tasks = [
+        asyncio.create_task(generate_record(client, limiter, semaphore, job, args.guides, recent_themes))
+        for job in jobs
+    ]
+    failures = 0
+    done = len(completed)
+    with open(args.output, "a", encoding="utf-8") as f:
+        for task in asyncio.as_completed(tasks):
+            try:
+                record = await task
+            except Exception as e:
+                failures += 1
+                print(f"生成に失敗しました: {e}", file=sys.stderr)
+                continue
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            done += 1
+            print(f"[{done}/{total}] {record['id']} {record['theme']}", file=sys.stderr)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="リスニング教材を一括生成して JSONL に書き出す")
+    parser.add_argument("--levels", nargs="+", default=["A2"], choices=LEVELS, help="CEFRレベル")
+    parser.add_argument("--word-counts", nargs="+", type=int, default=[100], help="単語数")
+    parser.add_argument("--count", type=int, default=10, help="レベル・単語数の組み合わせごとの件数")
+    parser.add_argument("--guides", action="store_true", help="学習ガイドも生成する")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に生成する件数")
+    parser.add_argument("--rate", type=float, default=2.0, help="1秒あたりの最大リクエスト数")
+    parser.add_argument("--output", default="worksheets.jsonl", help="出力先の JSONL")
+    parser.add_argument("--backend", default="genai", choices=["genai", "fake", "record", "replay"])
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="フェイクバックエンドの応答時間(秒)")
+    parser.add_argument("--cassette", default=".cache/cassette.sqlite3", help="録画・再生に使うカセット")
+    parser.add_argument(
+        "--replay-latency", default=None, help="再生時の待ち時間(秒数、または録画時と同じにする recorded)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.backend in ("genai", "record") and not os.environ.get("GEMINI_API_KEY"):
+        parser.error("環境変数 GEMINI_API_KEY を設定してください")
+    failures = asyncio.run(run(args))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""セッションあたりのメモリ: 大きな文字列をセッション状態に置く場合と、共有ブロブストアに置く場合
+
+N セッション分の典型的な状態(文章・学習ガイド5項目の HTML・単語隠しエンジン・
+テーマログ・語彙レベルの履歴)を作り、1セッションあたりの pickle サイズと
+プロセス全体の合計(ストアの中身を含む)を比べる。一部のセッションは同じ文章
+(ライブラリや先読みから出題したもの)を共有する。あわせてストアの get の所要時間も測る。
+
+    python benchmarks/bench_blob_store.py --sessions 300
+"""
+import argparse
+import os
+import pickle
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_theme_store import measure  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+from gemini_client import fake_passage  # noqa: E402
+from hiding import WordHider  # noqa: E402
+from prompts import STUDY_GUIDE_SECTIONS  # noqa: E402
+
+GUIDE_ROW = (
+    '<tr><td style="padding: 8px; border: 1px solid #e8eaed; font-weight: bold; color: #1a73e8;">{word}</td>'
+    '<td style="padding: 8px; border: 1px solid #e8eaed;">「{word}」の意味と使い方の説明 {i}</td></tr>'
+)
+
+
+def make_guide_section(rng, section, rows=40):
+    words = rng.sample(" ".join(fake_passage(200, rng.random()).split()).split(), rows)
+    body = "".join(GUIDE_ROW.format(word=word, i=i) for i, word in enumerate(words))
+    return f'<div style="font-family: sans-serif;"><h2>{section}</h2><table>{body}</table></div>'
+
+
+def make_session(rng, passage, guide, store=None):
+    """セッション状態。store を渡すと大きな文字列をストアに置いてキーだけを持つ"""
+    state = {
+        "theme_log": [{"theme": "テーマ", "text_preview": passage[:100] + "...", "cefr_level": "A2"}] * 5,
+        "lexical_profile": {"coverage": 0.95, "level_shares": {"A1": 0.8, "A2": 0.15}, "off_level_words": ["x"] * 10},
+        "lexical_history": [{"coverage": rng.random(), "A1": 0.8, "A2": 0.15}] * 50,
+    }
+    if store is None:
+        hider = WordHider(passage)
+        hider.mask("endings")
+        state.update(generated_text=passage, study_guide=dict(guide), word_hider=hider)
+    else:
+        state.update(
+            passage_key=store.put(passage),
+            study_guide={section: store.put(html) for section, html in guide.items()},
+        )
+    return state
+
+
+def state_bytes(state):
+    return len(pickle.dumps(state))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--words", type=int, default=600)
+    parser.add_argument("--shared", type=float, default=0.3, help="他のセッションと同じ文章を表示している割合")
+    parser.add_argument("--memory-limit-mb", type=float, default=2)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    passages = []
+    for i in range(args.sessions):
+        if passages and rng.random() < args.shared:
+            passages.append(rng.choice(passages))
+        else:
+            passage = fake_passage(args.words, i)
+            guide = {section: make_guide_section(rng, section) for section in STUDY_GUIDE_SECTIONS}
+            passages.append((passage, guide))
+
+    before = [state_bytes(make_session(rng, passage, guide)) for passage, guide in passages]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, memory_limit=int(args.memory_limit_mb * 1024 * 1024))
+        after = [state_bytes(make_session(rng, passage, guide, store)) for passage, guide in passages]
+        usage = store.usage()
+        keys = [make_session(rng, passage, guide, store)["passage_key"] for passage, guide in passages]
+        hot = keys[-1]
+        hot_p50, hot_p95 = measure(lambda: store.get(hot), 500)
+        cold_p50, cold_p95 = measure(lambda: store.get(rng.choice(keys)), 500)
+
+    print(f"{args.sessions} セッション(約 {args.words} 語の文章 + 学習ガイド5項目、{args.shared:.0%} は文章を共有)")
+    print(f"  変更前: 1セッションあたり {sum(before) / len(before) / 1024:8.1f} KB  合計 {sum(before) / 1024 / 1024:7.1f} MB")
+    print(f"  変更後: 1セッションあたり {sum(after) / len(after) / 1024:8.1f} KB  合計 {sum(after) / 1024 / 1024:7.1f} MB"
+          f"  + ストアのメモリ {usage['memory_bytes'] / 1024 / 1024:.1f} MB(上限 {args.memory_limit_mb:g} MB)")
+    print(f"  ストア: 圧縮前 {usage['raw_bytes'] / 1024 / 1024:.1f} MB → メモリ {usage['memory_items']} 件"
+          f" + ディスク {usage['disk_items']} 件 {usage['disk_bytes'] / 1024 / 1024:.1f} MB, 重複 {usage['deduplicated']} 件")
+    print(f"  get(メモリ)           p50 {hot_p50:.3f} ms  p95 {hot_p95:.3f} ms")
+    print(f"  get(ランダム・ディスク含む) p50 {cold_p50:.3f} ms  p95 {cold_p95:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""カセット(録画した応答)の大きさと再生時の検索時間
+
+フェイクバックエンドの応答を N 件録画し、非圧縮のプロンプト+応答に対するファイルの大きさと、
+完全一致・正規化(避けるテーマの一覧だけが違うプロンプト)での検索の p50 / p95 を測る。
+
+    python benchmarks/bench_cassette.py --items 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_theme_store import make_theme  # noqa: E402
+from cassette import Cassette, RecordingBackend, ReplayBackend  # noqa: E402
+from gemini_client import FakeBackend  # noqa: E402
+from prompts import build_passage_prompt, build_study_guide_section_prompt  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+SECTIONS = ("overview", "vocabulary", "grammar", "tips", "exercises")
+
+
+def make_prompts(rng, items):
+    """(プロンプト, 避けるテーマだけを変えた同じリクエストのプロンプト) のリスト"""
+    prompts = []
+    for i in range(items):
+        level = LEVELS[i % len(LEVELS)]
+        if i % 2:
+            text = build_passage_prompt(level, 100 + i, [make_theme(rng) for _ in range(5)])
+            variant = build_passage_prompt(level, 100 + i, [make_theme(rng) for _ in range(3)])
+        else:
+            text = build_study_guide_section_prompt(f"Passage number {i}. " * 40, level, SECTIONS[i % len(SECTIONS)])
+            variant = "  " + text.replace("\n", "\n\n")
+        prompts.append((text, variant))
+    return prompts
+
+
+def percentiles(samples):
+    return np.percentile(samples, 50) * 1000, np.percentile(samples, 95) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    prompts = make_prompts(rng, args.items)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.sqlite3")
+        cassette = Cassette(path)
+        recorder = RecordingBackend(FakeBackend(), cassette)
+        raw = 0
+        start = time.perf_counter()
+        for prompt, _variant in prompts:
+            raw += len(prompt.encode("utf-8")) + len(recorder.generate(MODEL, prompt).text.encode("utf-8"))
+        print(f"{args.items} 件を録画: {time.perf_counter() - start:.2f} 秒")
+        cassette.checkpoint()
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"  ファイル {size / 1024:.0f} KiB / 非圧縮のプロンプト+応答 {raw / 1024:.0f} KiB")
+
+        replay = ReplayBackend(cassette)
+        for label, index in (("完全一致", 0), ("正規化で一致", 1)):
+            samples = []
+            for _ in range(args.lookups):
+                prompt = rng.choice(prompts)[index]
+                start = time.perf_counter()
+                replay.generate(MODEL, prompt)
+                samples.append(time.perf_counter() - start)
+            p50, p95 = percentiles(samples)
+            print(f"  {label:<8} p50 {p50:6.3f} ms / p95 {p95:6.3f} ms")
+        print(f"  {cassette.stats}")
+
+
+if __name__ == "__main__":
+    main()
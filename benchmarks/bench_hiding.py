@@ -0,0 +1,67 @@
+"""単語隠しのマイクロベンチマーク
+
+従来の hide_word_endings(再実行ごとに正規表現を2回)と、WordHider による
+初回(トークン化+書き換え)・2回目以降(保持した結果を返す)・モード切替時
+(span の書き換えのみ)のコストを比較する。
+
+    python benchmarks/bench_hiding.py
+"""
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_vocab import make_passage  # noqa: E402
+from hiding import WordHider  # noqa: E402
+from vocab import VocabularyIndex  # noqa: E402
+
+
+def hide_word_endings(text):
+    """従来の実装(比較用)"""
+    def hide_word(match):
+        word = match.group(0)
+        if len(word) <= 2:
+            return word
+        else:
+            return word[:2] + '-' * (len(word) - 2)
+
+    pattern = r'\b[a-zA-Z]+(?:\'[a-zA-Z]+)?\b'
+    return re.sub(pattern, hide_word, text)
+
+
+def best_ms(func, runs=200):
+    return min(timeit.repeat(func, number=runs, repeat=5)) / runs * 1000
+
+
+def main():
+    index = VocabularyIndex.from_directory(ROOT)
+    print(f"{'words':>6} {'legacy x2':>10} {'first':>8} {'rerun':>8} {'new mode':>9} {'level':>8}  (ms per rerun)")
+    for word_count in (100, 500, 1000):
+        text = make_passage(index, word_count, seed=word_count)
+        assert WordHider(text).mask() == hide_word_endings(text)
+
+        legacy = best_ms(lambda: (hide_word_endings(text), hide_word_endings(text)))
+        first = best_ms(lambda: WordHider(text).mask())
+        hider = WordHider(text)
+        hider.mask()
+        rerun = best_ms(lambda: (hider.mask(), hider.mask()))
+
+        def switch_mode():
+            hider._masked.clear()
+            hider.mask("every_nth", n=3)
+        new_mode = best_ms(switch_mode)
+
+        hider.ranks(index)
+
+        def level_mode():
+            hider._masked.clear()
+            hider.mask("above_level", vocabulary_index=index, level_rank=2)
+        level = best_ms(level_mode)
+        print(f"{word_count:>6} {legacy:>10.3f} {first:>8.3f} {rerun:>8.4f} {new_mode:>9.3f} {level:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""文章ライブラリからの出題とキーワード検索の所要時間
+
+合成した文章を N 件(既定 10,000 件)一時ファイルの PassageLibrary に入れ、
+find(レベル・語数での出題、出題済み ID を除外)と search(FTS5 全文検索)の
+p50 / p95 を測る。
+
+    python benchmarks/bench_library.py --items 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_theme_store import make_theme, measure  # noqa: E402
+from gemini_client import fake_passage  # noqa: E402
+from library import PassageLibrary  # noqa: E402
+
+LEVELS = ("A0", "A1", "A2", "B1", "B2", "C1")
+WORD_COUNTS = (50, 100, 150, 200, 300)
+QUERIES = ("library", "grandparents by the sea", "図書館", "公園", "music")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seen", type=int, default=50, help="除外する出題済み ID の数")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        library = PassageLibrary(os.path.join(tmp, "passages.sqlite3"))
+        start = time.perf_counter()
+        for i in range(args.items):
+            word_count = rng.choice(WORD_COUNTS)
+            library.add(
+                fake_passage(word_count, i), rng.choice(LEVELS), word_count, make_theme(rng),
+                rng.choice(["male", "female", "neutral"]), {"coverage": rng.random(), "level_shares": {}},
+            )
+        insert_s = time.perf_counter() - start
+
+        seen = rng.sample(range(1, args.items + 1), min(args.seen, args.items))
+        find_p50, find_p95 = measure(
+            lambda: library.find(rng.choice(LEVELS), rng.choice(WORD_COUNTS), exclude_ids=seen), args.runs
+        )
+        search_p50, search_p95 = measure(lambda: library.search(rng.choice(QUERIES)), args.runs)
+        level_p50, level_p95 = measure(lambda: library.search(rng.choice(QUERIES), rng.choice(LEVELS)), args.runs)
+        size_mb = os.path.getsize(library.path) / 1024 / 1024
+
+    print(f"{args.items:,} 件: 追加 {insert_s:.1f} 秒 ({insert_s / args.items * 1000:.2f} ms/件), ファイル {size_mb:.1f} MB")
+    print(f"find (除外 {len(seen)} 件)      p50 {find_p50:.3f} ms  p95 {find_p95:.3f} ms")
+    print(f"search                  p50 {search_p50:.3f} ms  p95 {search_p95:.3f} ms")
+    print(f"search (レベル指定)     p50 {level_p50:.3f} ms  p95 {level_p95:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
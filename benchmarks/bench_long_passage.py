@@ -0,0 +1,70 @@
+"""長文モード(構成 → 段落の並行生成)と1回の呼び出しの所要時間の比較
+
+フェイクバックエンドの応答時間を「固定の遅延 + 出力語数に比例する時間」で模擬し、
+1000語の文章を1回で生成した場合と長文モードで生成した場合を比べる。
+語数のずれも数える。
+
+    python benchmarks/bench_long_passage.py --words 1000 --base 0.4 --per-word 0.01
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gemini_client import FakeBackend, GeminiClient, fake_responder  # noqa: E402
+from long_passage import count_words, generate_long_passage  # noqa: E402
+from prompts import build_passage_prompt  # noqa: E402
+
+
+class ProportionalLatencyBackend(FakeBackend):
+    """出力語数に比例して遅くなるフェイクバックエンド"""
+
+    def __init__(self, base, per_word):
+        super().__init__()
+        self.base = base
+        self.per_word = per_word
+
+    def generate(self, model, prompt, schema=None, timeout=None):
+        text = fake_responder(model, prompt, schema)
+        time.sleep(self.base + self.per_word * len(text.split()))
+        return self._to_response(model, prompt, schema, text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=1000)
+    parser.add_argument("--base", type=float, default=0.4, help="1回の呼び出しの固定遅延(秒)")
+    parser.add_argument("--per-word", type=float, default=0.01, help="出力1語あたりの時間(秒)")
+    args = parser.parse_args(argv)
+
+    client = GeminiClient(ProportionalLatencyBackend(args.base, args.per_word))
+    executor = ThreadPoolExecutor(max_workers=8)
+
+    start = time.perf_counter()
+    single = client.generate("gemini-2.0-flash-lite", build_passage_prompt("B1", args.words, []))
+    single_s = time.perf_counter() - start
+
+    def submit(prompt, schema, operation):
+        return executor.submit(client.generate, "gemini-2.0-flash-lite", prompt, schema=schema)
+
+    start = time.perf_counter()
+    result = generate_long_passage(submit, "B1", args.words, [], poll_interval=0.01)
+    long_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    paragraph = client.generate("gemini-2.0-flash-lite", build_passage_prompt("B1", result["targets"][0], []))
+    paragraph_s = time.perf_counter() - start
+
+    print(f"{args.words} 語, 応答時間 = {args.base} 秒 + {args.per_word * 1000:.0f} ms/語")
+    print(f"1回の呼び出し      {single_s:6.2f} 秒  {count_words(single.text)} 語")
+    print(f"長文モード         {long_s:6.2f} 秒  {count_words(result['passage'])} 語"
+          f"  ({len(result['targets'])} 段落, 書き直し {result['rewritten_paragraphs']})")
+    print(f"  参考: 1段落のみ  {paragraph_s:6.2f} 秒  {count_words(paragraph.text)} 語")
+
+
+if __name__ == "__main__":
+    main()
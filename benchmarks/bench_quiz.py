@@ -0,0 +1,52 @@
+"""練習問題の作成と採点の所要時間
+
+100〜1000語の文章から穴埋め・並べ替えの問題を作る時間(新しい語彙インデックス
+での初回と、活用形のキャッシュが効いた2回目以降)と、全文のディクテーションを
+語単位で突き合わせる時間を測る。同じシードで同じ問題になることも確かめる。
+
+    python benchmarks/bench_quiz.py
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_theme_store import measure  # noqa: E402
+from bench_vocab import make_passage  # noqa: E402
+from quiz import build_quiz, diff_dictation  # noqa: E402
+from vocab import VocabularyIndex  # noqa: E402
+
+
+def mistype(text, rate, seed):
+    """一定の割合の語を落とす・置き換えた入力を作る"""
+    rng = random.Random(seed)
+    typed = []
+    for word in text.split():
+        roll = rng.random()
+        if roll < rate / 2:
+            continue
+        typed.append("xxx" if roll < rate else word)
+    return " ".join(typed)
+
+
+def main():
+    print(f"{'words':>6} {'cold ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'cloze':>6} {'order':>6} {'diff p50 ms':>12}")
+    for word_count in (100, 300, 600, 1000):
+        text = make_passage(VocabularyIndex.from_directory(ROOT), word_count, seed=word_count)
+        index = VocabularyIndex.from_directory(ROOT)
+        start = time.perf_counter()
+        quiz = build_quiz(text, index, "B1", seed=0)
+        cold_ms = (time.perf_counter() - start) * 1000
+        seeds = iter(range(1000))
+        p50, p95 = measure(lambda: build_quiz(text, index, "B1", seed=next(seeds)), 100)
+        assert build_quiz(text, index, "B1", seed=0) == quiz, "同じシードで結果が変わりました"
+        typed = mistype(text, 0.1, word_count)
+        diff_p50, _ = measure(lambda: diff_dictation(text, typed), 20)
+        print(f"{word_count:>6} {cold_ms:>8.2f} {p50:>7.2f} {p95:>7.2f} {len(quiz.cloze):>6} {len(quiz.word_order):>6} {diff_p50:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
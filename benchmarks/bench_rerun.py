@@ -0,0 +1,124 @@
+"""メインエリアの操作ごとの再実行時間(フラグメント化の前後)
+
+フェイクバックエンド(GEMINI_BACKEND=fake)のアプリを streamlit.testing.v1.AppTest で
+実際に動かし、アプリ自身の計測値(render:script と各パネルの render:*)から比べる。
+
+- 変更前: どのボタンでもスクリプト全体が再実行される → render:script の時間
+- 変更後: テキスト表示と学習ガイドの切替は各フラグメントだけが再実行される
+  → そのパネルの render:* の時間。単語隠しの切替は全体を再実行するが、
+  読み上げ HTML はメモ化済みを返す → st.cache_data を空にした場合としない場合の render:script
+
+AppTest はフラグメント内のボタンでもスクリプト全体を実行するので、フラグメントだけの
+再実行時間は、全体の実行の中で計ったそのパネルの時間で代用する。st.cache_data を空にすると
+読み上げ HTML 以外のメモ化も消えるので、メモ化だけの効果は最後の行(読み上げパネルの時間)で見る。
+
+    python benchmarks/bench_rerun.py --words 1000 --repeat 20
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "test.py")
+PASSWORD = "bench-rerun"
+
+
+def read_new_durations(metrics_path, offset):
+    """計測ファイルの offset 行目以降の {操作: 所要時間} と、ファイルの行数"""
+    durations = {}
+    with open(metrics_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    for line in lines[offset:]:
+        entry = json.loads(line)
+        durations[entry["operation"]] = entry["duration"]
+    return durations, len(lines)
+
+
+def button(at, label):
+    return next(b for b in at.button if label in b.label)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=300, help="文章の語数(長文モードにならない範囲)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # .cache を汚さないよう一時ディレクトリで実行する
+    workdir = tempfile.mkdtemp(prefix="bench_rerun_")
+    os.chdir(workdir)
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    os.environ["GEMINI_BACKEND"] = "fake"
+    at = AppTest.from_file(SCRIPT, default_timeout=60)
+    for name, value in {
+        "password": PASSWORD,
+        "PREFETCH_DEPTH": 0,
+        "METRICS_PATH": metrics_path,
+        "LONG_PASSAGE_THRESHOLD": args.words + 1,
+    }.items():
+        at.secrets[name] = value
+    try:
+        at.run()
+        at.text_input[0].input(PASSWORD).run()
+        at.toggle[0].set_value(False)
+        at.slider[0].set_value(args.words).run()
+        button(at, "文章を生成").click().run()
+        button(at, "学習ガイド作成").click().run()
+        if at.exception:
+            print(f"準備に失敗しました: {at.exception}")
+            return 1
+        _, offset = read_new_durations(metrics_path, 0)
+
+        samples = {}
+
+        def measure(name, action, clear_cache=False):
+            nonlocal offset
+            for _ in range(args.repeat):
+                if clear_cache:
+                    st.cache_data.clear()
+                action().run()
+                durations, offset = read_new_durations(metrics_path, offset)
+                for operation, seconds in durations.items():
+                    samples.setdefault((name, operation), []).append(seconds)
+
+        def toggle_hiding():
+            return button(at, "🔤" if at.session_state.show_original_text else "✨")
+
+        measure("text", lambda: button(at, "📄").click())
+        measure("guide", lambda: button(at, "👀").click())
+        # 単語隠しのボタンはテキストの表示中だけ出る
+        if not at.session_state.text_visible:
+            button(at, "📄").click().run()
+        _, offset = read_new_durations(metrics_path, 0)
+        measure("hide", lambda: toggle_hiding().click())
+        measure("hide_cold", lambda: toggle_hiding().click(), clear_cache=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def p50(name, operation):
+        return np.percentile(samples[(name, operation)], 50) * 1000
+
+    cases = [
+        ("テキスト表示の切替", p50("text", "render:script"), p50("text", "render:text_panel")),
+        ("学習ガイド表示の切替", p50("guide", "render:script"), p50("guide", "render:study_guide_panel")),
+        ("単語隠しの切替", p50("hide_cold", "render:script"), p50("hide", "render:script")),
+    ]
+    print(f"{args.words} 語の文章と学習ガイド, 表示/非表示を交互に {args.repeat} 回の中央値")
+    print(f"{'操作':<12} {'変更前 ms':>10} {'変更後 ms':>10}")
+    for label, before, after in cases:
+        print(f"{label:<12} {before:>10.2f} {after:>10.2f}")
+    print(f"(読み上げパネル: メモ化なし {p50('hide_cold', 'render:speech_panel'):.2f} ms"
+          f" / メモ化あり {p50('hide', 'render:speech_panel'):.2f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
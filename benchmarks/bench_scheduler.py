@@ -0,0 +1,75 @@
+"""スケジューラー経由のバースト時の挙動(フェイクバックエンド)
+
+N セッションが同時にボタンを連打した状況を再現し、実際のモデル呼び出し回数
+(重複排除の効果)、セッションごとの完了時刻の偏り(公平性)、流量制限の遵守を確認する。
+
+    python benchmarks/bench_scheduler.py --sessions 20 --requests 3 --rpm 600
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gemini_client import create_client  # noqa: E402
+from scheduler import RequestScheduler, request_key  # noqa: E402
+
+MODEL = "gemini-2.0-flash"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=3, help="セッションごとのリクエスト数")
+    parser.add_argument("--shared", type=float, default=0.5, help="他のセッションと同じ文章を頼む割合")
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    client = create_client("fake", fake_latency=args.latency)
+    calls = []
+    generate = client.generate
+
+    def counted(model, prompt, schema=None):
+        calls.append(time.perf_counter())
+        return generate(model, prompt, schema=schema)
+
+    client.generate = counted
+    scheduler = RequestScheduler(rpm={MODEL: args.rpm}, workers=8, session_quota=args.requests)
+    finished = {}
+    start = time.perf_counter()
+
+    def session(index):
+        tickets = []
+        for i in range(args.requests):
+            # 一部のセッションは同じ文章の学習ガイドを頼む
+            shared = index < args.sessions * args.shared
+            prompt = f"学習ガイド 文章{i}" if shared else f"学習ガイド 文章{index}-{i}"
+            tickets.append(scheduler.submit(
+                f"s{index}", MODEL, lambda p=prompt: client.generate(MODEL, p), key=request_key(MODEL, prompt)
+            ))
+        for ticket in tickets:
+            ticket.result()
+        finished[index] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    requested = args.sessions * args.requests
+    window = max(calls) - min(calls) if len(calls) > 1 else 0
+    times = sorted(finished.values())
+    print(f"{args.sessions} セッション × {args.requests} 件 = {requested} 件のリクエスト, 所要 {elapsed:.2f} 秒")
+    print(f"モデル呼び出し {len(calls)} 回 (相乗り {scheduler.stats['coalesced']} 件)")
+    print(f"実効レート {len(calls) / window * 60 if window else 0:.0f} 回/分 (上限 {args.rpm}, 最初のバースト {scheduler.burst} 件を含む)")
+    print(f"セッションの完了時刻 最速 {times[0]:.2f} 秒 / 中央 {times[len(times) // 2]:.2f} 秒 / 最遅 {times[-1]:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
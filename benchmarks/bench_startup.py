@@ -0,0 +1,92 @@
+"""起動時間: モジュールの読み込み時間と、ログイン画面・ログイン後の画面の表示時間
+
+それぞれ新しいプロセスで測る(読み込み済みのモジュールに影響されないように)。
+
+- 読み込み時間: streamlit を読み込んだ後、各モジュールの import にかかる時間
+- 表示時間: AppTest でアプリを実行し、ログイン画面の1回目の実行と、
+  パスワード入力後の1回目の実行にかかる時間。それぞれの時点で google.genai と
+  pandas が読み込まれているかも表示する(API は呼ばない)
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = (
+    "pandas", "numpy", "pydantic", "google.genai",
+    "gemini_client", "prompts", "metrics", "theme_store", "vocab", "library", "long_passage",
+)
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+"""
+
+PAINT_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import_ms = (time.perf_counter() - start) * 1000
+
+def loaded():
+    return {{name: name in sys.modules for name in ("google.genai", "pandas")}}
+
+at = AppTest.from_file(os.path.join({root!r}, "test.py"), default_timeout=60)
+at.secrets["password"] = "pw"
+at.secrets["GEMINI_API_KEY"] = "dummy"
+at.secrets["PREFETCH_DEPTH"] = 0
+start = time.perf_counter()
+at.run()
+login_ms = (time.perf_counter() - start) * 1000
+login_loaded = loaded()
+start = time.perf_counter()
+at.text_input[0].input("pw").run()
+app_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"import_ms": import_ms, "login_ms": login_ms, "app_ms": app_ms,
+                  "login_loaded": login_loaded, "app_loaded": loaded(), "errors": len(at.exception)}}))
+"""
+
+
+def run_python(code, cwd):
+    env = dict(os.environ)
+    env.pop("GEMINI_BACKEND", None)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print("モジュールの読み込み時間 (ms, 中央値)")
+    for module in MODULES:
+        timings = [float(run_python(IMPORT_SCRIPT.format(root=ROOT, module=module), ROOT)) for _ in range(args.runs)]
+        print(f"  {module:<16} {statistics.median(timings):8.1f}")
+
+    # .cache を汚さないよう一時ディレクトリで実行する
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [json.loads(run_python(PAINT_SCRIPT.format(root=ROOT), tmp)) for _ in range(args.runs)]
+    print("表示時間 (ms, 中央値)")
+    print(f"  AppTest の読み込み   {statistics.median(r['import_ms'] for r in results):8.1f}")
+    print(f"  ログイン画面         {statistics.median(r['login_ms'] for r in results):8.1f}  読み込み済み: {results[-1]['login_loaded']}")
+    print(f"  ログイン後の画面     {statistics.median(r['app_ms'] for r in results):8.1f}  読み込み済み: {results[-1]['app_loaded']}")
+    if any(r["errors"] for r in results):
+        print("  (アプリで例外が発生しました)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""テーマ履歴の近似重複検索とプロンプト用サンプリングの所要時間
+
+合成したテーマを N 件(既定 10,000 件以上)一時ファイルの ThemeStore に入れ、
+find_near_duplicates / sample_diverse の p50 / p95 を測る。
+
+    python benchmarks/bench_theme_store.py --items 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gemini_client import FAKE_SENTENCES  # noqa: E402
+from theme_store import ThemeStore  # noqa: E402
+
+PLACES = ("公園", "図書館", "駅", "学校", "市場", "海辺", "山小屋", "博物館", "空港", "病院", "農場", "映画館")
+ACTIVITIES = ("散歩", "読書", "料理", "旅行", "掃除", "買い物", "ボランティア", "写真撮影", "音楽", "スポーツ", "勉強", "祭り")
+SEASONS = ("春の", "夏の", "秋の", "冬の", "週末の", "朝の", "夜の", "")
+
+
+def make_theme(rng):
+    return f"{rng.choice(SEASONS)}{rng.choice(PLACES)}での{rng.choice(ACTIVITIES)}"
+
+
+def make_preview(rng):
+    return " ".join(rng.sample(FAKE_SENTENCES, 2))[:100] + "..."
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentile(timings, 0.5), percentile(timings, 0.95)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "themes.sqlite3")
+        store = ThemeStore(path)
+        start = time.perf_counter()
+        for _ in range(args.items):
+            store.add(make_theme(rng), make_preview(rng), rng.choice(["A2", "B1"]))
+        insert_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reloaded = ThemeStore(path)
+        load_s = time.perf_counter() - start
+
+        queries = [(make_theme(rng), make_preview(rng)) for _ in range(args.runs)]
+        query_iter = iter(queries * 2)
+        dup_p50, dup_p95 = measure(lambda: reloaded.find_near_duplicates(*next(query_iter)), args.runs)
+        sample_p50, sample_p95 = measure(
+            lambda: reloaded.sample_diverse(k=6, seed_themes=[make_theme(rng)]), args.runs
+        )
+        sample = reloaded.sample_diverse(k=6, seed_themes=[make_theme(rng)])
+
+    print(f"{args.items:,} 件: 追加 {insert_s:.1f} 秒 ({insert_s / args.items * 1000:.2f} ms/件), 再読み込み {load_s:.2f} 秒")
+    print(f"find_near_duplicates  p50 {dup_p50:.3f} ms  p95 {dup_p95:.3f} ms")
+    print(f"sample_diverse (k=6)  p50 {sample_p50:.3f} ms  p95 {sample_p95:.3f} ms")
+    print("プロンプトに渡すテーマの例:", " / ".join(sample))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""サーバー側の音声合成: 最初の文が再生できるまでの時間と、全文の音声ができるまでの時間
+
+合成時間が語数に比例するフェイクバックエンド(espeak があれば --backend espeak)で、
+文章全体を1回で合成した場合と、文ごとにワーカーで合成した場合を比べる。
+2回目(クリップがキャッシュ済み)の時間も測る。
+
+    python benchmarks/bench_tts.py --words 300 --per-word 0.01 --workers 1 2 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_vocab import make_passage  # noqa: E402
+from speech_player import split_sentences  # noqa: E402
+from tts import DEFAULT_RATE, VOICES, AudioRenderer, ClipCache, EspeakBackend, FakeTTSBackend  # noqa: E402
+from vocab import VocabularyIndex  # noqa: E402
+
+
+class ProportionalLatencyBackend(FakeTTSBackend):
+    """語数に比例して遅くなるフェイクバックエンド"""
+
+    def __init__(self, per_word):
+        super().__init__()
+        self.per_word = per_word
+
+    def synthesize(self, text, voice, rate):
+        time.sleep(self.per_word * len(text.split()))
+        return super().synthesize(text, voice, rate)
+
+
+def measure(backend, sentences, workers, directory):
+    """(最初の文ができるまで, 全文ができるまで, 結合まで) の秒数"""
+    renderer = AudioRenderer(backend, ClipCache(directory), workers=workers)
+    start = time.perf_counter()
+    job = renderer.render(sentences, VOICES["neutral"], DEFAULT_RATE)
+    job.futures[0].result()
+    first = time.perf_counter() - start
+    job.wait()
+    synthesized = time.perf_counter() - start
+    renderer.assemble(job, "wav")
+    return first, synthesized, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--per-word", type=float, default=0.01, help="1語あたりの合成時間(秒、フェイクのみ)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", choices=("fake", "espeak"), default="fake")
+    args = parser.parse_args(argv)
+
+    backend = EspeakBackend() if args.backend == "espeak" else ProportionalLatencyBackend(args.per_word)
+    text = make_passage(VocabularyIndex.from_directory(ROOT), args.words, seed=1)
+    sentences = split_sentences(text)
+    print(f"{args.words} 語, {len(sentences)} 文, バックエンド: {backend.name}")
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        backend.synthesize(text, VOICES["neutral"], DEFAULT_RATE)
+        print(f"  全文を1回で合成            再生開始まで {time.perf_counter() - start:6.2f} 秒")
+        for workers in args.workers:
+            shutil.rmtree(directory)
+            first, synthesized, assembled = measure(backend, sentences, workers, directory)
+            print(f"  文ごと (ワーカー {workers})        再生開始まで {first:6.2f} 秒"
+                  f" / 全文の合成 {synthesized:6.2f} 秒 / 結合まで {assembled:6.2f} 秒")
+        first, synthesized, assembled = measure(backend, sentences, args.workers[-1], directory)
+        print(f"  キャッシュ済み                再生開始まで {first:6.2f} 秒"
+              f" / 全文の合成 {synthesized:6.2f} 秒 / 結合まで {assembled:6.2f} 秒")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""語彙インデックスのベンチマーク
+
+構築時間と、100〜1000語の文章1件あたりの語彙プロファイル作成コストを計測する。
+
+    python benchmarks/bench_vocab.py
+"""
+import os
+import random
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vocab import VocabularyIndex  # noqa: E402
+
+SUFFIXES = ("", "", "", "s", "ed", "ing", "'s")
+
+
+def make_passage(index, word_count, seed=0):
+    """単語リストの語・熟語・活用形・未知語を混ぜた擬似的な文章を作る"""
+    rng = random.Random(seed)
+    words = sorted(index.words)
+    phrases = []
+    stack = [((), index.phrases)]
+    while stack:
+        prefix, node = stack.pop()
+        for key, child in node.items():
+            if key is None:
+                phrases.append(" ".join(prefix))
+            else:
+                stack.append((prefix + (key,), child))
+    phrases.sort()
+
+    out = []
+    count = 0
+    while count < word_count:
+        sentence = []
+        for _ in range(rng.randint(6, 14)):
+            roll = rng.random()
+            if roll < 0.08:
+                piece = rng.choice(phrases)
+            elif roll < 0.12:
+                piece = "zorblax"
+            else:
+                piece = rng.choice(words) + rng.choice(SUFFIXES)
+            sentence.append(piece)
+            count += len(piece.split())
+        out.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(out)
+
+
+def main():
+    start = time.perf_counter()
+    index = VocabularyIndex.from_directory(ROOT)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"build: {build_ms:.1f} ms ({len(index)} words, max phrase length {index.max_phrase_length})")
+
+    print(f"{'words':>6} {'tokens':>7} {'cold ms':>8} {'warm ms':>8} {'us/token':>9}")
+    for word_count in (100, 500, 1000):
+        text = make_passage(index, word_count, seed=word_count)
+        index._lookup_cache.clear()
+        start = time.perf_counter()
+        tokens = index.analyze(text)
+        cold_ms = (time.perf_counter() - start) * 1000
+        runs = 50
+        warm_ms = min(timeit.repeat(lambda: index.analyze(text), number=runs, repeat=5)) / runs * 1000
+        print(f"{word_count:>6} {len(tokens):>7} {cold_ms:>8.2f} {warm_ms:>8.2f} {warm_ms * 1000 / len(tokens):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
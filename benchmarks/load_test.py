@@ -0,0 +1,411 @@
+"""同時セッションの負荷試験: 多数の利用者が同時に使ったときの応答時間・メモリ・処理能力
+
+フェイクバックエンド(GEMINI_BACKEND=fake、応答までの待ち時間を指定可能)で、
+N 個のセッションを同時に動かし、実際の画面操作の流れをたどる。
+
+1. ログイン画面を開き、パスワードを入力する(check_password)
+2. ストリーミングを切って文章を生成する(generate_text)
+3. テキストの表示を切り替える
+4. 単語隠しを切り替える
+5. 学習ガイドを作成する
+
+同時実行数ごとに、操作ごとの p50 / p95 / p99、スクリプト全体の再実行時間
+(アプリ自身の render:script の計測値)、1セッションあたりのメモリ(RSS の増分と
+セッション状態の pickle サイズ)、処理能力(セッション数/秒・操作数/秒)を測り、
+同時実行数を増やしても処理能力が伸びなくなる点を上限として報告する。
+結果は JSON で保存でき、前回の結果と比べて遅くなった操作を一覧にできる。
+
+Streamlit サーバーと同じく、全セッションを1つのプロセス内のスレッドで動かす
+(cache_resource のスケジューラー・ブロブストアなどを全セッションで共有する)。
+AppTest は実行のたびにランタイム・secrets・設定を差し替えるため、
+install_shared_runtime でそれらをプロセスで1つに固定してから並行に実行する。
+操作の時間には AppTest が描画結果を解析する時間も含まれる。
+
+    python benchmarks/load_test.py --concurrency 1 4 16 --sessions 32 --latency 0.5 --output load.json
+    python benchmarks/load_test.py --concurrency 1 4 16 --sessions 32 --latency 0.5 --compare load.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import pickle
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "test.py")
+PASSWORD = "load-test"
+
+ACTIONS = ("login_page", "login", "generate", "toggle_text", "toggle_hiding", "study_guide")
+# 各セッションが選ぶレベルと語数(長文モードにならない範囲)
+LEVELS = ("A1", "A2", "B1", "B2")
+WORD_COUNTS = (100, 150, 200, 250, 300)
+# 処理能力の伸びがこの割合未満なら頭打ちとみなす
+SATURATION_GAIN = 0.1
+# 比較で、この時間(秒)未満の差は誤差として無視する
+NOISE_FLOOR = 0.005
+
+
+class SessionFailed(Exception):
+    pass
+
+
+def install_shared_runtime(secrets):
+    """AppTest を複数スレッドから同時に実行できるよう、プロセス全体の状態を1つに固定する
+
+    - Runtime のインスタンス: AppTest は実行ごとに作り直して最後に None に戻すので、
+      AppTest から見える Runtime を差し替え、本物にはここで作ったものを1つ置く
+    - スクリプトのキャッシュ: 実行ごとに新しく作られてコンパイルが並行に走るので、
+      1つを共有し、先にコンパイルしておく
+    - secrets・設定・sys.path: 実行ごとの差し替えと復元が競合しないよう、ここで設定しておく
+    """
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    class DetachedRuntime:
+        _instance = None
+
+    app_test.Runtime = DetachedRuntime
+
+    script_cache = ScriptCache()
+    script_cache.get_bytecode(SCRIPT)
+    app_test.ScriptCache = lambda: script_cache
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+
+    shared_secrets = Secrets()
+    shared_secrets._secrets = secrets
+    st.secrets = shared_secrets
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def rss_bytes():
+    """このプロセスの常駐メモリ(/proc が無い環境では最大常駐メモリ)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def state_bytes(at):
+    """セッション状態の大きさ(pickle できる値の合計バイト数。アプリの session_state_bytes と同じ数え方)"""
+    total = 0
+    for value in at.session_state.to_dict().values():
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            pass
+    return total
+
+
+def find_button(at, *prefixes):
+    for button in at.button:
+        if button.label.startswith(prefixes):
+            return button
+    raise SessionFailed(f"ボタンが見つかりません: {prefixes}")
+
+
+def run_session(session_no, seed, timeout):
+    """1セッション分の操作を順に行い、(操作ごとの秒数, AppTest) を返す"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed * 100003 + session_no)
+    at = AppTest.from_file(SCRIPT, default_timeout=timeout)
+    timings = {}
+
+    def step(name, action):
+        start = time.perf_counter()
+        action()
+        timings[name] = time.perf_counter() - start
+        if at.exception:
+            raise SessionFailed(f"{name}: {at.exception[0].value}")
+
+    def generate():
+        at.sidebar.selectbox[0].set_value(rng.choice(LEVELS))
+        at.sidebar.slider[0].set_value(rng.choice(WORD_COUNTS))
+        next(toggle for toggle in at.toggle if toggle.label == "ストリーミング表示").set_value(False)
+        find_button(at, "🔍").click().run()
+        if at.session_state.passage_key is None:
+            raise SessionFailed("generate: 文章が生成されませんでした")
+
+    def study_guide():
+        find_button(at, "📚 学習ガイド作成").click().run()
+        if not at.session_state.study_guide:
+            raise SessionFailed("study_guide: 学習ガイドが作成されませんでした")
+
+    step("login_page", at.run)
+    step("login", lambda: at.text_input[0].input(PASSWORD).run())
+    step("generate", generate)
+    step("toggle_text", lambda: find_button(at, "📄").click().run())
+    step("toggle_hiding", lambda: find_button(at, "🔤", "✨").click().run())
+    step("study_guide", study_guide)
+    return timings, at
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "p50": float(np.quantile(values, 0.5)),
+        "p95": float(np.quantile(values, 0.95)),
+        "p99": float(np.quantile(values, 0.99)),
+        "max": float(values.max()),
+    }
+
+
+def read_script_durations(metrics_path, skip):
+    """計測ファイルの skip 行目以降にある render:script の所要時間と、ファイルの行数"""
+    durations = []
+    lines = 0
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as f:
+            for lines, line in enumerate(f, 1):
+                if lines <= skip:
+                    continue
+                entry = json.loads(line)
+                if entry["operation"] == "render:script":
+                    durations.append(entry["duration"])
+    return durations, max(lines, skip)
+
+
+def run_level(concurrency, sessions, seed, timeout, metrics_path, metrics_offset):
+    """同時実行数 concurrency で sessions 個のセッションを動かして集計する"""
+    gc.collect()
+    rss_before = rss_bytes()
+    timings = {action: [] for action in ACTIONS}
+    errors = []
+    alive = []
+
+    def worker(session_no):
+        try:
+            return run_session(session_no, seed, timeout)
+        except Exception as e:
+            return e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for result in executor.map(worker, range(sessions)):
+            if isinstance(result, Exception):
+                errors.append(f"{type(result).__name__}: {result}")
+                continue
+            session_timings, at = result
+            for action, seconds in session_timings.items():
+                timings[action].append(seconds)
+            # メモリを測り終えるまでセッションを生かしておく
+            alive.append(at)
+    wall = time.perf_counter() - start
+
+    gc.collect()
+    completed = len(alive)
+    rss_per_session = (rss_bytes() - rss_before) / completed if completed else 0
+    state_sizes = [state_bytes(at) for at in alive]
+    script_durations, metrics_offset = read_script_durations(metrics_path, metrics_offset)
+    actions_done = sum(len(values) for values in timings.values())
+    result = {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": completed,
+        "errors": errors,
+        "wall_seconds": wall,
+        "sessions_per_second": completed / wall,
+        "actions_per_second": actions_done / wall,
+        "actions": {action: summarize(values) for action, values in timings.items()},
+        "script_rerun": summarize(script_durations),
+        "memory": {
+            "rss_bytes_per_session": rss_per_session,
+            "session_state_bytes": summarize(state_sizes),
+        },
+    }
+    return result, metrics_offset
+
+
+def throughput_ceiling(levels):
+    """処理能力の最大値と、同時実行数を増やしても伸びなくなった点"""
+    best = max(levels, key=lambda level: level["sessions_per_second"])
+    saturated_at = None
+    for previous, level in zip(levels, levels[1:]):
+        gain = level["sessions_per_second"] / previous["sessions_per_second"] - 1 if previous["sessions_per_second"] else 0
+        if gain < SATURATION_GAIN:
+            saturated_at = level["concurrency"]
+            break
+    return {
+        "sessions_per_second": best["sessions_per_second"],
+        "actions_per_second": best["actions_per_second"],
+        "at_concurrency": best["concurrency"],
+        "saturated_at_concurrency": saturated_at,
+    }
+
+
+def git_revision():
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=False
+    )
+    return result.stdout.strip() or None
+
+
+def compare(current, previous, threshold):
+    """前回より threshold 以上遅くなった (同時実行数, 項目, 指標) の一覧"""
+    previous_levels = {level["concurrency"]: level for level in previous["levels"]}
+    regressions = []
+    for level in current["levels"]:
+        old_level = previous_levels.get(level["concurrency"])
+        if old_level is None:
+            continue
+        pairs = [(action, level["actions"][action], old_level["actions"].get(action, {})) for action in ACTIONS]
+        pairs.append(("script_rerun", level["script_rerun"], old_level.get("script_rerun", {})))
+        for name, new, old in pairs:
+            for stat in ("p50", "p95"):
+                if stat not in new or stat not in old:
+                    continue
+                if new[stat] - old[stat] > NOISE_FLOOR and new[stat] > old[stat] * (1 + threshold):
+                    regressions.append((level["concurrency"], name, stat, old[stat], new[stat]))
+    return regressions
+
+
+def print_level(level):
+    print(f"\n同時実行数 {level['concurrency']}: {level['completed']}/{level['sessions']} セッション完了 "
+          f"({level['wall_seconds']:.1f} 秒, {level['sessions_per_second']:.2f} セッション/秒, "
+          f"{level['actions_per_second']:.1f} 操作/秒)")
+    print(f"  {'操作':<14}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    rows = [(action, level["actions"][action]) for action in ACTIONS]
+    rows.append(("script_rerun", level["script_rerun"]))
+    for name, stats in rows:
+        if stats.get("count"):
+            print(f"  {name:<14}{stats['p50'] * 1000:9.1f}{stats['p95'] * 1000:9.1f}{stats['p99'] * 1000:9.1f}")
+    memory = level["memory"]
+    print(f"  メモリ: RSS {memory['rss_bytes_per_session'] / 1024:+.0f} KB/セッション, "
+          f"セッション状態 {memory['session_state_bytes'].get('p50', 0) / 1024:.1f} KB (中央値)")
+    for error in level["errors"][:5]:
+        print(f"  エラー: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="同時実行数(複数指定で順に測る)")
+    parser.add_argument("--sessions", type=int, default=None, help="各同時実行数で動かすセッション数(既定: 同時実行数の2倍)")
+    parser.add_argument("--latency", type=float, default=0.2, help="フェイクバックエンドの応答までの秒数")
+    parser.add_argument("--model-concurrency", type=int, default=8, help="モデル呼び出しの同時実行数 (GEMINI_MAX_CONCURRENCY)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="1回の実行のタイムアウト(秒)")
+    parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--compare", help="比べる前回の結果の JSON ファイル")
+    parser.add_argument("--threshold", type=float, default=0.2, help="この割合以上遅くなったら退行とみなす")
+    args = parser.parse_args(argv)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    # .cache を汚さないよう一時ディレクトリで実行する(共有の保存先はすべてここに置く)
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    os.chdir(workdir)
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    os.environ["GEMINI_BACKEND"] = "fake"
+    os.environ["GEMINI_FAKE_LATENCY"] = str(args.latency)
+    install_shared_runtime({
+        "password": PASSWORD,
+        "GEMINI_BACKEND": "fake",
+        "GEMINI_MAX_CONCURRENCY": args.model_concurrency,
+        # レート制限・クォータで待たされないよう十分大きくする(測りたいのはアプリ側の処理)
+        "MODEL_RPM": {"gemini-2.0-flash-lite": 1_000_000, "gemini-2.0-flash": 1_000_000},
+        "SESSION_QUOTA_PER_HOUR": 1_000_000,
+        "PREFETCH_DEPTH": 0,
+        "METRICS_PATH": metrics_path,
+        "METRICS_BUFFER_SIZE": 100_000,
+        "BLOB_STORE_DIR": os.path.join(workdir, "blobs"),
+        "PASSAGE_LIBRARY_PATH": os.path.join(workdir, "passages.sqlite3"),
+        "THEME_STORE_PATH": os.path.join(workdir, "themes.sqlite3"),
+        "GUIDE_CACHE_PATH": os.path.join(workdir, "study_guides.sqlite3"),
+    })
+
+    # 読み込みと共有リソースの初期化を済ませてから測る
+    try:
+        run_session(-1, args.seed, args.timeout)
+    except SessionFailed as e:
+        print(f"ウォームアップに失敗しました: {e}")
+        return 1
+    _, metrics_offset = read_script_durations(metrics_path, 0)
+
+    levels = []
+    for concurrency in args.concurrency:
+        sessions = args.sessions or concurrency * 2
+        level, metrics_offset = run_level(
+            concurrency, sessions, args.seed, args.timeout, metrics_path, metrics_offset
+        )
+        print_level(level)
+        levels.append(level)
+
+    ceiling = throughput_ceiling(levels)
+    print(f"\n処理能力の上限: {ceiling['sessions_per_second']:.2f} セッション/秒 "
+          f"(同時実行数 {ceiling['at_concurrency']})"
+          + (f", 同時実行数 {ceiling['saturated_at_concurrency']} で頭打ち" if ceiling["saturated_at_concurrency"] else ""))
+
+    results = {
+        "created_at": time.time(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "latency": args.latency,
+            "model_concurrency": args.model_concurrency,
+            "seed": args.seed,
+        },
+        "levels": levels,
+        "ceiling": ceiling,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = any(level["errors"] for level in levels)
+    if previous is not None:
+        regressions = compare(results, previous, args.threshold)
+        print(f"\n前回 ({previous.get('revision')}) との比較: しきい値 +{args.threshold:.0%}")
+        if previous.get("config") != results["config"]:
+            print(f"  (条件が異なります: 前回 {previous.get('config')})")
+        for concurrency, name, stat, old, new in regressions:
+            print(f"  同時実行数 {concurrency} {name} {stat}: {old * 1000:.1f} → {new * 1000:.1f} ms")
+        if not regressions:
+            print("  遅くなった操作はありません")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
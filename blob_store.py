@@ -0,0 +1,178 @@
+"""プロセス全体で共有する内容アドレスのブロブストア
+
+文章や学習ガイドの HTML のような大きな文字列を SHA-256 をキーに1か所で保持し、
+セッション状態にはキー(ハッシュ)だけを置く。同じ内容は1つにまとまる。
+
+- 一定以上の大きさのものは zlib で圧縮して保持する
+- メモリ上の合計がしきい値を超えたら、最近使われていないものからディスクへ書き出す
+- ディスク上の合計がしきい値を超えたら、最近使われていないものから削除する
+  (削除後の get は None を返すので、呼び出し側で作り直す)
+"""
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+# この大きさ(バイト)未満は圧縮しない
+COMPRESS_MIN_BYTES = 512
+# 書き出したファイルの先頭1バイト(圧縮の有無)
+RAW = b"r"
+COMPRESSED = b"z"
+
+
+def blob_digest(text):
+    """文字列のキー(SHA-256 の16進表記)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _encode(text):
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+    return RAW + data
+
+
+def _decode(payload):
+    data = payload[1:]
+    if payload[:1] == COMPRESSED:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+class BlobStore:
+    """メモリ上限付きの LRU と、ディスクへの書き出しを備えたブロブストア
+
+    directory が None ならディスクには書き出さず、メモリから溢れたものは削除する。
+    プロセスで1つ作って全セッションで共有する。
+    """
+
+    def __init__(self, directory=None, memory_limit=64 * 1024 * 1024, disk_limit=1024 * 1024 * 1024):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._lock = threading.Lock()
+        # キー → 符号化済みのバイト列(末尾ほど最近使われた)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # キー → ファイルの大きさ(末尾ほど最近使われた)
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self.stats = {"puts": 0, "deduplicated": 0, "hits": 0, "disk_reads": 0, "misses": 0,
+                      "spilled": 0, "evicted": 0, "raw_bytes": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """既存のファイルを更新日時の古い順に索引へ入れる"""
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _mtime, digest, size in sorted(entries):
+            self._disk[digest] = size
+            self._disk_bytes += size
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._memory or digest in self._disk
+
+    def put(self, text):
+        """文字列を保存してキーを返す(同じ内容が保存済みなら最近使ったものとして扱う)"""
+        digest = blob_digest(text)
+        with self._lock:
+            self.stats["puts"] += 1
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                self.stats["deduplicated"] += 1
+                return digest
+            if digest in self._disk:
+                self._disk.move_to_end(digest)
+                self.stats["deduplicated"] += 1
+                return digest
+            self.stats["raw_bytes"] += len(text.encode("utf-8"))
+            self._remember(digest, _encode(text))
+        return digest
+
+    def get(self, digest, default=None):
+        """キーに対応する文字列(ディスクからも削除済みなら default)"""
+        with self._lock:
+            payload = self._memory.get(digest)
+            if payload is not None:
+                self._memory.move_to_end(digest)
+                self.stats["hits"] += 1
+            elif digest in self._disk:
+                payload = self._read(digest)
+                if payload is None:
+                    self.stats["misses"] += 1
+                    return default
+                self.stats["disk_reads"] += 1
+                self._remember(digest, payload)
+            else:
+                self.stats["misses"] += 1
+                return default
+        return _decode(payload)
+
+    def _remember(self, digest, payload):
+        self._memory[digest] = payload
+        self._memory_bytes += len(payload)
+        # 今入れたもの以外を、古いものから上限に収まるまで追い出す
+        while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+            old_digest, old_payload = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_payload)
+            self._spill(old_digest, old_payload)
+
+    def _spill(self, digest, payload):
+        if not self.directory:
+            self.stats["evicted"] += 1
+            return
+        if digest not in self._disk:
+            path = self._path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書きかけのファイルを読まないよう、別名で書いてから置き換える
+            with open(path + ".tmp", "wb") as f:
+                f.write(payload)
+            os.replace(path + ".tmp", path)
+            self._disk[digest] = len(payload)
+            self._disk_bytes += len(payload)
+            self.stats["spilled"] += 1
+        self._disk.move_to_end(digest)
+        while self._disk_bytes > self.disk_limit and len(self._disk) > 1:
+            old_digest, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats["evicted"] += 1
+            try:
+                os.remove(self._path(old_digest))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, digest):
+        try:
+            with open(self._path(digest), "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            self._disk_bytes -= self._disk.pop(digest)
+            return None
+        self._disk.move_to_end(digest)
+        return payload
+
+    def usage(self):
+        """件数・バイト数の現状と累計の統計"""
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                **self.stats,
+            }
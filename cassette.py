@@ -0,0 +1,336 @@
+"""モデル応答の録画と再生(API キー無しで決定的に動かすため)
+
+録画モードでは本物のバックエンドを包み、プロンプト・モデル・設定・応答(ストリーミングなら
+断片の区切りも)を SQLite のカセットに保存する。再生モードではカセットから応答を返す。
+
+- 照合はまず完全一致、無ければ正規化したプロンプト(空白の違いと、毎回変わる
+  避けるテーマの一覧を無視)で行う。正規化で一致したものが複数あれば最初に録画したものを返す
+- プロンプトと応答は zlib で圧縮して保存する
+- 録画時にプロンプトのテンプレート名とハッシュ(prompts.template_hash)を記録し、
+  テンプレートが変わった後の古い録画は StaleRecording として知らせる
+- 再生時は録画時の所要時間(倍率を指定可能)または固定の時間だけ待ち、
+  ストリーミングは録画時の区切り(または指定の語数)で断片に分けて返す
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+from gemini_client import DEFAULT_TIMEOUT, ModelResponse
+from prompts import PROMPT_TEMPLATES, normalize_prompt, template_hash, template_of
+
+# 録画時の区切りが無い応答をストリーミングで返すときの1断片の語数
+DEFAULT_CHUNK_WORDS = 8
+
+
+class CassetteMiss(LookupError):
+    """カセットに一致する録画が無い"""
+
+
+class StaleRecording(CassetteMiss):
+    """録画したときとプロンプトのテンプレートが変わっている"""
+
+    def __init__(self, template, recorded_hash, current_hash):
+        self.template = template
+        self.recorded_hash = recorded_hash
+        self.current_hash = current_hash
+        super().__init__(
+            f"テンプレート {template} が録画時 ({recorded_hash}) から変わっています ({current_hash})。録画し直してください"
+        )
+
+
+def schema_id(schema):
+    """構造化出力スキーマの識別子(名前とフィールド定義のハッシュ)"""
+    if schema is None:
+        return ""
+    definition = json.dumps(schema.model_json_schema(), sort_keys=True)
+    return f"{schema.__name__}:{hashlib.sha256(definition.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _key(model, schema, prompt):
+    return hashlib.sha256(f"{model}\0{schema_id(schema)}\0{prompt}".encode("utf-8")).digest()
+
+
+def parse_latency(value):
+    """再生時の待ち時間の指定("recorded" / 秒数 / 空なら None)"""
+    if value in (None, ""):
+        return None
+    if value == "recorded":
+        return value
+    return float(value)
+
+
+@dataclass
+class Recording:
+    text: str
+    usage: dict
+    latency: float
+    ttft: float
+    chunks: list
+    template: str
+    template_hash: str
+    match: str
+
+
+class Cassette:
+    """録画した応答の保存先(SQLite)
+
+    1つの接続をロックで保護し、Streamlit の複数セッション(スレッド)から共有する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "exact": 0, "normalized": 0, "misses": 0, "stale": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recordings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key BLOB NOT NULL UNIQUE,
+                normalized_key BLOB NOT NULL,
+                model TEXT NOT NULL,
+                schema TEXT NOT NULL,
+                template TEXT,
+                template_hash TEXT,
+                config TEXT NOT NULL,
+                prompt BLOB NOT NULL,
+                response BLOB NOT NULL,
+                chunks TEXT,
+                usage TEXT,
+                latency REAL,
+                ttft REAL,
+                recorded_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS recordings_normalized ON recordings (normalized_key, id)"
+        )
+        self._conn.commit()
+
+    def checkpoint(self):
+        """WAL の内容を本体のファイルへ書き戻す(カセットを配布・コミットする前に)"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+
+    def record(self, model, prompt, schema, text, usage=None, latency=None, ttft=None, chunks=None, config=None):
+        """応答を1件保存する(同じリクエストの録画があれば置き換える)
+
+        chunks はストリーミングの各断片の文字数のリスト。
+        """
+        template = template_of(prompt)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO recordings (
+                    key, normalized_key, model, schema, template, template_hash, config,
+                    prompt, response, chunks, usage, latency, ttft, recorded_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    _key(model, schema, prompt), _key(model, schema, normalize_prompt(prompt)),
+                    model, schema_id(schema), template, template_hash(template) if template else None,
+                    json.dumps(config or {}), zlib.compress(prompt.encode("utf-8")),
+                    zlib.compress(text.encode("utf-8")), json.dumps(chunks) if chunks is not None else None,
+                    json.dumps(usage or {}), latency, ttft, time.time(),
+                ),
+            )
+            self._conn.commit()
+            self.stats["recorded"] += 1
+
+    def find(self, model, prompt, schema=None, allow_stale=False):
+        """一致する録画を返す(無ければ CassetteMiss、テンプレートが古ければ StaleRecording)"""
+        columns = "response, usage, latency, ttft, chunks, template, template_hash"
+        match = "exact"
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {columns} FROM recordings WHERE key = ?", (_key(model, schema, prompt),)
+            ).fetchone()
+            if row is None:
+                match = "normalized"
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM recordings WHERE normalized_key = ? ORDER BY id LIMIT 1",
+                    (_key(model, schema, normalize_prompt(prompt)),),
+                ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            self._raise_if_stale_template(template_of(prompt))
+            raise CassetteMiss(f"{model} への一致する録画がありません")
+        response, usage, latency, ttft, chunks, template, recorded_hash = row
+        if not allow_stale and template in PROMPT_TEMPLATES and recorded_hash != template_hash(template):
+            self.stats["stale"] += 1
+            raise StaleRecording(template, recorded_hash, template_hash(template))
+        self.stats[match] += 1
+        return Recording(
+            text=zlib.decompress(response).decode("utf-8"),
+            usage=json.loads(usage or "{}"),
+            latency=latency or 0.0,
+            ttft=ttft,
+            chunks=json.loads(chunks) if chunks else None,
+            template=template,
+            template_hash=recorded_hash,
+            match=match,
+        )
+
+    def _raise_if_stale_template(self, template):
+        """一致しなかった理由が、テンプレートの変更で古くなった録画なら StaleRecording にする"""
+        if template is None:
+            return
+        current = template_hash(template)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT template_hash FROM recordings WHERE template = ? AND template_hash != ? LIMIT 1",
+                (template, current),
+            ).fetchone()
+            fresh = self._conn.execute(
+                "SELECT 1 FROM recordings WHERE template = ? AND template_hash = ? LIMIT 1", (template, current)
+            ).fetchone()
+        if row is not None and fresh is None:
+            self.stats["stale"] += 1
+            raise StaleRecording(template, row[0], current)
+
+    def stale_templates(self):
+        """テンプレートが変わって古くなった録画の件数(テンプレート名 → 件数)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT template, template_hash, COUNT(*) FROM recordings WHERE template IS NOT NULL "
+                "GROUP BY template, template_hash"
+            ).fetchall()
+        stale = {}
+        for template, recorded_hash, count in rows:
+            if template in PROMPT_TEMPLATES and recorded_hash != template_hash(template):
+                stale[template] = stale.get(template, 0) + count
+        return stale
+
+
+class RecordingBackend:
+    """本物のバックエンドを包み、成功した応答をカセットに録画する
+
+    ストリーミングは最後の断片まで受け取ったものだけを録画する。
+    """
+
+    def __init__(self, backend, cassette):
+        self.backend = backend
+        self.cassette = cassette
+        self.name = f"record:{backend.name}"
+
+    def warm_up(self):
+        return self.backend.warm_up()
+
+    def generate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        start = time.perf_counter()
+        response = self.backend.generate(model, prompt, schema=schema, timeout=timeout)
+        self.cassette.record(
+            model, prompt, schema, response.text, response.usage, time.perf_counter() - start,
+            config={"timeout": timeout, "stream": False},
+        )
+        return response
+
+    def stream(self, model, prompt, timeout=DEFAULT_TIMEOUT, usage=None):
+        usage = {} if usage is None else usage
+        start = time.perf_counter()
+        ttft = None
+        chunks = []
+        for chunk in self.backend.stream(model, prompt, timeout=timeout, usage=usage):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk)
+            yield chunk
+        self.cassette.record(
+            model, prompt, None, "".join(chunks), usage, time.perf_counter() - start, ttft=ttft,
+            chunks=[len(chunk) for chunk in chunks], config={"timeout": timeout, "stream": True},
+        )
+
+    async def agenerate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        start = time.perf_counter()
+        response = await self.backend.agenerate(model, prompt, schema=schema, timeout=timeout)
+        self.cassette.record(
+            model, prompt, schema, response.text, response.usage, time.perf_counter() - start,
+            config={"timeout": timeout, "stream": False},
+        )
+        return response
+
+
+class ReplayBackend:
+    """カセットに録画した応答を返すバックエンド(ネットワーク・API キー不要)
+
+    latency が None なら待たずに返し、"recorded" なら録画時の所要時間 × latency_scale、
+    数値ならその秒数だけ待つ。ストリーミングは chunk_words 語ずつ、指定が無ければ
+    録画時の区切りで返す。
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette, latency=None, latency_scale=1.0, chunk_words=None, allow_stale=False):
+        self.cassette = cassette
+        self.latency = parse_latency(latency)
+        self.latency_scale = latency_scale
+        self.chunk_words = chunk_words
+        self.allow_stale = allow_stale
+
+    def warm_up(self):
+        pass
+
+    def _delay(self, recording):
+        if self.latency is None:
+            return 0.0
+        if self.latency == "recorded":
+            return recording.latency * self.latency_scale
+        return self.latency
+
+    def _to_response(self, model, schema, recording):
+        parsed = schema.model_validate_json(recording.text) if schema is not None else None
+        return ModelResponse(text=recording.text, parsed=parsed, model=model, usage=dict(recording.usage))
+
+    def _chunks(self, recording):
+        text = recording.text
+        if self.chunk_words is None and recording.chunks:
+            chunks = []
+            position = 0
+            for length in recording.chunks:
+                chunks.append(text[position:position + length])
+                position += length
+            return chunks
+        words = text.split(" ")
+        size = self.chunk_words or DEFAULT_CHUNK_WORDS
+        return [
+            " ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+            for i in range(0, len(words), size)
+        ]
+
+    def generate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        recording = self.cassette.find(model, prompt, schema, allow_stale=self.allow_stale)
+        time.sleep(self._delay(recording))
+        return self._to_response(model, schema, recording)
+
+    def stream(self, model, prompt, timeout=DEFAULT_TIMEOUT, usage=None):
+        recording = self.cassette.find(model, prompt, None, allow_stale=self.allow_stale)
+        if usage is not None:
+            usage.update(recording.usage)
+        chunks = self._chunks(recording)
+        delay = self._delay(recording)
+        # 最初の断片は録画時の最初のトークンまでの時間で、残りは均等に間を空けて返す
+        first = delay / max(1, len(chunks))
+        if self.latency == "recorded" and recording.ttft is not None:
+            first = min(delay, recording.ttft * self.latency_scale)
+        for index, chunk in enumerate(chunks):
+            time.sleep(first if index == 0 else (delay - first) / max(1, len(chunks) - 1))
+            yield chunk
+
+    async def agenerate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        recording = self.cassette.find(model, prompt, schema, allow_stale=self.allow_stale)
+        await asyncio.sleep(self._delay(recording))
+        return self._to_response(model, schema, recording)
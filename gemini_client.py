@@ -0,0 +1,408 @@
+"""Gemini API 呼び出しの共通レイヤー
+
+すべてのモデル呼び出しはここを通す。
+
+- モデルごとのタイムアウト
+- 429 / 5xx / タイムアウト時の指数バックオフ(ジッター付き)によるリトライ
+- プロセス全体で共有する同時実行数の上限
+- 同期 (generate / stream) と非同期 (agenerate) の入口
+- 呼び出しごとの計測値(所要時間・トークン数・リトライ回数など)を observer に通知
+- ネットワーク無しで動かせるローカルのフェイクバックエンドと、録画した応答の再生(cassette.py)
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import typing
+from dataclasses import dataclass, field
+
+# モデルごとのタイムアウト(秒)
+DEFAULT_TIMEOUTS = {
+    "gemini-2.0-flash-lite": 60,
+    "gemini-2.0-flash": 120,
+}
+DEFAULT_TIMEOUT = 60
+
+# リトライ対象の HTTP ステータス
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass
+class ModelResponse:
+    """バックエンドに依存しない応答"""
+    text: str
+    parsed: object = None
+    model: str = ""
+    usage: dict = field(default_factory=dict)
+
+
+def is_retryable(exc):
+    """リトライすべき例外かどうか(レート制限・サーバーエラー・タイムアウト・接続断)"""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return "Timeout" in type(exc).__name__ or "Connect" in type(exc).__name__
+
+
+class GenaiBackend:
+    """google-genai SDK を使う本番用バックエンド
+
+    SDK の読み込み(数百ミリ秒かかる)とクライアントの作成は、最初の呼び出しか
+    warm_up() まで遅らせる。
+    """
+
+    name = "genai"
+
+    def __init__(self, api_key):
+        self._api_key = api_key
+        self._lock = threading.Lock()
+        self._client = None
+        self._types = None
+
+    def warm_up(self):
+        """SDK を読み込んでクライアントを作る(作成済みなら何もしない)"""
+        with self._lock:
+            if self._client is None:
+                # フェイクバックエンドだけで動かす場合に SDK を必須にしないよう、ここで読み込む
+                from google import genai
+                from google.genai import types
+                self._types = types
+                self._client = genai.Client(api_key=self._api_key)
+        return self._client
+
+    def _config(self, schema, timeout):
+        config = {"http_options": self._types.HttpOptions(timeout=int(timeout * 1000))}
+        if schema is not None:
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = schema
+        return self._types.GenerateContentConfig(**config)
+
+    @staticmethod
+    def _usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return {}
+        return {
+            "input_tokens": usage.prompt_token_count or 0,
+            "output_tokens": usage.candidates_token_count or 0,
+        }
+
+    def _to_response(self, model, response):
+        return ModelResponse(
+            text=response.text or "",
+            parsed=getattr(response, "parsed", None),
+            model=model,
+            usage=self._usage(response),
+        )
+
+    def generate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        response = self.warm_up().models.generate_content(
+            model=model, contents=prompt, config=self._config(schema, timeout)
+        )
+        return self._to_response(model, response)
+
+    def stream(self, model, prompt, timeout=DEFAULT_TIMEOUT, usage=None):
+        for chunk in self.warm_up().models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(None, timeout)
+        ):
+            # トークン数は最後の断片に載ってくる
+            if usage is not None and getattr(chunk, "usage_metadata", None) is not None:
+                usage.update(self._usage(chunk))
+            if chunk.text:
+                yield chunk.text
+
+    async def agenerate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        # 初回はイベントループを止めないよう別スレッドで SDK を読み込む
+        client = self._client or await asyncio.to_thread(self.warm_up)
+        response = await client.aio.models.generate_content(
+            model=model, contents=prompt, config=self._config(schema, timeout)
+        )
+        return self._to_response(model, response)
+
+
+FAKE_SENTENCES = (
+    "Many people enjoy walking in the park on sunny mornings.",
+    "The small town has a quiet library next to the old station.",
+    "My friend likes to cook simple meals with fresh vegetables.",
+    "Every summer, the children visit their grandparents by the sea.",
+    "Learning a new language takes time, but it is very rewarding.",
+    "The museum opened a new room about the history of music.",
+    "She usually reads a short story before she goes to bed.",
+    "Our teacher asked us to write about our favorite season.",
+    "The weather changed quickly, so we stayed inside and played games.",
+    "He started running every evening to feel healthier and stronger.",
+    "Local farmers sell fruit and bread at the market on Saturdays.",
+    "The students worked together to plant trees around the school.",
+)
+FAKE_THEMES = ("公園での散歩", "町の図書館", "家庭料理", "夏休みの家族旅行", "語学学習", "音楽の歴史", "読書の習慣", "季節の作文")
+
+
+def fake_passage(word_count, seed):
+    """指定語数程度の決定的な英文を作る"""
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < word_count:
+        sentence = rng.choice(FAKE_SENTENCES)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def fake_responder(model, prompt, schema=None):
+    """プロンプトの種類に応じた決定的なダミー応答(テキスト)を返す"""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    match = re.search(r"approximately (\d+) words", prompt)
+    word_count = int(match.group(1)) if match else 100
+    theme = FAKE_THEMES[seed % len(FAKE_THEMES)]
+
+    if schema is not None:
+        payload = {}
+        for name, info in schema.model_fields.items():
+            choices = typing.get_args(info.annotation)
+            if typing.get_origin(info.annotation) is typing.Literal:
+                payload[name] = choices[-1]
+            elif typing.get_origin(info.annotation) is list:
+                match = re.search(r"exactly (\d+) (?:paragraphs|items)", prompt)
+                count = int(match.group(1)) if match else 3
+                payload[name] = [f"{name} {i + 1} のダミー" for i in range(count)]
+            elif name == "passage":
+                payload[name] = fake_passage(word_count, seed)
+            elif name == "theme":
+                payload[name] = theme
+            else:
+                payload[name] = f"{name} のダミー"
+        return json.dumps(payload, ensure_ascii=False)
+    if "テーマ:" in prompt and "性別:" in prompt:
+        return f"テーマ: {theme}\n性別: neutral"
+    if "HTML" in prompt:
+        return f"<div style=\"font-family: sans-serif;\"><h2>📚 学習ガイド(ダミー)</h2><p>{theme}についての文章です。</p></div>"
+    return fake_passage(word_count, seed)
+
+
+class FakeBackend:
+    """ネットワークを使わないローカルのフェイクバックエンド(開発・テスト・負荷試験用)
+
+    latency 秒待ってから responder(model, prompt, schema) の結果を返す。
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, responder=fake_responder, stream_chunk_words=8):
+        self.latency = latency
+        self.responder = responder
+        self.stream_chunk_words = stream_chunk_words
+
+    def warm_up(self):
+        pass
+
+    def _to_response(self, model, prompt, schema, text):
+        parsed = schema.model_validate_json(text) if schema is not None else None
+        return ModelResponse(
+            text=text,
+            parsed=parsed,
+            model=model,
+            usage={"input_tokens": len(prompt.split()), "output_tokens": len(text.split())},
+        )
+
+    def generate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        time.sleep(self.latency)
+        return self._to_response(model, prompt, schema, self.responder(model, prompt, schema))
+
+    def stream(self, model, prompt, timeout=DEFAULT_TIMEOUT, usage=None):
+        words = self.responder(model, prompt, None).split(" ")
+        if usage is not None:
+            usage.update(input_tokens=len(prompt.split()), output_tokens=len(words))
+        chunks = [
+            " ".join(words[i:i + self.stream_chunk_words]) + " "
+            for i in range(0, len(words), self.stream_chunk_words)
+        ]
+        for chunk in chunks:
+            time.sleep(self.latency / max(1, len(chunks)))
+            yield chunk
+
+    async def agenerate(self, model, prompt, schema=None, timeout=DEFAULT_TIMEOUT):
+        await asyncio.sleep(self.latency)
+        return self._to_response(model, prompt, schema, self.responder(model, prompt, schema))
+
+
+class GeminiClient:
+    """バックエンドを包み、タイムアウト・リトライ・同時実行数の上限を適用する
+
+    同時実行数のセマフォはインスタンス単位なので、プロセスで1つだけ作って共有すること。
+    observer を渡すと、呼び出しが終わるたびに計測値の dict(operation, model, duration,
+    ttft, input_tokens, output_tokens, retries, outcome)を渡して呼ぶ。
+    """
+
+    def __init__(self, backend, timeouts=None, max_retries=3, base_delay=0.5, max_delay=8.0,
+                 max_concurrency=8, observer=None):
+        self.backend = backend
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.observer = observer
+
+    def warm_up(self):
+        """バックエンドの準備(SDK の読み込みなど)をバックグラウンドスレッドで始める
+
+        失敗しても何もしない(最初の呼び出しで改めて準備し、そこで例外になる)。
+        """
+        def run():
+            try:
+                self.backend.warm_up()
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=run, name="gemini-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def timeout_for(self, model):
+        return self.timeouts.get(model, DEFAULT_TIMEOUT)
+
+    def _backoff(self, attempt):
+        """フルジッター付きの指数バックオフ(秒)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _observe(self, operation, model, start, retries, outcome, usage=None, ttft=None):
+        if self.observer is None:
+            return
+        usage = usage or {}
+        try:
+            self.observer({
+                "operation": operation or model,
+                "model": model,
+                "duration": time.perf_counter() - start,
+                "ttft": ttft,
+                "input_tokens": usage.get("input_tokens"),
+                "output_tokens": usage.get("output_tokens"),
+                "retries": retries,
+                "outcome": outcome,
+            })
+        except Exception:
+            # 計測の失敗で呼び出し自体を失敗させない
+            pass
+
+    def generate(self, model, prompt, schema=None, operation=None):
+        """1回分の応答を返す。リトライしても失敗した場合は最後の例外を送出する"""
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                with self._semaphore:
+                    response = self.backend.generate(model, prompt, schema=schema, timeout=self.timeout_for(model))
+                self._observe(operation, model, start, attempt, "ok", response.usage)
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._observe(operation, model, start, attempt, type(e).__name__)
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def stream(self, model, prompt, operation=None):
+        """テキストの断片を順に返すジェネレーター
+
+        最初の断片を受け取る前の失敗だけをリトライする(途中まで返した後は送出する)。
+        """
+        attempt = 0
+        start = time.perf_counter()
+        usage = {}
+        ttft = None
+        # 呼び出し側が途中で close した場合はこのまま記録される
+        outcome = "cancelled"
+        try:
+            while True:
+                started = False
+                try:
+                    with self._semaphore:
+                        for chunk in self.backend.stream(model, prompt, timeout=self.timeout_for(model), usage=usage):
+                            if not started:
+                                started = True
+                                ttft = time.perf_counter() - start
+                            yield chunk
+                    outcome = "ok"
+                    return
+                except Exception as e:
+                    if started or attempt >= self.max_retries or not is_retryable(e):
+                        outcome = type(e).__name__
+                        raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+        finally:
+            self._observe(operation, model, start, attempt, outcome, usage, ttft)
+
+    async def _acquire_async(self):
+        """同時実行数のセマフォを別スレッドで取得する
+
+        取得を待つ間にタスクが取り消されても、スレッドはあとで取得してしまう。
+        そのときは取得した側で返し、枠が失われないようにする。
+        """
+        lock = threading.Lock()
+        state = {"acquired": False, "cancelled": False}
+
+        def acquire():
+            self._semaphore.acquire()
+            with lock:
+                if state["cancelled"]:
+                    self._semaphore.release()
+                else:
+                    state["acquired"] = True
+
+        try:
+            await asyncio.to_thread(acquire)
+        except asyncio.CancelledError:
+            with lock:
+                state["cancelled"] = True
+                if state["acquired"]:
+                    self._semaphore.release()
+            raise
+
+    async def agenerate(self, model, prompt, schema=None, operation=None):
+        """generate の非同期版(同時実行数の上限は同期呼び出しと共有)"""
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            await self._acquire_async()
+            try:
+                response = await self.backend.agenerate(model, prompt, schema=schema, timeout=self.timeout_for(model))
+                self._observe(operation, model, start, attempt, "ok", response.usage)
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._observe(operation, model, start, attempt, type(e).__name__)
+                    raise
+            finally:
+                self._semaphore.release()
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+
+def create_client(
+    backend="genai", api_key=None, fake_latency=0.0, cassette_path=".cache/cassette.sqlite3",
+    replay_latency=None, **options,
+):
+    """バックエンド名から GeminiClient を作る("genai" / "fake" / "record" / "replay")
+
+    "record" は本物の API の応答を cassette_path のカセットに録画し、"replay" は録画した応答を返す
+    (API キー不要。replay_latency は待ち時間の秒数か "recorded")。
+    """
+    if backend == "fake":
+        return GeminiClient(FakeBackend(latency=fake_latency), **options)
+    if backend == "genai":
+        return GeminiClient(GenaiBackend(api_key), **options)
+    if backend in ("record", "replay"):
+        from cassette import Cassette, RecordingBackend, ReplayBackend
+
+        cassette = Cassette(cassette_path)
+        if backend == "record":
+            return GeminiClient(RecordingBackend(GenaiBackend(api_key), cassette), **options)
+        return GeminiClient(ReplayBackend(cassette, latency=replay_latency), **options)
+    raise ValueError(f"未知のバックエンドです: {backend}")
@@ -0,0 +1,92 @@
+"""リスニング練習用の単語隠しエンジン
+
+文章を一度だけトークン化して語の位置 (span) を保持し、隠し方ごとの結果は
+span を書き換えるだけで作る(再実行のたびに正規表現をかけ直さない)。
+"""
+import random
+import re
+
+# 従来の hide_word_endings と同じ語の定義
+WORD_PATTERN = re.compile(r"\b[a-zA-Z]+(?:'[a-zA-Z]+)?\b")
+
+# 語頭から残す文字数
+KEEP_CHARS = 2
+
+HIDE_MODES = {
+    "endings": "すべての語の語尾を隠す",
+    "above_level": "指定レベルより上の語を隠す",
+    "every_nth": "N語ごとに内容語を隠す",
+    "random": "ランダムに隠す(シード固定)",
+}
+
+# 内容語とみなさない機能語
+FUNCTION_WORDS = frozenset("""
+a an the and or but nor so yet for of in on at to by with from into onto upon about above below
+over under after before since until than then as if because while though although when where
+which who whom whose what that this these those there here it its it's he him his she her hers
+they them their theirs we us our ours you your yours i me my mine is am are was were be been
+being have has had do does did will would shall should can could may might must not no
+very too also just only all any some each every both either neither much many more most
+other such own same up down out off again once
+""".split())
+
+
+class WordHider:
+    """1つの文章について語の位置と隠し方ごとの結果を保持する"""
+
+    def __init__(self, text):
+        self.text = text
+        self.spans = [(match.start(), match.end()) for match in WORD_PATTERN.finditer(text)]
+        self._ranks = None
+        self._masked = {}
+
+    def ranks(self, vocabulary_index):
+        """各語の CEFR レベル順位(初回のみ語彙インデックスで解析)"""
+        if self._ranks is None:
+            spans = [(start, end, self.text[start:end]) for start, end in self.spans]
+            self._ranks = [token.rank for token in vocabulary_index.analyze(self.text, spans)]
+        return self._ranks
+
+    def _content_indexes(self):
+        return [
+            i for i, (start, end) in enumerate(self.spans)
+            if end - start > KEEP_CHARS and self.text[start:end].lower() not in FUNCTION_WORDS
+        ]
+
+    def select(self, mode, vocabulary_index=None, level_rank=None, n=3, ratio=0.3, seed=0):
+        """隠す語の番号を昇順で返す"""
+        if mode == "endings":
+            return [i for i, (start, end) in enumerate(self.spans) if end - start > KEEP_CHARS]
+        if mode == "above_level":
+            ranks = self.ranks(vocabulary_index)
+            return [
+                i for i, (start, end) in enumerate(self.spans)
+                if end - start > KEEP_CHARS and ranks[i] is not None and ranks[i] > level_rank
+            ]
+        if mode == "every_nth":
+            return self._content_indexes()[n - 1::n]
+        if mode == "random":
+            candidates = self._content_indexes()
+            count = round(len(candidates) * ratio)
+            return sorted(random.Random(seed).sample(candidates, count))
+        raise ValueError(f"未知の隠しモードです: {mode}")
+
+    def mask(self, mode="endings", vocabulary_index=None, **params):
+        """隠した文章を返す(モードとパラメータごとに結果を保持)"""
+        key = (mode, tuple(sorted(params.items())))
+        if key not in self._masked:
+            indexes = self.select(mode, vocabulary_index=vocabulary_index, **params)
+            self._masked[key] = mask_spans(self.text, [self.spans[i] for i in indexes])
+        return self._masked[key]
+
+
+def mask_spans(text, spans, keep=KEEP_CHARS):
+    """昇順の span ごとに語頭 keep 文字を残してダッシュに置き換える(O(n))"""
+    pieces = []
+    position = 0
+    for start, end in spans:
+        pieces.append(text[position:start + keep])
+        pieces.append("-" * (end - start - keep))
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
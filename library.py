@@ -0,0 +1,197 @@
+"""生成した文章のライブラリ(SQLite + FTS5 全文検索)
+
+生成した文章をレベル・語数・テーマ・話者の性別・語彙統計とともに保存し、
+レベルと長さが合う文章をディスクから即座に出題したり、キーワードで検索したりする。
+API が使えないときの代替の出題元にもなる。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 検索語がこの文字数未満なら FTS ではなく LIKE で探す(trigram は3文字以上が必要)
+MIN_FTS_QUERY_CHARS = 3
+COLUMNS = (
+    "id", "created_at", "cefr_level", "word_count", "actual_words", "theme", "speaker_gender",
+    "coverage", "level_shares", "served_count", "passage",
+)
+
+
+class PassageLibrary:
+    """文章を保存し、レベル・語数での出題とキーワード検索を行う
+
+    本文とテーマを FTS5 で索引する。日本語のテーマも部分一致で探せるよう
+    trigram トークナイザーを使い、使えない古い SQLite では unicode61 にする。
+    1つの接続をロックで保護し、Streamlit の複数セッション(スレッド)から共有する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                digest TEXT NOT NULL UNIQUE,
+                created_at REAL NOT NULL,
+                cefr_level TEXT NOT NULL,
+                word_count INTEGER NOT NULL,
+                actual_words INTEGER NOT NULL,
+                theme TEXT NOT NULL,
+                speaker_gender TEXT NOT NULL,
+                coverage REAL,
+                level_shares TEXT,
+                served_count INTEGER NOT NULL DEFAULT 0,
+                passage TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS passages_level_words ON passages (cefr_level, actual_words)"
+        )
+        self._create_fts()
+        self._conn.commit()
+
+    def _create_fts(self):
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'passages_fts'"
+        ).fetchone()
+        if not exists:
+            for tokenizer in ("trigram", "unicode61"):
+                try:
+                    self._conn.execute(
+                        "CREATE VIRTUAL TABLE passages_fts USING fts5("
+                        "passage, theme, content='passages', content_rowid='id', "
+                        f"tokenize='{tokenizer}')"
+                    )
+                    break
+                except sqlite3.OperationalError:
+                    continue
+        self._conn.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS passages_ai AFTER INSERT ON passages BEGIN
+                INSERT INTO passages_fts (rowid, passage, theme) VALUES (new.id, new.passage, new.theme);
+            END;
+            CREATE TRIGGER IF NOT EXISTS passages_ad AFTER DELETE ON passages BEGIN
+                INSERT INTO passages_fts (passages_fts, rowid, passage, theme)
+                VALUES ('delete', old.id, old.passage, old.theme);
+            END;
+            """
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+
+    def add(self, passage, cefr_level, word_count, theme, speaker_gender, lexical_profile=None):
+        """文章を保存して ID を返す(同じ本文が保存済みならその ID)"""
+        digest = hashlib.sha256(passage.encode("utf-8")).hexdigest()
+        lexical_profile = lexical_profile or {}
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR IGNORE INTO passages (
+                    digest, created_at, cefr_level, word_count, actual_words, theme,
+                    speaker_gender, coverage, level_shares, passage
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    digest, time.time(), cefr_level, word_count, len(passage.split()), theme,
+                    speaker_gender, lexical_profile.get("coverage"),
+                    json.dumps(lexical_profile.get("level_shares", {})), passage,
+                ),
+            )
+            self._conn.commit()
+            return self._conn.execute("SELECT id FROM passages WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def get(self, passage_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM passages WHERE id = ?", (passage_id,)
+            ).fetchone()
+        return _to_dict(row)
+
+    def find(self, cefr_level, word_count, exclude_ids=(), tolerance=0.2):
+        """レベルが一致し語数が許容範囲内の文章を1件選んで返す(無ければ None)
+
+        出題回数の少ないものを優先し、同じ回数の中ではランダムに選ぶ。
+        選んだ文章の出題回数を1増やす。
+        """
+        exclude_ids = list(exclude_ids)
+        placeholders = ",".join("?" * len(exclude_ids))
+        exclusion = f"AND id NOT IN ({placeholders})" if exclude_ids else ""
+        with self._lock:
+            row = self._conn.execute(
+                f"""
+                SELECT {', '.join(COLUMNS)} FROM passages
+                WHERE cefr_level = ? AND actual_words BETWEEN ? AND ? {exclusion}
+                ORDER BY served_count, RANDOM()
+                LIMIT 1
+                """,
+                (cefr_level, word_count * (1 - tolerance), word_count * (1 + tolerance), *exclude_ids),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE passages SET served_count = served_count + 1 WHERE id = ?", (row["id"],))
+                self._conn.commit()
+        return _to_dict(row)
+
+    def search(self, query, cefr_level=None, limit=10):
+        """本文・テーマのキーワード検索。一致箇所の抜粋 (snippet) 付きで新しい順に返す
+
+        ID は追加順なので、ID の降順に走査して limit 件で打ち切る(一致件数が多くても全件を並べ替えない)。
+        """
+        query = query.strip()
+        if not query:
+            return []
+        level_filter = "AND p.cefr_level = ?" if cefr_level else ""
+        level_args = (cefr_level,) if cefr_level else ()
+        columns = ", ".join(f"p.{column}" for column in COLUMNS)
+        with self._lock:
+            if len(query) >= MIN_FTS_QUERY_CHARS:
+                # 記号を演算子として解釈させないよう、全体を1つのフレーズとして渡す
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = self._conn.execute(
+                    f"""
+                    SELECT {columns}, snippet(passages_fts, 0, '**', '**', '…', 12) AS snippet
+                    FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid
+                    WHERE passages_fts MATCH ? {level_filter}
+                    ORDER BY passages_fts.rowid DESC
+                    LIMIT ?
+                    """,
+                    (phrase, *level_args, limit),
+                ).fetchall()
+            else:
+                pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                rows = self._conn.execute(
+                    f"""
+                    SELECT {columns}, substr(p.passage, 1, 80) || '…' AS snippet
+                    FROM passages p
+                    WHERE (p.passage LIKE ? ESCAPE '\\' OR p.theme LIKE ? ESCAPE '\\') {level_filter}
+                    ORDER BY p.id DESC
+                    LIMIT ?
+                    """,
+                    (pattern, pattern, *level_args, limit),
+                ).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def level_counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cefr_level, COUNT(*) FROM passages GROUP BY cefr_level ORDER BY cefr_level"
+            ).fetchall()
+        return {level: count for level, count in rows}
+
+
+def _to_dict(row):
+    if row is None:
+        return None
+    entry = dict(row)
+    entry["level_shares"] = json.loads(entry["level_shares"] or "{}")
+    return entry
@@ -0,0 +1,100 @@
+"""長文モード: 段落構成を先に作り、段落を並行して生成してからつなぎ合わせる
+
+1回の呼び出しで長い文章を書かせると、時間がかかるうえ語数もずれやすい。
+構成(段落ごとの要約)を共有した段落単位の依頼に分けて並行に投げ、
+ローカルで語数を数えて許容範囲を外れた段落だけを1回だけ書き直させる。
+Streamlit に依存しないこと(一括生成やベンチマークからも使う)。
+"""
+import re
+import time
+
+from prompts import PassageOutline, build_outline_prompt, build_paragraph_prompt, validate_outline
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:['’\-][A-Za-z0-9]+)*")
+# 1段落あたりの目安の語数
+PARAGRAPH_WORDS = 200
+# 目標語数からのずれの許容割合
+TOLERANCE = 0.2
+
+
+def count_words(text):
+    return len(WORD_PATTERN.findall(text))
+
+
+def paragraph_targets(word_count, paragraph_words=PARAGRAPH_WORDS, paragraph_count=None):
+    """合計が word_count になるよう、段落ごとの目標語数をほぼ均等に割り振る(2段落以上)"""
+    if paragraph_count is None:
+        paragraph_count = max(2, round(word_count / paragraph_words))
+    base, extra = divmod(word_count, paragraph_count)
+    return [base + (1 if i < extra else 0) for i in range(paragraph_count)]
+
+
+def within_tolerance(text, target, tolerance=TOLERANCE):
+    return abs(count_words(text) - target) <= target * tolerance
+
+
+def generate_long_passage(submit, cefr_level, word_count, recent_themes, paragraph_words=PARAGRAPH_WORDS,
+                          tolerance=TOLERANCE, on_progress=None, poll_interval=0.2):
+    """構成 → 段落の並行生成 → 語数チェックと書き直し → 連結 の順で長文を作る
+
+    submit(prompt, schema, operation) は、結果が ModelResponse になる Future 風の
+    オブジェクト(done()・result()・cancel() を持つ)を返すこと。
+    on_progress(paragraphs) には、段落が届くたびに段落のリスト(未着は None)を渡す。
+    構成の応答が不正な場合は ValueError を送出する。途中で失敗・中断したときは、
+    まだ届いていない段落の依頼を cancel() してから例外をそのまま送出する。
+    """
+    targets = paragraph_targets(word_count, paragraph_words)
+    prompt = build_outline_prompt(cefr_level, word_count, recent_themes, len(targets))
+    outline = validate_outline(submit(prompt, PassageOutline, "long_outline").result(), len(targets))
+    if outline is None:
+        raise ValueError("段落構成の生成に失敗しました")
+    targets = paragraph_targets(word_count, paragraph_count=len(outline.paragraphs))
+
+    def request(index, previous=None):
+        previous_count = count_words(previous) if previous is not None else None
+        prompt = build_paragraph_prompt(cefr_level, outline, index, targets[index], previous_count)
+        return submit(prompt, None, "long_paragraph" if previous is None else "long_paragraph_retry")
+
+    paragraphs = [None] * len(targets)
+    first_attempts = {}
+    pending = {}
+    try:
+        for index in range(len(targets)):
+            pending[index] = request(index)
+        while pending:
+            for index, future in list(pending.items()):
+                if not future.done():
+                    continue
+                del pending[index]
+                text = future.result().text.strip()
+                if index not in first_attempts and not within_tolerance(text, targets[index], tolerance):
+                    # 許容範囲外の段落だけ1回書き直させる
+                    first_attempts[index] = text
+                    pending[index] = request(index, previous=text)
+                    continue
+                if index in first_attempts:
+                    # 書き直しても外れた場合は目標に近い方を使う
+                    text = min(
+                        first_attempts[index], text, key=lambda candidate: abs(count_words(candidate) - targets[index])
+                    )
+                paragraphs[index] = text
+                if on_progress is not None:
+                    on_progress(list(paragraphs))
+            if pending:
+                time.sleep(poll_interval)
+    finally:
+        # 段落の失敗や、待っている間の中断(Streamlit の再実行・停止を含む)で抜けたら、
+        # 残りの依頼は誰も受け取らないので取り消す
+        for future in pending.values():
+            future.cancel()
+
+    passage = "\n\n".join(paragraphs)
+    return {
+        "passage": passage,
+        "theme": outline.theme,
+        "speaker_gender": outline.speaker_gender,
+        "title": outline.title,
+        "targets": targets,
+        "paragraph_words": [count_words(paragraph) for paragraph in paragraphs],
+        "rewritten_paragraphs": len(first_attempts),
+    }
@@ -0,0 +1,193 @@
+"""モデル呼び出しと描画処理の計測
+
+1件ごとの記録(所要時間・最初のトークンまでの時間・入出力トークン数・モデル名・
+リトライ回数・結果)をメモリのリングバッファに保持し、JSONL ファイルへ追記する
+(一定サイズでローテーション)。操作ごとのパーセンタイル集計、CSV 出力、
+Prometheus のテキスト形式での出力を提供する。
+"""
+import csv
+import functools
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+FIELDS = ["ts", "operation", "duration", "ttft", "model", "input_tokens", "output_tokens", "retries", "outcome"]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class MetricsRecorder:
+    """計測値のリングバッファと、ローテーションする JSONL ファイル
+
+    path が None ならファイルには書かない。プロセスで1つ作って全セッションで共有する。
+    """
+
+    def __init__(self, path=None, capacity=5000, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        # Prometheus 用の累積カウンター(リングバッファから溢れても減らない)
+        self._totals = {}
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, operation, duration, outcome="ok", **fields):
+        """1件記録する(fields は FIELDS のうち任意のもの)"""
+        entry = dict.fromkeys(FIELDS)
+        entry.update(fields, ts=time.time(), operation=operation, duration=duration, outcome=outcome)
+        with self._lock:
+            self._records.append(entry)
+            self._count(entry)
+            if self.path:
+                self._write(entry)
+        return entry
+
+    @contextmanager
+    def timer(self, operation, **fields):
+        """with ブロックの所要時間を記録する(例外が出たら outcome に例外名を入れる)"""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            self.record(operation, time.perf_counter() - start, outcome=outcome, **fields)
+
+    def timed(self, operation):
+        """関数の所要時間を記録するデコレーター"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(operation):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe_call(self, call):
+        """GeminiClient の observer として使う(1回のモデル呼び出しの記録を受け取る)"""
+        call = dict(call)
+        self.record(call.pop("operation"), call.pop("duration"), **call)
+
+    def increment(self, name, value=1, **labels):
+        """累積カウンターを増やす(name は _total で終えること。Prometheus 出力に含まれる)"""
+        with self._lock:
+            key = (name, tuple(sorted(labels.items())))
+            self._totals[key] = self._totals.get(key, 0) + value
+
+    def total(self, name, **labels):
+        """累積カウンターのうち labels に一致するものの合計"""
+        with self._lock:
+            return sum(
+                value for (counter, pairs), value in self._totals.items()
+                if counter == name and set(labels.items()) <= set(pairs)
+            )
+
+    def _count(self, entry):
+        def add(name, labels, value):
+            key = (name, labels)
+            self._totals[key] = self._totals.get(key, 0) + value
+
+        operation = (("operation", entry["operation"]),)
+        add("operations_total", operation + (("outcome", entry["outcome"]),), 1)
+        add("operation_seconds_total", operation, entry["duration"])
+        if entry["model"]:
+            model = (("model", entry["model"]),)
+            add("model_retries_total", model, entry["retries"] or 0)
+            add("model_tokens_total", model + (("direction", "input"),), entry["input_tokens"] or 0)
+            add("model_tokens_total", model + (("direction", "output"),), entry["output_tokens"] or 0)
+
+    def _write(self, entry):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _rotate(self):
+        """metrics.jsonl → metrics.jsonl.1 → ... → metrics.jsonl.{backups}(最古は削除)"""
+        for i in range(self.backups, 0, -1):
+            source = f"{self.path}.{i - 1}" if i > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i}")
+
+    def records(self, operation=None):
+        with self._lock:
+            return [entry for entry in self._records if operation is None or entry["operation"] == operation]
+
+    def summary(self):
+        """操作ごとの件数・エラー数・所要時間のパーセンタイル(秒)などをまとめる"""
+        groups = {}
+        for entry in self.records():
+            groups.setdefault(entry["operation"], []).append(entry)
+        rows = []
+        for operation, entries in sorted(groups.items()):
+            durations = np.array([entry["duration"] for entry in entries])
+            ttfts = [entry["ttft"] for entry in entries if entry["ttft"] is not None]
+            p50, p95, p99 = np.quantile(durations, QUANTILES)
+            rows.append({
+                "operation": operation,
+                "count": len(entries),
+                "errors": sum(entry["outcome"] != "ok" for entry in entries),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "ttft_p50": float(np.median(ttfts)) if ttfts else None,
+                "retries": sum(entry["retries"] or 0 for entry in entries),
+                "input_tokens": sum(entry["input_tokens"] or 0 for entry in entries),
+                "output_tokens": sum(entry["output_tokens"] or 0 for entry in entries),
+            })
+        return rows
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(self.records())
+        return buffer.getvalue()
+
+    def to_jsonl(self):
+        return "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.records())
+
+    def prometheus_text(self, prefix="quiz_app"):
+        """Prometheus のテキスト形式(分位数はリングバッファ内の値、カウンターは累積値)"""
+
+        def labels(pairs):
+            return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+        lines = [
+            f"# HELP {prefix}_operation_duration_seconds 操作ごとの所要時間(直近の記録から計算した分位数)",
+            f"# TYPE {prefix}_operation_duration_seconds summary",
+        ]
+        for row in self.summary():
+            operation = (("operation", row["operation"]),)
+            for quantile in QUANTILES:
+                value = row[f"p{int(quantile * 100)}"]
+                lines.append(
+                    f"{prefix}_operation_duration_seconds{labels(operation + (('quantile', quantile),))} {value:.6f}"
+                )
+        with self._lock:
+            totals = sorted(self._totals.items())
+        for (name, pairs), value in totals:
+            lines.append(f"{prefix}_{name}{labels(pairs)} {value:g}")
+        # 同じ名前の TYPE 行はメトリクスごとに1回だけ出す
+        seen = set()
+        output = []
+        for line in lines:
+            name = line.split("{")[0].split(" ")[0]
+            if not line.startswith("#") and name not in seen and name.endswith("_total"):
+                seen.add(name)
+                output.append(f"# TYPE {name} counter")
+            output.append(line)
+        return "\n".join(output) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
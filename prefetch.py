@@ -0,0 +1,143 @@
+"""CEFRレベル・単語数ごとに生成済みの文章を先読みしておくバックグラウンドプール"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+
+def bucket_word_count(word_count, bucket_size=10):
+    """単語数をプールのバケットに丸める"""
+    return max(bucket_size, int(round(word_count / bucket_size)) * bucket_size)
+
+
+def is_similar_theme(theme, recent_themes, threshold=0.75):
+    """テーマが最近のテーマと同一・類似しているかを判定"""
+    normalized = "".join(theme.split()).lower()
+    for recent in recent_themes:
+        other = "".join(recent.split()).lower()
+        if not other:
+            continue
+        if normalized == other or SequenceMatcher(None, normalized, other).ratio() >= threshold:
+            return True
+    return False
+
+
+class PassagePool:
+    """(CEFRレベル, 単語数バケット) ごとに生成済みの文章をキューで保持する
+
+    generate_fn(cefr_level, word_count, avoid_themes) は Streamlit に依存しない関数で、
+    {"passage", "theme", "speaker_gender"} を持つ dict か None を返すこと。
+    バックグラウンドスレッドから呼ばれるため st.* を使ってはならない。
+    """
+
+    def __init__(self, generate_fn, depth=2, ttl=1800, max_keys=8, workers=2, bucket_size=10):
+        self.generate_fn = generate_fn
+        self.depth = depth
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.bucket_size = bucket_size
+        self._queues = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0, "expired": 0, "generated": 0, "failed": 0}
+
+    def _key(self, cefr_level, word_count):
+        return (cefr_level, bucket_word_count(word_count, self.bucket_size))
+
+    def _evict_stale(self, key):
+        queue = self._queues.get(key)
+        if not queue:
+            return
+        now = time.time()
+        while queue and now - queue[0]["created_at"] > self.ttl:
+            queue.popleft()
+            self.stats["expired"] += 1
+
+    def _touch(self, key):
+        """キューを登録(または最近使用扱いに)し、上限を超えたキーを破棄"""
+        if key in self._queues:
+            self._queues.move_to_end(key)
+        else:
+            self._queues[key] = deque()
+        while len(self._queues) > self.max_keys:
+            old_key, _ = self._queues.popitem(last=False)
+            self._inflight.pop(old_key, None)
+
+    def get(self, cefr_level, word_count, recent_themes=()):
+        """条件に合う先読み済みの文章を取り出す(無ければ None)
+
+        recent_themes と同一・類似のテーマを持つ文章は取り出さずに残す。
+        取り出し後は非同期で補充する。
+        """
+        if self.depth <= 0:
+            return None
+        key = self._key(cefr_level, word_count)
+        entry = None
+        with self._lock:
+            self._touch(key)
+            self._evict_stale(key)
+            queue = self._queues[key]
+            for candidate in list(queue):
+                if is_similar_theme(candidate["theme"], recent_themes):
+                    self.stats["skipped"] += 1
+                    continue
+                queue.remove(candidate)
+                entry = candidate
+                break
+            self.stats["hits" if entry else "misses"] += 1
+        self.refill(cefr_level, word_count)
+        return entry
+
+    def warm(self, cefr_level, word_count):
+        """指定の組み合わせをプール対象に登録して補充を開始"""
+        if self.depth <= 0:
+            return
+        with self._lock:
+            self._touch(self._key(cefr_level, word_count))
+        self.refill(cefr_level, word_count)
+
+    def refill(self, cefr_level, word_count):
+        """キューが depth に満たない分だけ生成ジョブを投入"""
+        key = self._key(cefr_level, word_count)
+        with self._lock:
+            if key not in self._queues:
+                return
+            self._evict_stale(key)
+            missing = self.depth - len(self._queues[key]) - self._inflight.get(key, 0)
+            if missing <= 0:
+                return
+            self._inflight[key] = self._inflight.get(key, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._generate_one, key)
+
+    def _generate_one(self, key):
+        cefr_level, word_count = key
+        with self._lock:
+            queue = self._queues.get(key, ())
+            avoid_themes = [entry["theme"] for entry in queue]
+        try:
+            result = self.generate_fn(cefr_level, word_count, avoid_themes)
+        except Exception:
+            result = None
+        with self._lock:
+            if key in self._inflight:
+                self._inflight[key] = max(0, self._inflight[key] - 1)
+            if not result:
+                self.stats["failed"] += 1
+                return
+            self.stats["generated"] += 1
+            queue = self._queues.get(key)
+            # 生成中にキーが破棄された場合は捨てる
+            if queue is None or len(queue) >= self.depth:
+                return
+            queue.append(dict(result, created_at=time.time()))
+
+    def snapshot(self):
+        """キーごとの在庫数と統計を返す"""
+        with self._lock:
+            return {
+                "queues": {f"{level}/{count}": len(queue) for (level, count), queue in self._queues.items()},
+                "stats": dict(self.stats),
+            }
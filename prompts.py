@@ -0,0 +1,372 @@
+"""文章生成・テーマ抽出・学習ガイドのプロンプトと構造化出力スキーマ
+
+Streamlit アプリ (test.py) と一括生成 CLI (batch_generate.py) で共有する。
+Streamlit に依存しないこと。
+"""
+import functools
+import hashlib
+import inspect
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Literal
+
+from pydantic import BaseModel, ValidationError
+
+# 学習ガイドの生成方法(プロンプト以外の後処理など)を変更した場合に上げる(古いキャッシュを無効化する)
+# プロンプトの文面の変更は template_hash で自動的に反映される
+STUDY_GUIDE_PROMPT_VERSION = 2
+
+# 語彙レベルチェックで書き換えを依頼する語の上限
+MAX_REWRITE_WORDS = 30
+
+THEME_EXTRACTION_FAILED = "テーマ抽出に失敗しました"
+
+# CEFRレベルマッピング
+LEVEL_NAMES = {"A0": "入門", "A1": "初級", "A2": "初級上", "B1": "中級", "B2": "中級上", "C1": "上級"}
+# 学習ガイドは一つ下のレベルを想定
+LOWER_LEVELS = {"A1": "A0", "A2": "A1", "B1": "A2", "B2": "B1", "C1": "B2"}
+
+# 学習ガイドの項目(表示順)。項目ごとに別々に生成・キャッシュする
+STUDY_GUIDE_SECTIONS = {
+    "overview": {
+        "title": "📚 文章の概要",
+        "instructions": """- この文章の主題と内容を簡単に説明""",
+    },
+    "vocabulary": {
+        "title": "🔤 重要単語・フレーズ",
+        "instructions": """- 重要な単語やフレーズをピックアップ
+- 各単語について:
+  - **単語**: 意味(日本語)
+  - 例文(できれば元の文章から)
+  - 使い方のヒント""",
+    },
+    "grammar": {
+        "title": "📖 文法/構造",
+        "instructions": """- この文章の各段落を構築する文の構文解析を実施して解説してください。
+- 各段落について:
+  - 各文の構造(SVOCM分解)
+  - 各文の関係性
+  - 文構造の読み方
+  - 各文の解説毎に改行を挿入""",
+    },
+    "tips": {
+        "title": "💡 理解のコツ",
+        "instructions": """- この文章を理解するためのポイントや背景知識
+- 文化的な背景や文脈の説明""",
+    },
+    "exercises": {
+        "title": "✍️ 練習問題",
+        "instructions": """- 内容理解を確認する簡単な質問を2-3問
+- 単語や文法の応用練習""",
+    },
+}
+
+
+class PassageResult(BaseModel):
+    """文章・テーマ・話者の性別をまとめて受け取る構造化出力スキーマ"""
+    passage: str
+    theme: str
+    speaker_gender: Literal["male", "female", "neutral"]
+
+
+class PassageOutline(BaseModel):
+    """長文モードで最初に受け取る段落構成"""
+    title: str
+    theme: str
+    speaker_gender: Literal["male", "female", "neutral"]
+    paragraphs: list[str]
+
+
+# プロンプトのテンプレートの登録簿(録画・再生で、応答がどの版のテンプレートのものかを判定する)
+# 名前 → (組み立て関数, 文面に入る関数外の定数・補助関数)
+PROMPT_TEMPLATES = {}
+# 最近組み立てたプロンプトのハッシュ → テンプレート名
+_recent_prompts = OrderedDict()
+_RECENT_PROMPTS_LIMIT = 1024
+_recent_lock = threading.Lock()
+
+
+def _prompt_digest(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def prompt_template(name, *dependencies):
+    """プロンプトを組み立てる関数をテンプレートとして登録する
+
+    dependencies には、関数の外で定義されていて文面に入る定数・補助関数・スキーマを渡す
+    (テンプレートのハッシュに含める)。
+    """
+    def register(builder):
+        @functools.wraps(builder)
+        def build(*args, **kwargs):
+            prompt = builder(*args, **kwargs)
+            with _recent_lock:
+                _recent_prompts[_prompt_digest(prompt)] = name
+                _recent_prompts.move_to_end(_prompt_digest(prompt))
+                while len(_recent_prompts) > _RECENT_PROMPTS_LIMIT:
+                    _recent_prompts.popitem(last=False)
+            return prompt
+
+        PROMPT_TEMPLATES[name] = (builder, dependencies)
+        return build
+    return register
+
+
+@functools.lru_cache(maxsize=None)
+def template_hash(name):
+    """テンプレートの安定したハッシュ(組み立て関数のソースと依存する定数から作る16桁)
+
+    文面を変えるとハッシュが変わるので、古いテンプレートで録画した応答やキャッシュを見分けられる。
+    """
+    builder, dependencies = PROMPT_TEMPLATES[name]
+    digest = hashlib.sha256()
+    for part in (builder, *dependencies):
+        if callable(part):
+            text = inspect.getsource(part)
+        else:
+            text = json.dumps(part, ensure_ascii=False, sort_keys=True)
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def template_of(prompt):
+    """最近組み立てたプロンプトのテンプレート名(このプロセスで組み立てたものでなければ None)"""
+    with _recent_lock:
+        return _recent_prompts.get(_prompt_digest(prompt))
+
+
+AVOIDANCE_HEADER = "IMPORTANT: Please avoid creating content that is similar to these recently used themes:"
+AVOIDANCE_FOOTER = "Choose a completely different topic or approach to ensure variety and prevent repetition."
+_AVOIDANCE_BLOCK = re.compile(re.escape(AVOIDANCE_HEADER) + ".*?" + re.escape(AVOIDANCE_FOOTER), re.DOTALL)
+
+
+def _avoidance_text(recent_themes):
+    themes_text = "\n".join([f"- {theme}" for theme in recent_themes])
+    return f"""
+        
+        {AVOIDANCE_HEADER}
+        {themes_text}
+        
+        {AVOIDANCE_FOOTER}
+        """
+
+
+def normalize_prompt(prompt):
+    """録画との照合用に、毎回変わる部分(避けるテーマの一覧)と空白の違いを取り除く"""
+    return " ".join(_AVOIDANCE_BLOCK.sub(" ", prompt).split())
+
+
+@prompt_template("passage", _avoidance_text, AVOIDANCE_HEADER, AVOIDANCE_FOOTER)
+def build_passage_prompt(cefr_level, word_count, recent_themes, structured=False):
+    """文章生成用のプロンプトを組み立てる"""
+    base_prompt = f"""
+    Create an English text passage suitable for an English language learner at CEFR level {cefr_level}.
+    The passage should be approximately {word_count} words long.
+    The content should be interesting, educational, and appropriate for language learning.
+    """
+    
+    if recent_themes:
+        prompt = base_prompt + _avoidance_text(recent_themes)
+    else:
+        prompt = base_prompt
+    
+    if structured:
+        prompt += """
+        
+        Return a JSON object with the following fields:
+        - passage: the text passage only, without any additional explanations or metadata
+        - theme: a concise summary of the main theme or topic of the passage, written in Japanese (1-2 sentences)
+        - speaker_gender: the gender of the speaker or main character of the passage (male/female/neutral)
+        """
+    else:
+        prompt += "\n\nOnly return the text passage without any additional explanations or metadata."
+    return prompt
+
+
+def validate_passage_result(response):
+    """構造化出力の応答を PassageResult として検証する(合致しなければ None)"""
+    result = response.parsed
+    if not isinstance(result, PassageResult):
+        try:
+            result = PassageResult.model_validate_json(response.text or "")
+        except ValidationError:
+            return None
+    
+    result.passage = result.passage.strip()
+    result.theme = result.theme.strip()
+    if not result.passage or not result.theme:
+        return None
+    return result
+
+
+@prompt_template("outline", _avoidance_text, AVOIDANCE_HEADER, AVOIDANCE_FOOTER)
+def build_outline_prompt(cefr_level, word_count, recent_themes, paragraph_count):
+    """長文モード: 段落ごとの要約からなる構成を作るプロンプト(構造化出力)"""
+    prompt = f"""
+    Plan an English text passage for an English language learner at CEFR level {cefr_level}.
+    The passage will be about {word_count} words long and have exactly {paragraph_count} paragraphs.
+    The content should be interesting, educational, and appropriate for language learning.
+    """
+    if recent_themes:
+        prompt += _avoidance_text(recent_themes)
+    prompt += f"""
+        
+        Return a JSON object with the following fields:
+        - title: a short English title for the passage
+        - theme: a concise summary of the main theme or topic of the passage, written in Japanese (1-2 sentences)
+        - speaker_gender: the gender of the speaker or main character of the passage (male/female/neutral)
+        - paragraphs: exactly {paragraph_count} items, one per paragraph in order, each a one-sentence English summary of what that paragraph says
+        """
+    return prompt
+
+
+def validate_outline(response, paragraph_count=None):
+    """構成の応答を PassageOutline として検証する(合致しなければ None)"""
+    outline = response.parsed
+    if not isinstance(outline, PassageOutline):
+        try:
+            outline = PassageOutline.model_validate_json(response.text or "")
+        except ValidationError:
+            return None
+    
+    outline.paragraphs = [summary.strip() for summary in outline.paragraphs if summary.strip()]
+    outline.theme = outline.theme.strip()
+    if not outline.paragraphs or not outline.theme:
+        return None
+    if paragraph_count is not None:
+        outline.paragraphs = outline.paragraphs[:paragraph_count]
+    return outline
+
+
+@prompt_template("paragraph")
+def build_paragraph_prompt(cefr_level, outline, index, word_count, previous_word_count=None):
+    """長文モード: 構成を共有したうえで1段落だけを書かせるプロンプト"""
+    plan = "\n".join(f"{i + 1}. {summary}" for i, summary in enumerate(outline.paragraphs))
+    prompt = f"""
+    You are writing one paragraph of an English text passage for an English language learner at CEFR level {cefr_level}.
+    Title: {outline.title}
+    Paragraph plan:
+    {plan}
+    
+    Write ONLY paragraph {index + 1} of {len(outline.paragraphs)}: {outline.paragraphs[index]}
+    The paragraph should be approximately {word_count} words long.
+    It must read naturally after the previous paragraph and before the next one in the plan.
+    Keep the same speaker, tense and names as described in the plan.
+    """
+    if previous_word_count is not None:
+        prompt += f"""
+    Your previous attempt had {previous_word_count} words. Stay close to {word_count} words this time.
+    """
+    prompt += "\n\nOnly return the paragraph text without a heading, numbering or any additional explanations."
+    return prompt
+
+
+@prompt_template("theme")
+def build_theme_prompt(text):
+    """テーマと話者の性別を抽出するプロンプト"""
+    prompt = f"""
+    以下の英語文章について2つのことを分析してください:
+
+    1. 主要なテーマやトピックを簡潔に日本語で要約してください(1-2文)
+    2. この文章の話者や主人公の性別を判定してください(male/female/neutral)
+
+    文章:
+    {text}
+
+    以下の形式で回答してください:
+    テーマ: [テーマの説明]
+    性別: [male/female/neutral]
+    """
+    return prompt
+
+
+def parse_theme_and_gender(result):
+    """「テーマ: ...」「性別: ...」形式の応答を (テーマ, 性別) にする"""
+    theme = THEME_EXTRACTION_FAILED
+    gender = "neutral"
+    
+    lines = result.strip().split('\n')
+    for line in lines:
+        if line.startswith('テーマ:'):
+            theme = line.replace('テーマ:', '').strip()
+        elif line.startswith('性別:'):
+            gender_text = line.replace('性別:', '').strip().lower()
+            if gender_text in ['male', 'female', 'neutral']:
+                gender = gender_text
+    
+    return theme, gender
+
+
+@prompt_template("rewrite", MAX_REWRITE_WORDS)
+def build_rewrite_prompt(text, cefr_level, off_level_words):
+    """目標レベルを超える語だけを置き換えるよう依頼するプロンプト"""
+    words_text = ", ".join(off_level_words[:MAX_REWRITE_WORDS])
+    prompt = f"""
+    Rewrite the following English passage for an English language learner at CEFR level {cefr_level}.
+    Replace ONLY these words or phrases with simpler words at or below CEFR level {cefr_level}:
+    {words_text}
+    
+    Keep every other word, the meaning, the paragraph structure and the approximate length unchanged.
+    Do not replace names of people or places.
+    
+    Passage:
+    {text}
+    
+    Only return the rewritten passage without any additional explanations or metadata.
+    """
+    return prompt
+
+
+@prompt_template("study_guide", STUDY_GUIDE_SECTIONS, LEVEL_NAMES, LOWER_LEVELS)
+def build_study_guide_prompt(text, cefr_level):
+    """学習ガイド(CSS組み込みのHTML)を作成するプロンプト"""
+    # 一つ下のレベルを想定
+    target_level = LOWER_LEVELS.get(cefr_level, "A1")
+    target_level_jp = LEVEL_NAMES.get(target_level, target_level)
+    sections = "\n\n".join(f"## {spec['title']}\n{spec['instructions']}" for spec in STUDY_GUIDE_SECTIONS.values())
+    
+    prompt = f"""
+以下の英語文章について、CEFR {target_level}レベル({target_level_jp})の学習者向けの教育・解説用テキストをCSS組み込みのHTML形式で作成してください。
+※ デザインは Google を意識してください。
+※ 重要箇所には適度に配色を施してください。
+
+文章:
+{text}
+
+以下の構成で、分かりやすく丁寧に解説してください:
+
+{sections}
+
+全て日本語で、初学者にも分かりやすい表現を使ってください。
+"""
+    return prompt
+
+
+@prompt_template("study_guide_section", STUDY_GUIDE_SECTIONS, LEVEL_NAMES, LOWER_LEVELS)
+def build_study_guide_section_prompt(text, cefr_level, section):
+    """学習ガイドの1項目だけを HTML 断片として作成するプロンプト"""
+    target_level = LOWER_LEVELS.get(cefr_level, "A1")
+    target_level_jp = LEVEL_NAMES.get(target_level, target_level)
+    spec = STUDY_GUIDE_SECTIONS[section]
+    
+    prompt = f"""
+以下の英語文章について、CEFR {target_level}レベル({target_level_jp})の学習者向けの教育・解説用テキストのうち、
+「{spec["title"]}」の項目だけをCSS組み込みのHTML断片として作成してください。
+※ <html>・<head>・<body> は含めず、スタイルはインラインで指定した1つの <section> 要素だけを返してください。
+※ 見出しは「{spec["title"]}」としてください。
+※ デザインは Google を意識してください。
+※ 重要箇所には適度に配色を施してください。
+
+文章:
+{text}
+
+以下の内容で、分かりやすく丁寧に解説してください:
+
+{spec["instructions"]}
+
+全て日本語で、初学者にも分かりやすい表現を使ってください。
+"""
+    return prompt
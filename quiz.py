@@ -0,0 +1,207 @@
+"""文章からローカルで作る練習問題(モデル呼び出し不要)
+
+- 穴埋め: 目標レベル以上の語を空欄にし、同じレベルの語を選択肢に混ぜる
+- 並べ替え: 1文の語をシャッフルして正しい順に並べ直させる
+- ディクテーション: 聞き取って入力した文を語単位で本文と突き合わせる
+
+同じ文章・レベル・シードからは常に同じ問題を作る。
+"""
+import difflib
+import random
+import re
+from dataclasses import dataclass, field
+
+from hiding import FUNCTION_WORDS
+from speech_player import sentence_spans
+from vocab import OFF_LIST_RANK, TARGET_LEVEL_RANKS, rank_label
+
+BLANK = "_____"
+CHOICE_COUNT = 4
+# 並べ替え問題にする文の語数の範囲
+ORDER_MIN_WORDS = 4
+ORDER_MAX_WORDS = 12
+# 穴埋めの対象にする語の最小文字数
+CLOZE_MIN_CHARS = 3
+
+# 採点時に比べる語(大文字小文字と前後の記号を無視する)
+_WORD = re.compile(r"[A-Za-z0-9]+(?:['’\-][A-Za-z0-9]+)*")
+
+
+def normalize_words(text):
+    """採点用に小文字の語のリストにする"""
+    return [word.lower().replace("’", "'") for word in _WORD.findall(text)]
+
+
+@dataclass
+class ClozeItem:
+    """穴埋め問題(sentence の空欄に answer が入る)"""
+    sentence_index: int
+    sentence: str
+    answer: str
+    level: str
+    choices: list = field(default_factory=list)
+
+    def check(self, response):
+        return normalize_words(response or "") == normalize_words(self.answer)
+
+
+@dataclass
+class WordOrderItem:
+    """並べ替え問題(shuffled を並べ直すと answer になる)"""
+    sentence_index: int
+    answer: str
+    shuffled: list = field(default_factory=list)
+
+    def check(self, order):
+        """order は shuffled の番号を選んだ順に並べたもの(同じ語の入れ替わりは正解とする)"""
+        return normalize_words(" ".join(self.shuffled[i] for i in order)) == normalize_words(self.answer)
+
+
+@dataclass
+class Quiz:
+    sentences: list
+    cloze: list = field(default_factory=list)
+    word_order: list = field(default_factory=list)
+
+
+def _ending(word):
+    """語形の手がかりになる語尾(選択肢の形をそろえるため)"""
+    word = word.lower()
+    for suffix in ("ing", "ed", "ly", "s"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            return suffix
+    return ""
+
+
+def _distractors(index, answer, rank, passage_words, rng, count):
+    """答えと同じレベルの語から紛らわしい選択肢を選ぶ
+
+    本文中の語を優先し、その中でも答えと語尾(-ing / -ed / -ly / -s)が同じ語を先に使う。
+    """
+    answer_lower = answer.lower()
+    pool = list(dict.fromkeys(word for word in passage_words.get(rank, ()) if word.lower() != answer_lower))
+    rng.shuffle(pool)
+    ending = _ending(answer)
+    pool.sort(key=lambda word: _ending(word) != ending)
+    chosen = pool[:count]
+    if len(chosen) < count:
+        extra = [word for word in index.words_at(rank) if word != answer_lower and word not in chosen]
+        chosen += rng.sample(extra, min(count - len(chosen), len(extra)))
+    # 大文字始まりの語なら選択肢もそろえる
+    if answer[:1].isupper():
+        chosen = [word[:1].upper() + word[1:] for word in chosen]
+    return chosen
+
+
+def build_quiz(text, index, cefr_level, seed=0, cloze_count=5, order_count=3):
+    """文章から穴埋めと並べ替えの問題を作る
+
+    穴埋めは目標レベル以上(C1 なら単語リストに無い語)の内容語を、レベルの高い語から
+    1文に1問・同じ見出し語は1問まで選び、本文での出現順に並べる。目標レベル以上の語が足りなければ、
+    残りはそれより下のレベルの語から高い順に補う。
+    """
+    rng = random.Random(seed)
+    spans = sentence_spans(text)
+    sentences = [text[start:end] for start, end in spans]
+    target_rank = TARGET_LEVEL_RANKS.get(cefr_level, OFF_LIST_RANK)
+    tokens = index.analyze(text)
+
+    # 語ごとにどの文に属するかを、文の開始位置をたどって求める
+    candidates = []
+    passage_words = {}
+    sentence_index = 0
+    for token in tokens:
+        while sentence_index + 1 < len(spans) and token.start >= spans[sentence_index + 1][0]:
+            sentence_index += 1
+        if token.rank is None or len(token.text) < CLOZE_MIN_CHARS or token.text.lower() in FUNCTION_WORDS:
+            continue
+        # café の caf のように、ASCII 以外の文字で切れた語の一部は使わない
+        if text[token.start - 1:token.start].isalpha() or text[token.end:token.end + 1].isalpha():
+            continue
+        passage_words.setdefault(token.rank, []).append(token.text)
+        if token.start >= spans[sentence_index][0]:
+            candidates.append((sentence_index, token))
+
+    rng.shuffle(candidates)
+    candidates.sort(key=lambda candidate: (candidate[1].rank < target_rank, -candidate[1].rank))
+    picked = {}
+    used_headwords = set()
+    for sentence_index, token in candidates:
+        if len(picked) >= cloze_count:
+            break
+        if sentence_index in picked or token.headword in used_headwords:
+            continue
+        picked[sentence_index] = token
+        used_headwords.add(token.headword)
+
+    cloze = []
+    for sentence_index, token in sorted(picked.items()):
+        start = spans[sentence_index][0]
+        sentence = sentences[sentence_index]
+        blanked = sentence[:token.start - start] + BLANK + sentence[token.end - start:]
+        choices = [token.text] + _distractors(
+            index, token.text, token.rank, passage_words, rng, CHOICE_COUNT - 1
+        )
+        rng.shuffle(choices)
+        cloze.append(ClozeItem(sentence_index, blanked, token.text, rank_label(token.rank), choices))
+
+    orderable = [
+        i for i, sentence in enumerate(sentences)
+        if ORDER_MIN_WORDS <= len(sentence.split()) <= ORDER_MAX_WORDS
+    ]
+    word_order = []
+    for sentence_index in sorted(rng.sample(orderable, min(order_count, len(orderable)))):
+        words = sentences[sentence_index].split()
+        shuffled = list(words)
+        # 元の順番のままにならないよう、最大数回シャッフルし直す
+        for _ in range(5):
+            rng.shuffle(shuffled)
+            if shuffled != words:
+                break
+        word_order.append(WordOrderItem(sentence_index, sentences[sentence_index], shuffled))
+
+    return Quiz(sentences, cloze, word_order)
+
+
+@dataclass
+class DictationResult:
+    """ディクテーションの採点結果
+
+    ops は (種類, 本文の語, 入力した語) のリストで、種類は
+    "equal" / "replace" / "delete"(聞き落とし) / "insert"(余分な語)。
+    """
+    ops: list
+    correct: int
+    total: int
+
+    @property
+    def accuracy(self):
+        return self.correct / self.total if self.total else 1.0
+
+
+def diff_dictation(reference, typed):
+    """入力した文を本文と語単位で突き合わせる(大文字小文字・句読点は無視)"""
+    expected = reference.split()
+    expected_keys = [" ".join(normalize_words(word)) for word in expected]
+    actual = typed.split()
+    actual_keys = [" ".join(normalize_words(word)) for word in actual]
+    matcher = difflib.SequenceMatcher(a=expected_keys, b=actual_keys, autojunk=False)
+    ops = []
+    correct = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            correct += i2 - i1
+            ops.extend(("equal", expected[i], actual[j]) for i, j in zip(range(i1, i2), range(j1, j2)))
+        elif tag == "replace":
+            pairs = max(i2 - i1, j2 - j1)
+            for k in range(pairs):
+                ops.append((
+                    "replace" if i1 + k < i2 and j1 + k < j2 else ("delete" if i1 + k < i2 else "insert"),
+                    expected[i1 + k] if i1 + k < i2 else None,
+                    actual[j1 + k] if j1 + k < j2 else None,
+                ))
+        elif tag == "delete":
+            ops.extend(("delete", expected[i], None) for i in range(i1, i2))
+        else:
+            ops.extend(("insert", None, actual[j]) for j in range(j1, j2))
+    return DictationResult(ops, correct, len(expected))
@@ -0,0 +1,280 @@
+"""プロセス全体で共有するモデル呼び出しのスケジューラー
+
+すべてのセッションのモデル呼び出しをここに並べてから実行する。
+
+- モデルごとのトークンバケットによる流量制限
+- セッション間のラウンドロビン(公平なキューイング)。先読みなどの
+  バックグラウンド処理は、流量に空きがあって対話的なリクエストを
+  実行できないときだけ実行する
+- セッションごとの呼び出し回数の上限(一定時間あたり)
+- 同じキーの実行中・待機中のリクエストを1回の呼び出しにまとめる(キーは結果が入力だけで
+  決まる呼び出しにだけ付ける。文章の生成のように毎回別の結果が要るものは key=None)
+- 待ち順の問い合わせ(UI で順番待ちの位置を表示するため)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+
+# モデルごとの既定の流量(1分あたりのリクエスト数)
+DEFAULT_RPM = {
+    "gemini-2.0-flash-lite": 30,
+    "gemini-2.0-flash": 15,
+}
+DEFAULT_MODEL_RPM = 15
+
+
+class QuotaExceeded(Exception):
+    """セッションの呼び出し回数が上限に達した"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"利用回数の上限に達しました。約 {max(1, round(retry_after / 60))} 分後に再度お試しください")
+
+
+def request_key(model, prompt, schema=None):
+    """同一リクエストの判定に使うキー"""
+    schema_name = schema.__name__ if schema is not None else ""
+    return hashlib.sha256(f"{model}\0{schema_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """rate(1秒あたり)で補充され、最大 burst 個まで貯まるトークンバケット(排他はスケジューラー側で行う)"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self):
+        """トークンが1個できるまでの秒数(0 なら今すぐ取れる)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Job:
+    def __init__(self, session_id, model, fn, key, background):
+        self.session_id = session_id
+        self.model = model
+        self.fn = fn
+        self.key = key
+        self.background = background
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.started = None
+        # このジョブを待っているチケットの数(相乗りで増え、取り消しで減る)
+        self.holders = 1
+
+
+class Ticket:
+    """投入したリクエストの引換券"""
+
+    def __init__(self, scheduler, job, coalesced=False):
+        self._scheduler = scheduler
+        self._job = job
+        self.coalesced = coalesced
+        # このチケットの取り消しを済ませたか(相乗りの数を二重に減らさないため)
+        self._cancelled = False
+
+    def position(self):
+        """待ち順(1 始まり)。実行中・完了済みなら 0"""
+        return self._scheduler.position(self._job)
+
+    def wait(self, timeout=None):
+        """完了するまで最大 timeout 秒待ち、完了したかどうかを返す"""
+        wait([self._job.future], timeout=timeout)
+        return self._job.future.done()
+
+    def done(self):
+        return self._job.future.done()
+
+    def result(self, timeout=None):
+        return self._job.future.result(timeout)
+
+    def cancel(self):
+        """このチケットを取り消す。まだ始まっておらず、相乗りしている他のチケットも
+        なければ呼び出し自体を取りやめて True を返す(2回目以降は何もせず False)"""
+        return self._scheduler.cancel(self)
+
+    def cancelled(self):
+        return self._job.future.cancelled()
+
+    def add_done_callback(self, fn):
+        """完了(取り消しを含む)したら fn() を呼ぶ。完了済みならすぐ呼ぶ"""
+        self._job.future.add_done_callback(lambda _future: fn())
+
+    def queue_wait(self):
+        """投入から実行開始までの秒数(まだ始まっていなければ None)"""
+        if self._job.started is None:
+            return None
+        return self._job.started - self._job.submitted
+
+
+class RequestScheduler:
+    """モデル呼び出しの順番待ち・流量制限・重複排除を行う
+
+    fn は引数なしで呼ばれ、その戻り値(または例外)がチケットの結果になる。
+    プロセスで1つだけ作って全セッションで共有すること。
+    """
+
+    def __init__(self, rpm=None, workers=8, session_quota=60, quota_window=3600, burst=2):
+        self.rpm = dict(DEFAULT_RPM, **(rpm or {}))
+        self.workers = workers
+        self.session_quota = session_quota
+        self.quota_window = quota_window
+        self.burst = burst
+        self._cond = threading.Condition()
+        self._buckets = {}
+        # 優先度ごとに セッションID → 待ち行列(先頭のセッションから順に取り出す)
+        self._queues = {False: OrderedDict(), True: OrderedDict()}
+        self._inflight = {}
+        self._usage = {}
+        self.stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "cancelled": 0, "completed": 0, "failed": 0}
+        # 終了時に待ち合わせないよう、ワーカーはデーモンスレッドにする
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"scheduler-{i}", daemon=True).start()
+
+    def _bucket(self, model):
+        if model not in self._buckets:
+            rate = self.rpm.get(model, DEFAULT_MODEL_RPM) / 60
+            self._buckets[model] = TokenBucket(rate, self.burst)
+        return self._buckets[model]
+
+    def _check_quota(self, session_id):
+        now = time.monotonic()
+        usage = self._usage.setdefault(session_id, deque())
+        while usage and usage[0] <= now - self.quota_window:
+            usage.popleft()
+        if len(usage) >= self.session_quota:
+            self.stats["rejected"] += 1
+            raise QuotaExceeded(usage[0] + self.quota_window - now)
+        usage.append(now)
+
+    def submit(self, session_id, model, fn, key=None, background=False):
+        """リクエストを並べてチケットを返す
+
+        key が同じリクエストが待機中・実行中なら、それに相乗りする(回数上限にも数えない)。
+        バックグラウンドのリクエストは回数上限の対象外。
+        """
+        with self._cond:
+            job = self._inflight.get(key) if key is not None else None
+            if job is not None:
+                self.stats["coalesced"] += 1
+                job.holders += 1
+                if job.background and not background and job.started is None:
+                    # 対話的なリクエストが相乗りしたら、通常の優先度に引き上げる
+                    self._remove(job)
+                    job.background = False
+                    self._enqueue(job)
+                return Ticket(self, job, coalesced=True)
+
+            if not background:
+                self._check_quota(session_id)
+            job = _Job(session_id, model, fn, key, background)
+            if key is not None:
+                self._inflight[key] = job
+            self._enqueue(job)
+            self.stats["submitted"] += 1
+            self._cond.notify_all()
+            return Ticket(self, job)
+
+    def _enqueue(self, job):
+        self._queues[job.background].setdefault(job.session_id, deque()).append(job)
+
+    def _remove(self, job):
+        sessions = self._queues[job.background]
+        queue = sessions[job.session_id]
+        queue.remove(job)
+        if not queue:
+            del sessions[job.session_id]
+
+    def cancel(self, ticket):
+        job = ticket._job
+        with self._cond:
+            if ticket._cancelled or job.started is not None or job.future.done():
+                return False
+            ticket._cancelled = True
+            job.holders -= 1
+            if job.holders > 0:
+                return False
+            self._remove(job)
+            if job.key is not None and self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            job.future.cancel()
+            self.stats["cancelled"] += 1
+            return True
+
+    def _order(self):
+        """現在の待ち行列を、取り出される順(ラウンドロビン)に並べる"""
+        order = []
+        for background in (False, True):
+            queues = list(self._queues[background].values())
+            depth = max((len(queue) for queue in queues), default=0)
+            for i in range(depth):
+                order.extend(queue[i] for queue in queues if i < len(queue))
+        return order
+
+    def position(self, job):
+        with self._cond:
+            if job.started is not None:
+                return 0
+            for i, queued in enumerate(self._order()):
+                if queued is job:
+                    return i + 1
+            return 0
+
+    def queue_length(self):
+        with self._cond:
+            return sum(len(queue) for sessions in self._queues.values() for queue in sessions.values())
+
+    def _next_job(self):
+        """実行できるジョブと、なければ次に確認するまでの秒数を返す"""
+        retry_in = None
+        for background in (False, True):
+            sessions = self._queues[background]
+            for session_id, queue in sessions.items():
+                bucket = self._bucket(queue[0].model)
+                delay = bucket.wait_time()
+                if delay > 0:
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    continue
+                bucket.take()
+                job = queue.popleft()
+                # 取り出したセッションは最後尾に回す
+                del sessions[session_id]
+                if queue:
+                    sessions[session_id] = queue
+                return job, None
+        return None, retry_in
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, retry_in = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=retry_in)
+                    job, retry_in = self._next_job()
+                job.started = time.monotonic()
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            result, error = job.fn(), None
+        except BaseException as e:
+            result, error = None, e
+        # 結果を渡す前に相乗りの対象から外す(完了後に投入された同じキーのリクエストは新しく実行する)
+        with self._cond:
+            self.stats["completed" if error is None else "failed"] += 1
+            if job.key is not None and self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+        if error is None:
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(error)
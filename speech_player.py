@@ -0,0 +1,628 @@
+"""文単位で読み上げる Web Speech API プレーヤー
+
+文の分割はブラウザに依存しないよう Python 側で行い、ブラウザでは1文ずつ
+SpeechSynthesisUtterance をキューに積んで再生する。長い文章でも再生開始までの
+時間は最初の1文の長さだけで決まり、長い発話が途中で切れる問題も避けられる。
+
+サーバーで合成した文ごとの音声(tts.py)を順に再生するプレーヤーもここで作る。
+"""
+import json
+import re
+
+# 文末(. ! ? と閉じ括弧・引用符)または改行
+SENTENCE_END = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s|$)|\n+")
+
+# ピリオドで終わっても文末ではない略語(大文字・小文字を区別する。
+# am / no / us のような普通の語と取り違えないよう、敬称などは先頭大文字の形だけ)
+ABBREVIATIONS = frozenset("Mr Mrs Ms Dr Prof St Jr Sr Mt Ave vs etc".split())
+# 後ろに数字が続くときだけ略語になるもの(No. 5)
+NUMBER_ABBREVIATIONS = frozenset(("No", "Nos"))
+
+PLAYER_HEIGHT = 520
+
+
+def _is_abbreviation(text, period_position):
+    """period_position のピリオドが略語の一部かどうか"""
+    match = re.search(r"([A-Za-z][A-Za-z.]*)$", text[max(0, period_position - 12):period_position])
+    if not match:
+        return False
+    word = match.group(1)
+    # a.m. / e.g. / U.S. のようにピリオドを挟む形
+    if "." in word:
+        return True
+    if word in NUMBER_ABBREVIATIONS:
+        return re.match(r"\s*\d", text[period_position + 1:]) is not None
+    # J. K. Rowling のようなイニシャル
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isupper())
+
+
+def sentence_spans(text):
+    """文ごとの (開始位置, 終了位置) のリスト(前後の空白は含まない)"""
+    spans = []
+    start = 0
+
+    def add(end):
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            offset = start + len(chunk) - len(chunk.lstrip())
+            spans.append((offset, offset + len(stripped)))
+
+    for match in SENTENCE_END.finditer(text):
+        if match.group(0)[0] == "." and _is_abbreviation(text, match.start()):
+            continue
+        # 引用文の後に小文字で続く場合 ("Wow." she said.) は文末としない
+        following = text[match.end():match.end() + 2].lstrip(" \t")
+        if match.group(0)[0] != "\n" and following[:1].islower():
+            continue
+        add(match.end())
+        start = match.end()
+    add(len(text))
+    return spans
+
+
+def split_sentences(text, spans=None):
+    """文のリストを返す
+
+    単語隠しの結果は元の文章と同じ長さなので、元の文章の spans を渡せば
+    隠した文章も同じ位置で分割できる。
+    """
+    if spans is None:
+        spans = sentence_spans(text)
+    return [text[start:end] for start, end in spans]
+
+
+def build_player_html(sentences):
+    """読み上げプレーヤーの HTML を作る"""
+    # </script> で script 要素が閉じられないようにエスケープ
+    sentences_json = json.dumps(sentences, ensure_ascii=False).replace("</", "<\\/")
+    return PLAYER_TEMPLATE.replace("__SENTENCES_JSON__", sentences_json)
+
+
+PLAYER_TEMPLATE = """
+<style>
+    .sentence { cursor: pointer; border-radius: 4px; padding: 1px 2px; }
+    .sentence:hover { background: #f1f3f4; }
+    .sentence.current { background: #fef7e0; box-shadow: inset 0 -2px 0 #fbbc04; }
+    .nav-btn { flex: 1; padding: 8px 12px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; }
+</style>
+<div style="margin-top: 20px;">
+    <div style="background-color: #f8f9fa; padding: 16px; border-radius: 8px; border: 1px solid #e8eaed; margin-bottom: 16px;">
+        <label style="font-weight: 500; margin-bottom: 12px; display: block;">読み上げ速度</label>
+        <div style="display: flex; gap: 8px; margin-bottom: 12px;">
+            <button class="speed-btn" data-speed="0.7" style="padding: 8px 16px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; flex: 1;">遅い</button>
+            <button class="speed-btn active" data-speed="1.0" style="padding: 8px 16px; border: 2px solid #4285f4; background: #4285f4; color: white; border-radius: 20px; cursor: pointer; flex: 1;">標準</button>
+            <button class="speed-btn" data-speed="1.3" style="padding: 8px 16px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; flex: 1;">速い</button>
+        </div>
+
+        <label style="font-weight: 500; margin-bottom: 8px; display: block;">話者選択</label>
+        <select id="voiceSelect" style="width: 100%; padding: 12px; border: 2px solid #e8eaed; border-radius: 8px;">
+            <option value="">読み込み中...</option>
+        </select>
+
+        <div style="margin-top: 12px;">
+            <label style="display: flex; align-items: center; gap: 8px; cursor: pointer;">
+                <input type="checkbox" id="randomVoice" style="width: 18px; height: 18px;">
+                <span style="font-size: 14px;">ランダム話者で読み上げ(文章内で統一)</span>
+            </label>
+        </div>
+    </div>
+
+    <div id="sentenceList" style="max-height: 120px; overflow-y: auto; padding: 12px; border: 1px solid #e8eaed; border-radius: 8px; line-height: 1.8; font-size: 14px; margin-bottom: 8px;"></div>
+    <div style="display: flex; gap: 8px; align-items: center; margin-bottom: 12px;">
+        <button id="prevButton" class="nav-btn">⏮ 前の文</button>
+        <button id="restartButton" class="nav-btn">↺ 最初から</button>
+        <button id="nextButton" class="nav-btn">次の文 ⏭</button>
+        <span id="progress" style="flex: 1; text-align: center; font-size: 14px; color: #5f6368;"></span>
+    </div>
+
+    <button id="playButton" style="width: 100%; padding: 16px; background: #34a853; color: white; border: none; border-radius: 8px; font-size: 16px; font-weight: 500; cursor: pointer;">
+        <span id="playIcon">▶️</span>
+        <span id="playText">読み上げ開始</span>
+    </button>
+
+    <div id="status" style="margin-top: 16px; padding: 12px; background: #e8f0fe; border-radius: 8px; text-align: center; display: none;"></div>
+</div>
+
+<script>
+    (function() {
+        const sentences = __SENTENCES_JSON__;
+        let voices = [];
+        let englishVoices = [];
+        let currentSpeed = 1.0;
+        let isPlaying = false;
+        let selectedVoice = null;
+        // 再生中の文番号と、この再生で使う話者(文章内で統一)
+        let currentIndex = 0;
+        let playbackVoice = null;
+        // 停止・シークで古い発話のコールバックを無視するための番号
+        let playToken = 0;
+
+        const voiceSelect = document.getElementById('voiceSelect');
+        const playButton = document.getElementById('playButton');
+        const playIcon = document.getElementById('playIcon');
+        const playText = document.getElementById('playText');
+        const status = document.getElementById('status');
+        const randomVoiceCheckbox = document.getElementById('randomVoice');
+        const speedButtons = document.querySelectorAll('.speed-btn');
+        const sentenceList = document.getElementById('sentenceList');
+        const progress = document.getElementById('progress');
+        const sentenceSpans = [];
+
+        function loadVoices() {
+            voices = speechSynthesis.getVoices();
+            englishVoices = voices.filter(voice =>
+                voice.lang.startsWith('en-') || voice.lang === 'en'
+            );
+            updateVoiceSelect();
+        }
+
+        function updateVoiceSelect() {
+            voiceSelect.innerHTML = '';
+            if (englishVoices.length === 0) {
+                voiceSelect.innerHTML = '<option value="">英語音声が見つかりません</option>';
+                return;
+            }
+
+            const defaultOption = document.createElement('option');
+            defaultOption.value = '';
+            defaultOption.textContent = 'デフォルト音声';
+            voiceSelect.appendChild(defaultOption);
+
+            englishVoices.forEach((voice, index) => {
+                const option = document.createElement('option');
+                option.value = index;
+                option.textContent = `${voice.name} (${voice.lang})`;
+                voiceSelect.appendChild(option);
+            });
+        }
+
+        function showStatus(message, isError = false) {
+            status.textContent = message;
+            status.style.display = 'block';
+            status.style.background = isError ? '#fce8e6' : '#e8f0fe';
+            status.style.color = isError ? '#d93025' : '#1967d2';
+
+            if (!isError) {
+                setTimeout(() => {
+                    status.style.display = 'none';
+                }, 3000);
+            }
+        }
+
+        function renderSentences() {
+            sentences.forEach((sentence, index) => {
+                const span = document.createElement('span');
+                span.className = 'sentence';
+                span.textContent = sentence;
+                span.title = 'クリックでこの文から再生';
+                span.addEventListener('click', () => seekTo(index));
+                sentenceList.appendChild(span);
+                sentenceList.appendChild(document.createTextNode(' '));
+                sentenceSpans.push(span);
+            });
+            updateProgress();
+        }
+
+        function highlight(index) {
+            sentenceSpans.forEach((span, i) => span.classList.toggle('current', i === index));
+            if (sentenceSpans[index]) {
+                sentenceSpans[index].scrollIntoView({ block: 'nearest' });
+            }
+        }
+
+        function updateProgress() {
+            if (sentences.length === 0) {
+                progress.textContent = '';
+                return;
+            }
+            progress.textContent = `${Math.min(currentIndex + 1, sentences.length)} / ${sentences.length} 文`;
+        }
+
+        function setPlayingUI(playing) {
+            isPlaying = playing;
+            playButton.style.background = playing ? '#ea4335' : '#34a853';
+            playIcon.textContent = playing ? '⏸️' : '▶️';
+            if (playing) {
+                playText.textContent = '停止';
+            } else {
+                playText.textContent = currentIndex > 0 ? '続きから再生' : '読み上げ開始';
+            }
+        }
+
+        function speakFrom(index) {
+            speechSynthesis.cancel();
+            const token = ++playToken;
+            currentIndex = index;
+            updateProgress();
+
+            const utterance = new SpeechSynthesisUtterance(sentences[index]);
+            utterance.rate = currentSpeed;
+            utterance.pitch = 1;
+            utterance.volume = 1;
+            if (playbackVoice) {
+                utterance.voice = playbackVoice;
+            }
+
+            utterance.onstart = () => {
+                if (token !== playToken) return;
+                setPlayingUI(true);
+                highlight(index);
+            };
+
+            utterance.onend = () => {
+                if (token !== playToken) return;
+                if (index + 1 < sentences.length) {
+                    speakFrom(index + 1);
+                    return;
+                }
+                currentIndex = 0;
+                setPlayingUI(false);
+                highlight(-1);
+                updateProgress();
+                showStatus('読み上げが完了しました');
+            };
+
+            utterance.onerror = (event) => {
+                if (token !== playToken) return;
+                if (event.error === 'interrupted' || event.error === 'canceled') return;
+                setPlayingUI(false);
+                showStatus(`エラーが発生しました: ${event.error}`, true);
+            };
+
+            speechSynthesis.speak(utterance);
+        }
+
+        function startSpeech() {
+            if (sentences.length === 0) {
+                showStatus('読み上げるテキストがありません', true);
+                return;
+            }
+
+            playbackVoice = selectedVoice;
+            if (randomVoiceCheckbox.checked && englishVoices.length > 0) {
+                const randomIndex = Math.floor(Math.random() * englishVoices.length);
+                playbackVoice = englishVoices[randomIndex];
+            }
+
+            if (playbackVoice) {
+                showStatus(`読み上げ中: ${playbackVoice.name} (速度: ${currentSpeed}x)`);
+            } else {
+                showStatus(`読み上げ中 (速度: ${currentSpeed}x)`);
+            }
+            speakFrom(currentIndex);
+        }
+
+        function stopSpeech() {
+            playToken++;
+            speechSynthesis.cancel();
+            setPlayingUI(false);
+            showStatus(`${currentIndex + 1}文目で停止しました(続きから再生できます)`);
+        }
+
+        function seekTo(index) {
+            if (sentences.length === 0) return;
+            index = Math.max(0, Math.min(index, sentences.length - 1));
+            if (isPlaying) {
+                speakFrom(index);
+                return;
+            }
+            currentIndex = index;
+            highlight(index);
+            updateProgress();
+            setPlayingUI(false);
+        }
+
+        // イベントリスナー
+        speedButtons.forEach(btn => {
+            btn.addEventListener('click', (e) => {
+                speedButtons.forEach(b => {
+                    b.style.border = '2px solid #e8eaed';
+                    b.style.background = 'white';
+                    b.style.color = 'black';
+                });
+                e.target.style.border = '2px solid #4285f4';
+                e.target.style.background = '#4285f4';
+                e.target.style.color = 'white';
+                // 再生中の場合は次の文から反映
+                currentSpeed = parseFloat(e.target.dataset.speed);
+            });
+        });
+
+        voiceSelect.addEventListener('change', (e) => {
+            const selectedIndex = e.target.value;
+            selectedVoice = selectedIndex ? englishVoices[selectedIndex] : null;
+            if (!randomVoiceCheckbox.checked) {
+                playbackVoice = selectedVoice;
+            }
+        });
+
+        randomVoiceCheckbox.addEventListener('change', (e) => {
+            voiceSelect.disabled = e.target.checked;
+        });
+
+        playButton.addEventListener('click', () => {
+            if (isPlaying) {
+                stopSpeech();
+            } else {
+                startSpeech();
+            }
+        });
+
+        document.getElementById('prevButton').addEventListener('click', () => seekTo(currentIndex - 1));
+        document.getElementById('nextButton').addEventListener('click', () => seekTo(currentIndex + 1));
+        document.getElementById('restartButton').addEventListener('click', () => seekTo(0));
+
+        // 音声読み込み
+        renderSentences();
+        loadVoices();
+        if (speechSynthesis.onvoiceschanged !== undefined) {
+            speechSynthesis.onvoiceschanged = loadVoices;
+        }
+    })();
+</script>
+"""
+
+
+def build_clip_player_html(sentences, clip_urls, spoken_sentences=None):
+    """サーバーで合成した文ごとの音声を順に再生するプレーヤーの HTML を作る
+
+    まだ合成されていない文は取りに行き直してから再生する。一定回数で取れなければ
+    (合成の失敗やキャッシュからの削除)、その文だけ Web Speech API で読み上げる。
+    spoken_sentences は読み上げる文(単語を隠した表示用の sentences と違う場合に渡す)。
+    """
+    data = {"sentences": sentences, "spoken": spoken_sentences or sentences, "urls": clip_urls}
+    data_json = json.dumps(data, ensure_ascii=False).replace("</", "<\\/")
+    return CLIP_PLAYER_TEMPLATE.replace("__DATA_JSON__", data_json)
+
+
+CLIP_PLAYER_TEMPLATE = """
+<style>
+    .sentence { cursor: pointer; border-radius: 4px; padding: 1px 2px; }
+    .sentence:hover { background: #f1f3f4; }
+    .sentence.current { background: #fef7e0; box-shadow: inset 0 -2px 0 #fbbc04; }
+    .sentence.pending { color: #9aa0a6; }
+    .nav-btn { flex: 1; padding: 8px 12px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; }
+    .speed-btn { padding: 8px 16px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; flex: 1; }
+    .speed-btn.active { border-color: #4285f4; background: #4285f4; color: white; }
+</style>
+<div style="margin-top: 20px;">
+    <div style="background-color: #f8f9fa; padding: 16px; border-radius: 8px; border: 1px solid #e8eaed; margin-bottom: 16px;">
+        <label style="font-weight: 500; margin-bottom: 12px; display: block;">再生速度</label>
+        <div style="display: flex; gap: 8px;">
+            <button class="speed-btn" data-speed="0.8">遅い</button>
+            <button class="speed-btn active" data-speed="1.0">標準</button>
+            <button class="speed-btn" data-speed="1.2">速い</button>
+        </div>
+    </div>
+
+    <div id="sentenceList" style="max-height: 120px; overflow-y: auto; padding: 12px; border: 1px solid #e8eaed; border-radius: 8px; line-height: 1.8; font-size: 14px; margin-bottom: 8px;"></div>
+    <div style="display: flex; gap: 8px; align-items: center; margin-bottom: 12px;">
+        <button id="prevButton" class="nav-btn">⏮ 前の文</button>
+        <button id="restartButton" class="nav-btn">↺ 最初から</button>
+        <button id="nextButton" class="nav-btn">次の文 ⏭</button>
+        <span id="progress" style="flex: 1; text-align: center; font-size: 14px; color: #5f6368;"></span>
+    </div>
+
+    <button id="playButton" style="width: 100%; padding: 16px; background: #34a853; color: white; border: none; border-radius: 8px; font-size: 16px; font-weight: 500; cursor: pointer;">
+        <span id="playIcon">▶️</span>
+        <span id="playText">再生</span>
+    </button>
+
+    <div id="status" style="margin-top: 16px; padding: 12px; background: #e8f0fe; border-radius: 8px; text-align: center; display: none;"></div>
+</div>
+
+<script>
+    (function() {
+        const data = __DATA_JSON__;
+        const sentences = data.sentences;
+        const spoken = data.spoken;
+        const urls = data.urls;
+        // 合成待ちの文を取りに行き直す間隔(ミリ秒)と、あきらめて Web Speech で読むまでの回数
+        const RETRY_MS = 500;
+        const MAX_RETRIES = 30;
+        const retries = {};
+        let currentSpeed = 1.0;
+        let isPlaying = false;
+        let currentIndex = 0;
+        let audio = null;
+        // 停止・シークで古い音声のコールバックを無視するための番号
+        let playToken = 0;
+        let retryTimer = null;
+
+        const playButton = document.getElementById('playButton');
+        const playIcon = document.getElementById('playIcon');
+        const playText = document.getElementById('playText');
+        const status = document.getElementById('status');
+        const speedButtons = document.querySelectorAll('.speed-btn');
+        const sentenceList = document.getElementById('sentenceList');
+        const progress = document.getElementById('progress');
+        const sentenceSpans = [];
+
+        function showStatus(message, isError = false) {
+            status.textContent = message;
+            status.style.display = 'block';
+            status.style.background = isError ? '#fce8e6' : '#e8f0fe';
+            status.style.color = isError ? '#d93025' : '#1967d2';
+        }
+
+        function hideStatus() {
+            status.style.display = 'none';
+        }
+
+        function renderSentences() {
+            sentences.forEach((sentence, index) => {
+                const span = document.createElement('span');
+                span.className = 'sentence';
+                span.textContent = sentence;
+                span.title = 'クリックでこの文から再生';
+                span.addEventListener('click', () => seekTo(index));
+                sentenceList.appendChild(span);
+                sentenceList.appendChild(document.createTextNode(' '));
+                sentenceSpans.push(span);
+            });
+            updateProgress();
+        }
+
+        function highlight(index) {
+            sentenceSpans.forEach((span, i) => span.classList.toggle('current', i === index));
+            if (sentenceSpans[index]) {
+                sentenceSpans[index].scrollIntoView({ block: 'nearest' });
+            }
+        }
+
+        function updateProgress() {
+            if (sentences.length === 0) {
+                progress.textContent = '';
+                return;
+            }
+            progress.textContent = `${Math.min(currentIndex + 1, sentences.length)} / ${sentences.length} 文`;
+        }
+
+        function setPlayingUI(playing) {
+            isPlaying = playing;
+            playButton.style.background = playing ? '#ea4335' : '#34a853';
+            playIcon.textContent = playing ? '⏸️' : '▶️';
+            if (playing) {
+                playText.textContent = '停止';
+            } else {
+                playText.textContent = currentIndex > 0 ? '続きから再生' : '再生';
+            }
+        }
+
+        function halt() {
+            playToken++;
+            clearTimeout(retryTimer);
+            if (audio) {
+                audio.pause();
+                audio = null;
+            }
+            if (window.speechSynthesis) {
+                window.speechSynthesis.cancel();
+            }
+        }
+
+        // 1文の再生が終わったら次の文へ進む(最後なら完了)
+        function finishSentence(index, token) {
+            if (token !== playToken) return;
+            if (index + 1 < sentences.length) {
+                playFrom(index + 1);
+                return;
+            }
+            audio = null;
+            currentIndex = 0;
+            setPlayingUI(false);
+            highlight(-1);
+            updateProgress();
+            showStatus('再生が完了しました');
+        }
+
+        // サーバーの音声が取れない文は、ブラウザの音声合成で読み上げる
+        function speakFallback(index, token) {
+            if (!window.speechSynthesis) {
+                showStatus(`${index + 1}文目の音声を取得できませんでした`, true);
+                finishSentence(index, token);
+                return;
+            }
+            showStatus(`${index + 1}文目はブラウザの音声で読み上げます`);
+            const utterance = new SpeechSynthesisUtterance(spoken[index]);
+            utterance.lang = 'en-US';
+            utterance.rate = currentSpeed;
+            utterance.onend = () => finishSentence(index, token);
+            utterance.onerror = () => finishSentence(index, token);
+            window.speechSynthesis.speak(utterance);
+        }
+
+        function playFrom(index) {
+            halt();
+            const token = playToken;
+            currentIndex = index;
+            updateProgress();
+            highlight(index);
+            setPlayingUI(true);
+
+            const clip = new Audio(urls[index]);
+            clip.playbackRate = currentSpeed;
+            audio = clip;
+
+            clip.onplaying = () => {
+                if (token !== playToken) return;
+                retries[index] = 0;
+                hideStatus();
+                sentenceSpans[index].classList.remove('pending');
+                // 次の文を先に読み込んでおく(合成済みならすぐに続けて再生できる)
+                if (index + 1 < urls.length) {
+                    new Audio(urls[index + 1]).preload = 'auto';
+                }
+            };
+
+            clip.onended = () => finishSentence(index, token);
+
+            // まだ合成されていない文(404)は、少し待って取りに行き直す
+            clip.onerror = () => {
+                if (token !== playToken) return;
+                retries[index] = (retries[index] || 0) + 1;
+                if (retries[index] > MAX_RETRIES) {
+                    audio = null;
+                    sentenceSpans[index].classList.remove('pending');
+                    speakFallback(index, token);
+                    return;
+                }
+                sentenceSpans[index].classList.add('pending');
+                showStatus(`${index + 1}文目の音声を合成中です...`);
+                retryTimer = setTimeout(() => {
+                    if (token === playToken) playFrom(index);
+                }, RETRY_MS);
+            };
+
+            clip.play().catch(() => {});
+        }
+
+        function stopPlayback() {
+            halt();
+            setPlayingUI(false);
+            showStatus(`${currentIndex + 1}文目で停止しました(続きから再生できます)`);
+        }
+
+        function seekTo(index) {
+            if (sentences.length === 0) return;
+            index = Math.max(0, Math.min(index, sentences.length - 1));
+            if (isPlaying) {
+                playFrom(index);
+                return;
+            }
+            currentIndex = index;
+            highlight(index);
+            updateProgress();
+            setPlayingUI(false);
+        }
+
+        speedButtons.forEach(btn => {
+            btn.addEventListener('click', (e) => {
+                speedButtons.forEach(b => b.classList.remove('active'));
+                e.target.classList.add('active');
+                currentSpeed = parseFloat(e.target.dataset.speed);
+                if (audio) {
+                    audio.playbackRate = currentSpeed;
+                }
+            });
+        });
+
+        playButton.addEventListener('click', () => {
+            if (isPlaying) {
+                stopPlayback();
+            } else if (sentences.length === 0) {
+                showStatus('再生する文がありません', true);
+            } else {
+                playFrom(currentIndex);
+            }
+        });
+
+        document.getElementById('prevButton').addEventListener('click', () => seekTo(currentIndex - 1));
+        document.getElementById('nextButton').addEventListener('click', () => seekTo(currentIndex + 1));
+        document.getElementById('restartButton').addEventListener('click', () => seekTo(0));
+
+        renderSentences();
+    })();
+</script>
+"""
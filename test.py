@@ -1,10 +1,11 @@
 import streamlit as st
 import json
-import re
 import hmac
-from datetime import datetime
-from google import genai
-from google.genai import types
+import html
+import os
+import pickle
+import time
+import uuid
 
 # ページ設定
 st.set_page_config(
@@ -45,41 +46,58 @@ def check_password():
 if not check_password():
     st.stop()
 
+# ここから下で使うモジュール。ログイン画面を Streamlit だけで素早く表示できるよう、
+# パスワード確認の後で読み込む(2回目以降の再実行では読み込み済みのものが使われる)
+from datetime import datetime
+from assets import APP_CSS, FOOTER_MARKDOWN, USAGE_MARKDOWN
+from blob_store import BlobStore, blob_digest
+from gemini_client import create_client
+from prompts import (
+    STUDY_GUIDE_PROMPT_VERSION,
+    STUDY_GUIDE_SECTIONS,
+    THEME_EXTRACTION_FAILED,
+    PassageResult,
+    build_passage_prompt,
+    build_rewrite_prompt,
+    build_study_guide_section_prompt,
+    build_theme_prompt,
+    parse_theme_and_gender,
+    template_hash,
+    validate_passage_result,
+)
+from long_passage import generate_long_passage
+from metrics import MetricsRecorder
+from prefetch import PassagePool
+from scheduler import QuotaExceeded, RequestScheduler, request_key
+from guide_cache import GuideCache
+from library import PassageLibrary
+from theme_store import ThemeStore
+from vocab import LEVEL_RANKS, WORD_LIST_LEVELS, VocabularyIndex, profile_passage
+from hiding import HIDE_MODES, WordHider
+from quiz import build_quiz, diff_dictation
+from speech_player import PLAYER_HEIGHT, build_clip_player_html, build_player_html, sentence_spans, split_sentences
+from tts import (
+    CLIP_URL_PREFIX,
+    DEFAULT_RATE,
+    MIME_TYPES,
+    RATES,
+    VOICES,
+    AudioRenderer,
+    ClipCache,
+    TTSError,
+    create_tts_backend,
+)
+
+# 1回の再実行にかかった時間の計測開始
+script_start = time.perf_counter()
+
 # カスタム CSS
-st.markdown("""
-<style>
-    .stButton>button {
-        width: 100%;
-        margin-top: 10px;
-    }
-    .speaker-info {
-        padding: 10px;
-        background-color: #e8f0fe;
-        border-radius: 5px;
-        margin: 10px 0;
-    }
-    .text-display {
-        padding: 20px;
-        background-color: #f8f9fa;
-        border-radius: 8px;
-        border: 2px solid #e8eaed;
-        font-size: 16px;
-        line-height: 1.8;
-        min-height: 200px;
-    }
-    .study-guide {
-        padding: 20px;
-        background-color: #fff9e6;
-        border-radius: 8px;
-        border: 2px solid #ffd966;
-        margin-top: 20px;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # セッション状態の初期化
-if 'generated_text' not in st.session_state:
-    st.session_state.generated_text = ""
+if 'passage_key' not in st.session_state:
+    # 文章そのものは共有のブロブストアに置き、セッションにはキーだけを持つ
+    st.session_state.passage_key = None
 if 'speaker_gender' not in st.session_state:
     st.session_state.speaker_gender = "neutral"
 if 'show_original_text' not in st.session_state:
@@ -89,24 +107,165 @@ if 'text_visible' not in st.session_state:
 if 'theme_log' not in st.session_state:
     st.session_state.theme_log = []
 if 'study_guide' not in st.session_state:
-    st.session_state.study_guide = ""
+    # 項目 → HTML のブロブストアのキー(STUDY_GUIDE_SECTIONS の項目ごと)
+    st.session_state.study_guide = {}
 if 'show_study_guide' not in st.session_state:
     st.session_state.show_study_guide = False
+if 'generation_stats' not in st.session_state:
+    st.session_state.generation_stats = None
+if 'session_id' not in st.session_state:
+    # スケジューラーで公平に順番を回すためのセッション識別子
+    st.session_state.session_id = uuid.uuid4().hex
+if 'lexical_profile' not in st.session_state:
+    st.session_state.lexical_profile = None
+if 'lexical_history' not in st.session_state:
+    st.session_state.lexical_history = []
+if 'seen_passages' not in st.session_state:
+    # このセッションで出題したライブラリの文章 ID(ライブラリから出題するときに除外する)
+    st.session_state.seen_passages = set()
+
+# 計測値の記録(プロセス内で全セッション共有)
+@st.cache_resource
+def get_metrics():
+    return MetricsRecorder(
+        st.secrets.get("METRICS_PATH", ".cache/metrics.jsonl"),
+        capacity=int(st.secrets.get("METRICS_BUFFER_SIZE", 5000)),
+    )
+
+metrics = get_metrics()
+
+# 文章・学習ガイドなど大きな文字列の置き場(プロセス内で全セッション共有)
+@st.cache_resource
+def get_blob_store():
+    return BlobStore(
+        st.secrets.get("BLOB_STORE_DIR", ".cache/blobs"),
+        memory_limit=int(st.secrets.get("BLOB_MEMORY_LIMIT_MB", 64)) * 1024 * 1024,
+        disk_limit=int(st.secrets.get("BLOB_DISK_LIMIT_MB", 1024)) * 1024 * 1024,
+    )
+
+blob_store = get_blob_store()
+
+def get_generated_text():
+    """現在の文章(無い、またはブロブストアから削除済みなら空文字)"""
+    if st.session_state.passage_key is None:
+        return ""
+    return blob_store.get(st.session_state.passage_key, "")
+
+def session_state_bytes():
+    """このセッションの状態の大きさ(pickle できる値の合計バイト数)"""
+    total = 0
+    for value in st.session_state.to_dict().values():
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            pass
+    return total
 
 # Gemini API初期化
 @st.cache_resource
 def initialize_gemini():
     try:
+        # 環境変数 GEMINI_BACKEND=fake(または secrets)でネットワーク不要のフェイクバックエンドを使う
+        backend = os.environ.get("GEMINI_BACKEND") or st.secrets.get("GEMINI_BACKEND", "genai")
+        if backend == "fake":
+            return create_client(
+                "fake",
+                fake_latency=float(os.environ.get("GEMINI_FAKE_LATENCY", st.secrets.get("GEMINI_FAKE_LATENCY", 0.0))),
+                observer=metrics.observe_call
+            )
+        # GEMINI_BACKEND=replay は録画した応答を返す(API キー不要)、record は本物の応答を録画する
+        cassette_path = os.environ.get("GEMINI_CASSETTE") or st.secrets.get("GEMINI_CASSETTE", ".cache/cassette.sqlite3")
+        if backend == "replay":
+            return create_client(
+                "replay",
+                cassette_path=cassette_path,
+                replay_latency=os.environ.get("GEMINI_REPLAY_LATENCY") or st.secrets.get("GEMINI_REPLAY_LATENCY"),
+                observer=metrics.observe_call
+            )
         # Streamlit Cloudのsecretsから取得
         api_key = st.secrets["GEMINI_API_KEY"]
-        client = genai.Client(api_key=api_key)
-        return client
+        gemini = create_client(
+            "record" if backend == "record" else "genai",
+            api_key=api_key,
+            cassette_path=cassette_path,
+            max_concurrency=int(st.secrets.get("GEMINI_MAX_CONCURRENCY", 8)),
+            observer=metrics.observe_call
+        )
+        # SDK の読み込みはログイン直後にバックグラウンドで済ませ、画面の表示を待たせない
+        gemini.warm_up()
+        return gemini
     except Exception as e:
         st.error(f"Gemini APIの初期化に失敗しました: {str(e)}")
         st.stop()
 
 client = initialize_gemini()
 
+# モデル呼び出しのスケジューラー(プロセス内で全セッション共有)
+@st.cache_resource
+def get_scheduler():
+    return RequestScheduler(
+        rpm=dict(st.secrets.get("MODEL_RPM", {})),
+        workers=int(st.secrets.get("GEMINI_MAX_CONCURRENCY", 8)),
+        session_quota=int(st.secrets.get("SESSION_QUOTA_PER_HOUR", 60)),
+        # 学習ガイドの全項目を一度に依頼できるだけのバーストを許す
+        burst=int(st.secrets.get("MODEL_BURST", len(STUDY_GUIDE_SECTIONS))),
+    )
+
+scheduler = get_scheduler()
+
+# 先読みなどバックグラウンド処理のセッション識別子
+BACKGROUND_SESSION = "__background__"
+
+def wait_for_ticket(ticket, label):
+    """結果が出るまで待ち、順番待ちの間は待ち順を表示する"""
+    status = st.empty()
+    try:
+        while not ticket.wait(0.2):
+            position = ticket.position()
+            if position:
+                status.info(f"⏳ {label}(順番待ち: {position} 番目)")
+            else:
+                status.info(f"⏳ {label}...")
+        return ticket.result()
+    finally:
+        status.empty()
+        if ticket.queue_wait() is not None:
+            metrics.record("queue_wait", ticket.queue_wait())
+
+def submit_model_call(model, prompt, schema=None, operation=None, session_id=None, background=False,
+                      coalesce=False):
+    """モデル呼び出しをスケジューラーに依頼してチケットを返す
+    
+    coalesce=True なら、同じリクエストが他のセッションで待機中・実行中のときその結果を共有する。
+    結果が入力だけで決まる呼び出し(テーマ抽出・書き換え)に限ること。文章の生成は
+    同じプロンプトでも毎回別の文章が要るので、まとめない。
+    """
+    return scheduler.submit(
+        session_id or st.session_state.session_id,
+        model,
+        lambda: client.generate(model, prompt, schema=schema, operation=operation),
+        key=request_key(model, prompt, schema) if coalesce else None,
+        background=background,
+    )
+
+def call_model(model, prompt, schema=None, label="生成中", operation=None, coalesce=False):
+    """スケジューラー経由でモデルを呼び出し、待ち順を表示しながら結果を待つ"""
+    return wait_for_ticket(
+        submit_model_call(model, prompt, schema=schema, operation=operation, coalesce=coalesce), label
+    )
+
+def call_model_background(model, prompt, schema=None, operation=None, coalesce=False):
+    """バックグラウンド優先度でモデルを呼び出す(st.* を使わないので別スレッドから呼べる)"""
+    return submit_model_call(
+        model, prompt, schema=schema, operation=operation, session_id=BACKGROUND_SESSION, background=True,
+        coalesce=coalesce
+    ).result()
+
+# CEFR語彙インデックス(同梱の単語リストから1プロセスにつき1回だけ構築し、全セッションで共有)
+@st.cache_resource
+def get_vocabulary_index():
+    return VocabularyIndex.from_directory(os.path.dirname(os.path.abspath(__file__)))
+
 # ログ機能(セッションベース)
 def save_theme_log(theme_entry):
     """セッションステートにログを保存"""
@@ -122,384 +281,950 @@ def get_recent_themes(limit=5):
     recent_logs = st.session_state.theme_log[-limit:] if len(st.session_state.theme_log) >= limit else st.session_state.theme_log
     return [log_entry["theme"] for log_entry in recent_logs]
 
-def extract_theme_and_gender(text):
-    try:
-        prompt = f"""
-        以下の英語文章について2つのことを分析してください:
+# テーマ履歴(永続化し、全セッションで共有)
+@st.cache_resource
+def get_theme_store():
+    return ThemeStore(
+        st.secrets.get("THEME_STORE_PATH", ".cache/themes.sqlite3"),
+        max_items=int(st.secrets.get("THEME_INDEX_MAX_ITEMS", 50000)),
+    )
 
-        1. 主要なテーマやトピックを簡潔に日本語で要約してください(1-2文)
-        2. この文章の話者や主人公の性別を判定してください(male/female/neutral)
+theme_store = get_theme_store()
 
-        文章:
-        {text}
+# プロンプトで避けるテーマの件数
+PROMPT_THEME_COUNT = 6
 
-        以下の形式で回答してください:
-        テーマ: [テーマの説明]
-        性別: [male/female/neutral]
-        """
-        
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-lite',
-            contents=prompt
+def get_prompt_themes(recent_themes=None):
+    """プロンプトで避けるテーマ(このセッションの直近のテーマ + 全体の履歴から互いに似ていないもの)"""
+    if recent_themes is None:
+        recent_themes = get_recent_themes(limit=3)
+    return theme_store.sample_diverse(k=PROMPT_THEME_COUNT, seed_themes=recent_themes)
+
+# 生成した文章のライブラリ(永続化し、全セッションで共有)
+@st.cache_resource
+def get_passage_library():
+    return PassageLibrary(st.secrets.get("PASSAGE_LIBRARY_PATH", ".cache/passages.sqlite3"))
+
+passage_library = get_passage_library()
+
+def extract_theme_and_gender(text):
+    try:
+        response = call_model(
+            'gemini-2.0-flash-lite', build_theme_prompt(text), label="テーマを分析中", operation="extract_theme",
+            coalesce=True
         )
-        result = response.text.strip()
-        
-        theme = "テーマ抽出に失敗しました"
-        gender = "neutral"
-        
-        lines = result.split('\n')
-        for line in lines:
-            if line.startswith('テーマ:'):
-                theme = line.replace('テーマ:', '').strip()
-            elif line.startswith('性別:'):
-                gender_text = line.replace('性別:', '').strip().lower()
-                if gender_text in ['male', 'female', 'neutral']:
-                    gender = gender_text
-        
-        return theme, gender
+        return parse_theme_and_gender(response.text)
     except Exception as e:
         st.warning(f"テーマ・性別抽出エラー: {e}")
-        return "テーマ抽出に失敗しました", "neutral"
+        return THEME_EXTRACTION_FAILED, "neutral"
+
+# 学習ガイドのディスクキャッシュ(プロセス内で全セッション共有)
+@st.cache_resource
+def get_guide_cache():
+    return GuideCache(
+        st.secrets.get("GUIDE_CACHE_PATH", ".cache/study_guides.sqlite3"),
+        max_entries=int(st.secrets.get("GUIDE_CACHE_MAX_ENTRIES", 1000)),
+    )
+
+guide_cache = get_guide_cache()
+
+def study_guide_cache_key(text, cefr_level, section):
+    # プロンプトのテンプレートを書き換えたら、古いガイドは自動的に使われなくなる
+    version = f"{STUDY_GUIDE_PROMPT_VERSION}:{template_hash('study_guide_section')}"
+    return GuideCache.make_key(text, cefr_level, version, section)
+
+def submit_study_guide_section(text, cefr_level, section, background=False):
+    """学習ガイドの1項目の生成をスケジューラーに依頼してチケットを返す(結果は応答そのもの)
+    
+    結果はジョブの中でキャッシュに保存するため、待っている画面が再実行で
+    離れても無駄にならない。先読み(background=True)中の同じ依頼に対して
+    ボタンから依頼すると、スケジューラーがそのジョブに相乗りさせる。
+    """
+    model = 'gemini-2.0-flash'
+    prompt = build_study_guide_section_prompt(text, cefr_level, section)
+    
+    def fetch_section():
+        operation = f"speculative_guide:{section}" if background else f"study_guide:{section}"
+        response = client.generate(model, prompt, operation=operation)
+        guide_cache.put(study_guide_cache_key(text, cefr_level, section), response.text.strip())
+        return response
+    
+    return scheduler.submit(
+        st.session_state.session_id, model, fetch_section,
+        key=request_key(model, prompt), background=background
+    )
+
+def _usage_tokens(ticket):
+    """完了したチケットの入出力トークン数(取り消し・失敗なら 0)"""
+    try:
+        usage = ticket.result(timeout=0).usage
+    except Exception:
+        return 0
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+def _count_speculation(ticket, outcome):
+    """先読みした1項目の結末(hit / wasted / cancelled)とトークン数を記録する
+    
+    まだ実行中なら、終わった時点で記録する。
+    """
+    def record():
+        metrics.increment("guide_speculation_total", outcome=outcome)
+        metrics.increment("guide_speculation_tokens_total", _usage_tokens(ticket), outcome=outcome)
+    
+    ticket.add_done_callback(record)
+
+def start_guide_speculation(text, cefr_level):
+    """生成した文章の学習ガイドをバックグラウンドで先に作っておく(先読みモード)"""
+    sections = st.session_state.get("guide_sections", list(STUDY_GUIDE_SECTIONS))
+    tickets = {
+        section: submit_study_guide_section(text, cefr_level, section, background=True)
+        for section in sections
+        if guide_cache.get(study_guide_cache_key(text, cefr_level, section)) is None
+    }
+    st.session_state.guide_speculation = {
+        "text_key": blob_digest(text), "cefr_level": cefr_level, "tickets": tickets, "used": set()
+    }
+
+def discard_guide_speculation():
+    """先読み中の学習ガイドを破棄する(まだ始まっていない依頼は取り消す)"""
+    speculation = st.session_state.pop("guide_speculation", None)
+    if not speculation:
+        return
+    for section, ticket in speculation["tickets"].items():
+        if section in speculation["used"]:
+            continue
+        _count_speculation(ticket, "cancelled" if ticket.cancel() else "wasted")
+
+def claim_guide_speculation(text, cefr_level, sections):
+    """ボタンで依頼された項目のうち、先読み済み・先読み中のものを的中として数える"""
+    speculation = st.session_state.get("guide_speculation")
+    if not speculation or speculation["text_key"] != blob_digest(text) or speculation["cefr_level"] != cefr_level:
+        return
+    for section in sections:
+        ticket = speculation["tickets"].get(section)
+        if ticket is not None and section not in speculation["used"] and not ticket.cancelled():
+            speculation["used"].add(section)
+            _count_speculation(ticket, "hit")
+
+def request_study_guide(text, cefr_level, sections):
+    """学習ガイドの項目を依頼する
+    
+    キャッシュにある項目はすぐセッションに反映し、無い項目は並行して依頼して
+    {項目: チケット} を返す(render_study_guide が届いた順に表示する)。
+    """
+    claim_guide_speculation(text, cefr_level, sections)
+    guide = st.session_state.study_guide
+    tickets = {}
+    for section in sections:
+        if section in guide or section in tickets:
+            continue
+        cached_section = guide_cache.get(study_guide_cache_key(text, cefr_level, section))
+        if cached_section is not None:
+            guide[section] = blob_store.put(cached_section)
+        else:
+            tickets[section] = submit_study_guide_section(text, cefr_level, section)
+    st.session_state.show_study_guide = True
+    return tickets
+
+def request_study_guide_section(section):
+    """項目ごとの作成ボタンのコールバック(次の再実行で依頼する)"""
+    st.session_state.setdefault("guide_requested", []).append(section)
+
+@metrics.timed("render:study_guide")
+def render_study_guide(tickets):
+    """学習ガイドを項目順に表示する
+    
+    依頼中の項目は枠だけ先に用意し、届いた順に埋める。
+    まだ作っていない項目には個別の作成ボタンを出す。
+    """
+    guide = st.session_state.study_guide
+    slots = {}
+    for section, spec in STUDY_GUIDE_SECTIONS.items():
+        section_html = blob_store.get(guide[section]) if section in guide else None
+        if section_html is None:
+            # ブロブストアから削除済みなら、まだ作っていない項目として扱う
+            guide.pop(section, None)
+        if section_html is not None:
+            st.html(section_html)
+        elif section in tickets:
+            slots[section] = st.empty()
+            slots[section].info(f"⏳ {spec['title']} を作成中...")
+        else:
+            st.button(
+                f"＋ {spec['title']} を作成",
+                key=f"guide_section_{section}",
+                on_click=request_study_guide_section,
+                args=(section,)
+            )
+    
+    pending = dict(tickets)
+    while pending:
+        for section, ticket in list(pending.items()):
+            title = STUDY_GUIDE_SECTIONS[section]["title"]
+            if not ticket.wait(0):
+                position = ticket.position()
+                if position:
+                    slots[section].info(f"⏳ {title} を作成中...(順番待ち: {position} 番目)")
+                continue
+            del pending[section]
+            try:
+                section_html = ticket.result().text.strip()
+                guide[section] = blob_store.put(section_html)
+                slots[section].html(section_html)
+            except Exception as e:
+                slots[section].error(f"{title} の生成に失敗しました: {str(e)}")
+        if pending:
+            time.sleep(0.2)
+
+# 単語隠しエンジンは文章ごとに1つ作り、同じ文章を表示している全セッションで共有する
+@st.cache_resource(max_entries=64, show_spinner=False)
+def shared_word_hider(text_key, _text):
+    return WordHider(_text)
+
+def get_word_hider(text):
+    """文章ごとの単語隠しエンジン(語の位置と隠した結果を保持)"""
+    return shared_word_hider(blob_digest(text), text)
+
+def hide_words(text):
+    """サイドバーで選んだモードで単語を隠す"""
+    hider = get_word_hider(text)
+    mode = st.session_state.get("hide_mode", "endings")
+    if mode == "above_level":
+        return hider.mask(
+            mode,
+            vocabulary_index=get_vocabulary_index(),
+            level_rank=LEVEL_RANKS[st.session_state.get("hide_level", "A2")]
+        )
+    if mode == "every_nth":
+        return hider.mask(mode, n=st.session_state.get("hide_every_n", 3))
+    if mode == "random":
+        return hider.mask(
+            mode,
+            ratio=st.session_state.get("hide_ratio", 0.3),
+            seed=st.session_state.get("hide_seed", 0)
+        )
+    return hider.mask(mode)
+
+def generate_structured_passage(cefr_level, word_count, recent_themes, background=False):
+    """文章・テーマ・性別を1回の構造化出力呼び出しで生成する
+    
+    応答がスキーマに合致しない場合は None を返す(呼び出し側で2回呼び出し方式にフォールバック)。
+    background=True なら st.* を使わないため、先読みプールのバックグラウンドスレッドからも呼び出せる。
+    """
+    prompt = build_passage_prompt(cefr_level, word_count, recent_themes, structured=True)
+    if background:
+        response = call_model_background(
+            'gemini-2.0-flash-lite', prompt, schema=PassageResult, operation="prefetch_passage"
+        )
+    else:
+        response = call_model(
+            'gemini-2.0-flash-lite', prompt, schema=PassageResult, label="文章を生成中",
+            operation="generate_structured"
+        )
+    return validate_passage_result(response)
+
+LEXICAL_ACTIONS = {"rewrite": "該当語だけ書き換える", "flag": "警告のみ"}
 
-def generate_study_guide(text, cefr_level):
-    """学習ガイドを生成"""
-    with st.spinner('学習ガイドを作成中...'):
+# 先読みプール(セッションの設定が無い)で書き換えるときのしきい値
+DEFAULT_LEXICAL_THRESHOLD = 0.9
+
+def rewrite_off_level_words(text, cefr_level, off_level_words, background=False):
+    """目標レベルを超える語だけを置き換えるよう書き換えを依頼"""
+    prompt = build_rewrite_prompt(text, cefr_level, off_level_words)
+    if background:
+        response = call_model_background(
+            'gemini-2.0-flash-lite', prompt, operation="prefetch_lexical_rewrite", coalesce=True
+        )
+    else:
+        response = call_model(
+            'gemini-2.0-flash-lite', prompt, label="難しい語を書き換え中", operation="lexical_rewrite",
+            coalesce=True
+        )
+    return response.text.strip()
+
+@metrics.timed("step:lexical_check")
+def check_lexical_level(text, cefr_level, allow_rewrite=True, background=False):
+    """文章の語彙レベルをローカルで検査する
+    
+    目標レベル以下の語の割合がしきい値を下回った場合、設定に応じて
+    該当語だけを1回書き換えるか、警告対象として印を付ける。(文章, プロファイル) を返す。
+    書き換えはモデル呼び出しなので、文章を生成した直後(表示する前)にだけ行う。
+    allow_rewrite=False なら書き換えず、印を付けるだけにする(表示済み・ライブラリの文章用)。
+    background=True なら st.* を使わず既定のしきい値で書き換える(先読みプール用)。
+    """
+    index = get_vocabulary_index()
+    profile = profile_passage(index, text, cefr_level)
+    if background:
+        threshold, action = DEFAULT_LEXICAL_THRESHOLD, "rewrite"
+    else:
+        threshold = st.session_state.get("lexical_threshold", DEFAULT_LEXICAL_THRESHOLD)
+        action = st.session_state.get("lexical_action", "rewrite")
+    rewritten = False
+    
+    if allow_rewrite and profile["coverage"] < threshold and profile["off_level_words"] and action == "rewrite":
         try:
-            # CEFRレベルマッピング
-            level_map = {"A0": "入門", "A1": "初級", "A2": "初級上", "B1": "中級", "B2": "中級上", "C1": "上級"}
-            current_level = level_map.get(cefr_level, cefr_level)
-            
-            # 一つ下のレベルを想定
-            lower_levels = {"A1": "A0", "A2": "A1", "B1": "A2", "B2": "B1", "C1": "B2"}
-            target_level = lower_levels.get(cefr_level, "A1")
-            target_level_jp = level_map.get(target_level, target_level)
-            
-            prompt = f"""
-以下の英語文章について、CEFR {target_level}レベル({target_level_jp})の学習者向けの教育・解説用テキストをCSS組み込みのHTML形式で作成してください。
-※ デザインは Google を意識してください。
-※ 重要箇所には適度に配色を施してください。
-
-文章:
-{text}
-
-以下の構成で、分かりやすく丁寧に解説してください:
-
-## 📚 文章の概要
-- この文章の主題と内容を簡単に説明
-
-## 🔤 重要単語・フレーズ
-- 重要な単語やフレーズをピックアップ
-- 各単語について:
-  - **単語**: 意味(日本語)
-  - 例文(できれば元の文章から)
-  - 使い方のヒント
-
-## 📖 文法/構造
-- この文章の各段落を構築する文の構文解析を実施して解説してください。
-- 各段落について:
-  - 各文の構造(SVOCM分解)
-  - 各文の関係性
-  - 文構造の読み方
-  - 各文の解説毎に改行を挿入
-
-## 💡 理解のコツ
-- この文章を理解するためのポイントや背景知識
-- 文化的な背景や文脈の説明
-
-## ✍️ 練習問題
-- 内容理解を確認する簡単な質問を2-3問
-- 単語や文法の応用練習
-
-全て日本語で、初学者にも分かりやすい表現を使ってください。
-"""
-            
-            response = client.models.generate_content(
-                model='gemini-2.0-flash',
-                contents=prompt
+            rewritten_text = rewrite_off_level_words(
+                text, cefr_level, profile["off_level_words"], background=background
             )
-            
-            study_guide = response.text.strip()
-            st.session_state.study_guide = study_guide
-            st.session_state.show_study_guide = True
-            
+            rewritten_profile = profile_passage(index, rewritten_text, cefr_level)
+            if rewritten_text and rewritten_profile["coverage"] > profile["coverage"]:
+                text, profile, rewritten = rewritten_text, rewritten_profile, True
         except Exception as e:
-            st.error(f"学習ガイドの生成に失敗しました: {str(e)}")
+            if not background:
+                st.warning(f"語彙の書き換えに失敗しました: {e}")
+    
+    profile["rewritten"] = rewritten
+    profile["flagged"] = profile["coverage"] < threshold
+    return text, profile
 
-def hide_word_endings(text):
-    def hide_word(match):
-        word = match.group(0)
-        if len(word) <= 2:
-            return word
-        else:
-            return word[:2] + '-' * (len(word) - 2)
+def commit_generated_text(generated_text, cefr_level, word_count, theme, gender, lexical_profile, text_visible=False):
+    """生成が完了した文章をログ・ライブラリに保存してセッションに反映
+    
+    モデルは呼ばない(語彙の検査・書き換えとテーマの抽出は生成する側で済ませておく)。
+    """
+    # 前の文章のために先読みしていた学習ガイドは不要になる
+    discard_guide_speculation()
+    
+    preview = generated_text[:100] + "..." if len(generated_text) > 100 else generated_text
+    
+    # 過去の文章(全利用者分)との近似重複をローカルで判定
+    duplicates = []
+    if theme != THEME_EXTRACTION_FAILED:
+        duplicates = theme_store.find_near_duplicates(theme, preview)
+        theme_store.add(theme, preview, cefr_level)
+    if duplicates:
+        similarity, similar_theme = duplicates[0]
+        st.info(f"過去の文章と似たテーマです(類似度 {similarity:.0%}): {similar_theme}")
+    
+    passage_id = passage_library.add(generated_text, cefr_level, word_count, theme, gender, lexical_profile)
+    show_passage(
+        passage_id, generated_text, cefr_level, word_count, theme, gender, lexical_profile,
+        text_visible=text_visible, near_duplicate_of=duplicates[0][1] if duplicates else None
+    )
+
+def show_passage(passage_id, text, cefr_level, word_count, theme, gender, lexical_profile,
+                 text_visible=False, near_duplicate_of=None, source="generated"):
+    """文章をテーマログ・語彙レベルの履歴・セッション状態に反映する"""
+    preview = text[:100] + "..." if len(text) > 100 else text
+    
+    # ログに保存
+    theme_entry = {
+        "timestamp": datetime.now().isoformat(),
+        "cefr_level": cefr_level,
+        "word_count": word_count,
+        "theme": theme,
+        "speaker_gender": gender,
+        "lexical_coverage": lexical_profile["coverage"],
+        "near_duplicate_of": near_duplicate_of,
+        "source": source,
+        "passage_id": passage_id,
+        "text_preview": preview
+    }
+    save_theme_log(theme_entry)
+    
+    # 語彙レベルの統計(グラフ用に直近50件を保持)
+    st.session_state.lexical_profile = lexical_profile
+    st.session_state.lexical_history.append({
+        "timestamp": theme_entry["timestamp"],
+        "cefr_level": cefr_level,
+        "coverage": lexical_profile["coverage"],
+        "rewritten": lexical_profile["rewritten"],
+        **lexical_profile["level_shares"],
+    })
+    st.session_state.lexical_history = st.session_state.lexical_history[-50:]
+    
+    st.session_state.seen_passages.add(passage_id)
+    st.session_state.passage_key = blob_store.put(text)
+    st.session_state.speaker_gender = gender
+    st.session_state.text_visible = text_visible
+    st.session_state.show_original_text = True
+    st.session_state.study_guide = {}
+    st.session_state.show_study_guide = False
+    st.session_state.generation_stats = None
+    
+    if st.session_state.get("speculative_guide"):
+        start_guide_speculation(text, cefr_level)
+
+def show_library_passage(entry):
+    """ライブラリの文章をそのまま出題する(モデルは呼ばない)"""
+    discard_guide_speculation()
+    text, lexical_profile = check_lexical_level(entry["passage"], entry["cefr_level"], allow_rewrite=False)
+    show_passage(
+        entry["id"], text, entry["cefr_level"], entry["word_count"], entry["theme"],
+        entry["speaker_gender"], lexical_profile, source="library"
+    )
+
+@metrics.timed("step:serve_library")
+def serve_library_passage(cefr_level, word_count):
+    """レベルと語数が合い、このセッションでまだ出題していない文章をライブラリから出題する"""
+    entry = passage_library.find(cefr_level, word_count, exclude_ids=st.session_state.seen_passages)
+    if entry is None:
+        return False
+    show_library_passage(entry)
+    return True
+
+def load_library_passage(passage_id):
+    """検索結果から選んだ文章を出題する(on_click コールバック)"""
+    entry = passage_library.get(passage_id)
+    if entry is not None:
+        show_library_passage(entry)
+
+def report_generation_failure(error, cefr_level, word_count):
+    """生成の失敗を表示し、API が使えない間はライブラリの文章で代替する"""
+    st.error(f"テキスト生成に失敗しました: {str(error)}")
+    if serve_library_passage(cefr_level, word_count):
+        st.info("📚 代わりにライブラリの文章を出題しました")
+
+def _prefetch_passage(cefr_level, word_count, avoid_themes):
+    """先読みプール用の文章生成(バックグラウンドスレッドで実行)
+    
+    語彙の検査と書き換えもここで済ませ、出題時にはモデルを呼ばない。
+    """
+    result = generate_structured_passage(cefr_level, word_count, get_prompt_themes(avoid_themes), background=True)
+    if result is None:
+        return None
+    entry = result.model_dump()
+    entry["passage"], lexical_profile = check_lexical_level(entry["passage"], cefr_level, background=True)
+    entry["lexical_rewritten"] = lexical_profile["rewritten"]
+    return entry
+
+# 先読みプール(プロセス内で全セッション共有)
+@st.cache_resource
+def get_passage_pool():
+    return PassagePool(
+        _prefetch_passage,
+        depth=int(st.secrets.get("PREFETCH_DEPTH", 2)),
+        ttl=int(st.secrets.get("PREFETCH_TTL_SECONDS", 1800)),
+    )
+
+passage_pool = get_passage_pool()
+# 既定の組み合わせ (A2 / 100語) は常に用意しておく
+passage_pool.warm("A2", 100)
+
+@metrics.timed("step:serve_prefetched")
+def serve_prefetched_passage(cefr_level, word_count):
+    """先読み済みの文章があれば即座にセッションへ反映する"""
+    entry = passage_pool.get(cefr_level, word_count, get_prompt_themes())
+    if entry is None:
+        return False
     
-    pattern = r'\b[a-zA-Z]+(?:\'[a-zA-Z]+)?\b'
-    return re.sub(pattern, hide_word, text)
+    # 書き換えは先読み時に済んでいるので、このセッションのしきい値で印を付け直すだけ
+    text, lexical_profile = check_lexical_level(entry["passage"], cefr_level, allow_rewrite=False)
+    lexical_profile["rewritten"] = entry.get("lexical_rewritten", False)
+    commit_generated_text(
+        text, cefr_level, word_count, entry["theme"], entry["speaker_gender"], lexical_profile
+    )
+    st.success("文章の生成が完了しました!")
+    return True
 
+@metrics.timed("step:generate_text")
 def generate_text(cefr_level, word_count):
-    with st.spinner('文章を生成中...'):
+    try:
+        # 文章・テーマ・性別を1回の呼び出しで取得
+        result = None
         try:
-            recent_themes = get_recent_themes()
-            
-            base_prompt = f"""
-            Create an English text passage suitable for an English language learner at CEFR level {cefr_level}.
-            The passage should be approximately {word_count} words long.
-            The content should be interesting, educational, and appropriate for language learning.
-            """
-            
-            if recent_themes:
-                themes_text = "\n".join([f"- {theme}" for theme in recent_themes])
-                avoidance_prompt = f"""
-                
-                IMPORTANT: Please avoid creating content that is similar to these recently used themes:
-                {themes_text}
-                
-                Choose a completely different topic or approach to ensure variety and prevent repetition.
-                """
-                prompt = base_prompt + avoidance_prompt
-            else:
-                prompt = base_prompt
-            
-            prompt += "\n\nOnly return the text passage without any additional explanations or metadata."
-            
-            response = client.models.generate_content(
-                model='gemini-2.0-flash-lite',
-                contents=prompt
+            result = generate_structured_passage(cefr_level, word_count, get_prompt_themes())
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            st.warning(f"構造化出力での生成に失敗したため、通常の生成に切り替えます: {e}")
+        
+        if result is not None:
+            generated_text, lexical_profile = check_lexical_level(result.passage, cefr_level)
+            commit_generated_text(
+                generated_text, cefr_level, word_count, result.theme, result.speaker_gender, lexical_profile
             )
-            generated_text = response.text.strip()
+        else:
+            # フォールバック: 文章生成 → テーマ・性別抽出の2回呼び出し
+            prompt = build_passage_prompt(cefr_level, word_count, get_prompt_themes())
             
-            # テーマと性別を抽出
+            response = call_model('gemini-2.0-flash-lite', prompt, label="文章を生成中", operation="generate_text")
+            generated_text, lexical_profile = check_lexical_level(response.text.strip(), cefr_level)
             theme, gender = extract_theme_and_gender(generated_text)
             
-            # ログに保存
-            theme_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "cefr_level": cefr_level,
-                "word_count": word_count,
-                "theme": theme,
-                "speaker_gender": gender,
-                "text_preview": generated_text[:100] + "..." if len(generated_text) > 100 else generated_text
-            }
-            save_theme_log(theme_entry)
-            
-            st.session_state.generated_text = generated_text
-            st.session_state.speaker_gender = gender
-            st.session_state.text_visible = False
-            st.session_state.show_original_text = True
-            st.session_state.study_guide = ""
-            st.session_state.show_study_guide = False
-            
-            st.success("文章の生成が完了しました!")
-            
-        except Exception as e:
-            st.error(f"テキスト生成に失敗しました: {str(e)}")
+            commit_generated_text(generated_text, cefr_level, word_count, theme, gender, lexical_profile)
+        
+        st.success("文章の生成が完了しました!")
+        
+    except Exception as e:
+        report_generation_failure(e, cefr_level, word_count)
 
-# Web Speech API用のJavaScript関数
-def render_speech_controls():
-    display_text = st.session_state.generated_text
-    if not st.session_state.show_original_text:
-        display_text = hide_word_endings(display_text)
-    
-    # JavaScriptエスケープ
-    escaped_text = display_text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
-    
-    html_code = f"""
-    <div style="margin-top: 20px;">
-        <div style="background-color: #f8f9fa; padding: 16px; border-radius: 8px; border: 1px solid #e8eaed; margin-bottom: 16px;">
-            <label style="font-weight: 500; margin-bottom: 12px; display: block;">読み上げ速度</label>
-            <div style="display: flex; gap: 8px; margin-bottom: 12px;">
-                <button class="speed-btn" data-speed="0.7" style="padding: 8px 16px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; flex: 1;">遅い</button>
-                <button class="speed-btn active" data-speed="1.0" style="padding: 8px 16px; border: 2px solid #4285f4; background: #4285f4; color: white; border-radius: 20px; cursor: pointer; flex: 1;">標準</button>
-                <button class="speed-btn" data-speed="1.3" style="padding: 8px 16px; border: 2px solid #e8eaed; background: white; border-radius: 20px; cursor: pointer; flex: 1;">速い</button>
-            </div>
-            
-            <label style="font-weight: 500; margin-bottom: 8px; display: block;">話者選択</label>
-            <select id="voiceSelect" style="width: 100%; padding: 12px; border: 2px solid #e8eaed; border-radius: 8px;">
-                <option value="">読み込み中...</option>
-            </select>
-            
-            <div style="margin-top: 12px;">
-                <label style="display: flex; align-items: center; gap: 8px; cursor: pointer;">
-                    <input type="checkbox" id="randomVoice" style="width: 18px; height: 18px;">
-                    <span style="font-size: 14px;">ランダム話者で読み上げ(文章内で統一)</span>
-                </label>
-            </div>
-        </div>
+# この語数以上は長文モード(段落構成 → 段落の並行生成)で作る
+LONG_PASSAGE_THRESHOLD = int(st.secrets.get("LONG_PASSAGE_THRESHOLD", 400))
+
+@metrics.timed("step:generate_long_text")
+def generate_long_text(cefr_level, word_count, placeholder):
+    """長文モード: 段落構成を作ってから段落を並行生成し、届いた段落から表示する
+    
+    語数が許容範囲を外れた段落だけを書き直させる。セッション状態は完成時にのみ更新する。
+    """
+    start_time = time.perf_counter()
+    status = st.empty()
+    
+    def submit(prompt, schema, operation):
+        return submit_model_call('gemini-2.0-flash-lite', prompt, schema=schema, operation=operation)
+    
+    def show_progress(paragraphs):
+        finished = sum(paragraph is not None for paragraph in paragraphs)
+        status.info(f"⏳ 段落を生成中...({finished}/{len(paragraphs)})")
+        # 段落はモデルの出力なので、エスケープしてから区切りの <br> でつなぐ
+        draft = "<br><br>".join(
+            html.escape(paragraph) if paragraph is not None else "▌" for paragraph in paragraphs
+        )
+        placeholder.markdown(f'<div class="text-display">{draft}</div>', unsafe_allow_html=True)
+    
+    try:
+        status.info("⏳ 段落構成を作成中...")
+        result = generate_long_passage(
+            submit, cefr_level, word_count, get_prompt_themes(), on_progress=show_progress
+        )
+        status.info("⏳ 仕上げ中...")
+        # 段落は届いた順に表示済みなので、書き換えずに印を付けるだけにする
+        generated_text, lexical_profile = check_lexical_level(result["passage"], cefr_level, allow_rewrite=False)
+        commit_generated_text(
+            generated_text, cefr_level, word_count, result["theme"], result["speaker_gender"],
+            lexical_profile, text_visible=True
+        )
+        st.session_state.generation_stats = {
+            "ttft": None,
+            "total": time.perf_counter() - start_time,
+            "paragraphs": len(result["targets"]),
+            "rewritten_paragraphs": result["rewritten_paragraphs"],
+            "words": sum(result["paragraph_words"]),
+        }
+        st.success("文章の生成が完了しました!")
         
-        <button id="playButton" style="width: 100%; padding: 16px; background: #34a853; color: white; border: none; border-radius: 8px; font-size: 16px; font-weight: 500; cursor: pointer;">
-            <span id="playIcon">▶️</span>
-            <span id="playText">読み上げ開始</span>
-        </button>
+    except Exception as e:
+        report_generation_failure(e, cefr_level, word_count)
+    finally:
+        status.empty()
+        placeholder.empty()
+
+@metrics.timed("step:generate_text_stream")
+def generate_text_stream(cefr_level, word_count, placeholder):
+    """文章をストリーミング生成し、メインエリアに逐次表示する
+    
+    セッション状態とテーマログはストリームが正常に完了した時点でのみ更新する。
+    途中で失敗・中断(再実行による停止を含む)した場合は何も書き込まない。
+    """
+    prompt = build_passage_prompt(cefr_level, word_count, get_prompt_themes())
+    chunks = []
+    first_token_time = None
+    start_time = time.perf_counter()
+    stream = None
+    
+    try:
+        # 流量制限と順番待ちはスケジューラーで済ませ、ストリーム自体は直接受け取る
+        wait_for_ticket(
+            scheduler.submit(st.session_state.session_id, 'gemini-2.0-flash-lite', lambda: None),
+            "文章を生成中"
+        )
+        stream = client.stream('gemini-2.0-flash-lite', prompt, operation="generate_stream")
+        placeholder.markdown('<div class="text-display">▌</div>', unsafe_allow_html=True)
+        for chunk in stream:
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start_time
+            chunks.append(chunk)
+            # モデルの出力はそのまま HTML として描画しないようエスケープする
+            placeholder.markdown(
+                f'<div class="text-display">{html.escape("".join(chunks))}▌</div>', unsafe_allow_html=True
+            )
         
-        <div id="status" style="margin-top: 16px; padding: 12px; background: #e8f0fe; border-radius: 8px; text-align: center; display: none;"></div>
-    </div>
-
-    <script>
-        (function() {{
-            const textToSpeak = "{escaped_text}";
-            let voices = [];
-            let englishVoices = [];
-            let currentSpeed = 1.0;
-            let isPlaying = false;
-            let selectedVoice = null;
-            
-            const voiceSelect = document.getElementById('voiceSelect');
-            const playButton = document.getElementById('playButton');
-            const playIcon = document.getElementById('playIcon');
-            const playText = document.getElementById('playText');
-            const status = document.getElementById('status');
-            const randomVoiceCheckbox = document.getElementById('randomVoice');
-            const speedButtons = document.querySelectorAll('.speed-btn');
-            
-            function loadVoices() {{
-                voices = speechSynthesis.getVoices();
-                englishVoices = voices.filter(voice => 
-                    voice.lang.startsWith('en-') || voice.lang === 'en'
-                );
-                updateVoiceSelect();
-            }}
-            
-            function updateVoiceSelect() {{
-                voiceSelect.innerHTML = '';
-                if (englishVoices.length === 0) {{
-                    voiceSelect.innerHTML = '<option value="">英語音声が見つかりません</option>';
-                    return;
-                }}
-                
-                const defaultOption = document.createElement('option');
-                defaultOption.value = '';
-                defaultOption.textContent = 'デフォルト音声';
-                voiceSelect.appendChild(defaultOption);
-                
-                englishVoices.forEach((voice, index) => {{
-                    const option = document.createElement('option');
-                    option.value = index;
-                    option.textContent = `${{voice.name}} (${{voice.lang}})`;
-                    voiceSelect.appendChild(option);
-                }});
-            }}
-            
-            function showStatus(message, isError = false) {{
-                status.textContent = message;
-                status.style.display = 'block';
-                status.style.background = isError ? '#fce8e6' : '#e8f0fe';
-                status.style.color = isError ? '#d93025' : '#1967d2';
-                
-                if (!isError) {{
-                    setTimeout(() => {{
-                        status.style.display = 'none';
-                    }}, 3000);
-                }}
-            }}
-            
-            function startSpeech() {{
-                if (!textToSpeak) {{
-                    showStatus('読み上げるテキストがありません', true);
-                    return;
-                }}
-                
-                speechSynthesis.cancel();
-                
-                let voiceToUse = selectedVoice;
-                if (randomVoiceCheckbox.checked && englishVoices.length > 0) {{
-                    const randomIndex = Math.floor(Math.random() * englishVoices.length);
-                    voiceToUse = englishVoices[randomIndex];
-                }}
-                
-                const utterance = new SpeechSynthesisUtterance(textToSpeak);
-                utterance.rate = currentSpeed;
-                utterance.pitch = 1;
-                utterance.volume = 1;
-                
-                if (voiceToUse) {{
-                    utterance.voice = voiceToUse;
-                    showStatus(`読み上げ中: ${{voiceToUse.name}} (速度: ${{currentSpeed}}x)`);
-                }} else {{
-                    showStatus(`読み上げ中 (速度: ${{currentSpeed}}x)`);
-                }}
-                
-                utterance.onstart = () => {{
-                    isPlaying = true;
-                    playButton.style.background = '#ea4335';
-                    playIcon.textContent = '⏸️';
-                    playText.textContent = '停止';
-                }};
-                
-                utterance.onend = () => {{
-                    isPlaying = false;
-                    playButton.style.background = '#34a853';
-                    playIcon.textContent = '▶️';
-                    playText.textContent = '読み上げ開始';
-                    showStatus('読み上げが完了しました');
-                }};
-                
-                utterance.onerror = (event) => {{
-                    isPlaying = false;
-                    playButton.style.background = '#34a853';
-                    playIcon.textContent = '▶️';
-                    playText.textContent = '読み上げ開始';
-                    showStatus(`エラーが発生しました: ${{event.error}}`, true);
-                }};
-                
-                speechSynthesis.speak(utterance);
-            }}
-            
-            function stopSpeech() {{
-                speechSynthesis.cancel();
-                isPlaying = false;
-                playButton.style.background = '#34a853';
-                playIcon.textContent = '▶️';
-                playText.textContent = '読み上げ開始';
-                showStatus('読み上げを停止しました');
-            }}
-            
-            // イベントリスナー
-            speedButtons.forEach(btn => {{
-                btn.addEventListener('click', (e) => {{
-                    speedButtons.forEach(b => {{
-                        b.style.border = '2px solid #e8eaed';
-                        b.style.background = 'white';
-                        b.style.color = 'black';
-                    }});
-                    e.target.style.border = '2px solid #4285f4';
-                    e.target.style.background = '#4285f4';
-                    e.target.style.color = 'white';
-                    currentSpeed = parseFloat(e.target.dataset.speed);
-                }});
-            }});
-            
-            voiceSelect.addEventListener('change', (e) => {{
-                const selectedIndex = e.target.value;
-                selectedVoice = selectedIndex ? englishVoices[selectedIndex] : null;
-            }});
-            
-            randomVoiceCheckbox.addEventListener('change', (e) => {{
-                voiceSelect.disabled = e.target.checked;
-            }});
-            
-            playButton.addEventListener('click', () => {{
-                if (isPlaying) {{
-                    stopSpeech();
-                }} else {{
-                    startSpeech();
-                }}
-            }});
-            
-            // 音声読み込み
-            loadVoices();
-            if (speechSynthesis.onvoiceschanged !== undefined) {{
-                speechSynthesis.onvoiceschanged = loadVoices;
-            }}
-        }})();
-    </script>
+        generated_text = "".join(chunks).strip()
+        if not generated_text:
+            raise ValueError("空の応答が返されました")
+        
+        # 利用者はもう本文を読んでいるので、書き換えずに印を付けるだけにする
+        _, lexical_profile = check_lexical_level(generated_text, cefr_level, allow_rewrite=False)
+        theme, gender = extract_theme_and_gender(generated_text)
+        commit_generated_text(
+            generated_text, cefr_level, word_count, theme, gender, lexical_profile, text_visible=True
+        )
+        
+        st.session_state.generation_stats = {
+            "ttft": first_token_time,
+            "total": time.perf_counter() - start_time,
+        }
+        st.success(f"文章の生成が完了しました!(最初のトークンまで {first_token_time:.2f} 秒)")
+        
+    except Exception as e:
+        report_generation_failure(e, cefr_level, word_count)
+    finally:
+        if stream is not None:
+            stream.close()
+        # 書きかけの文章は残さない(完了時は下のテキスト表示エリアに引き継ぐ)
+        placeholder.empty()
+
+def current_mask_key():
+    """読み上げ・表示に使う単語隠し設定のキー(全文表示なら None)"""
+    if st.session_state.show_original_text:
+        return None
+    mode = st.session_state.get("hide_mode", "endings")
+    if mode == "above_level":
+        return (mode, st.session_state.get("hide_level", "A2"))
+    if mode == "every_nth":
+        return (mode, st.session_state.get("hide_every_n", 3))
+    if mode == "random":
+        return (mode, st.session_state.get("hide_ratio", 0.3), st.session_state.get("hide_seed", 0))
+    return (mode,)
+
+# 読み上げプレーヤーの HTML は (文章, 隠し設定) ごとにメモ化
+# 同じ HTML を返せばブラウザ側の iframe は作り直されず、再生も中断されない
+@st.cache_data(max_entries=256, show_spinner=False)
+def build_speech_html(text, mask_key, _display_text):
+    # 単語を隠しても文字位置は変わらないため、元の文章で文を分割する
+    spans = sentence_spans(text)
+    return build_player_html(split_sentences(_display_text, spans))
+
+# Web Speech API による文単位の読み上げ
+def render_speech_controls():
+    text = get_generated_text()
+    mask_key = current_mask_key()
+    display_text = text if mask_key is None else hide_words(text)
+    
+    st.components.v1.html(build_speech_html(text, mask_key, display_text), height=PLAYER_HEIGHT)
+
+# サーバー側の音声合成(プロセス内で全セッション共有)
+# TTS_BACKEND=none、または espeak が見つからなければ None(ブラウザの読み上げだけを使う)
+@st.cache_resource
+def get_audio_renderer():
+    try:
+        backend = create_tts_backend(
+            os.environ.get("TTS_BACKEND") or st.secrets.get("TTS_BACKEND", "espeak"),
+            fake_latency=float(os.environ.get("TTS_FAKE_LATENCY", st.secrets.get("TTS_FAKE_LATENCY", 0.0))),
+        )
+    except TTSError:
+        return None
+    if backend is None:
+        return None
+    return AudioRenderer(
+        backend,
+        ClipCache(limit=int(st.secrets.get("TTS_CACHE_LIMIT_MB", 256)) * 1024 * 1024),
+        workers=int(st.secrets.get("TTS_WORKERS", 2)),
+        observer=metrics.observe_call,
+    )
+
+# 合成の進み具合を見に行く間隔(秒)
+AUDIO_POLL_SECONDS = 1
+
+@st.fragment(run_every=AUDIO_POLL_SECONDS)
+def server_audio_progress(renderer, job, audio_format):
+    """合成が終わるまで、このフラグメントだけを一定間隔で再実行して進み具合を表示する
+    
+    すべての文ができたら音声ファイルを作っておき、アプリを再実行して
+    プレーヤーの下に音声とダウンロードボタンを表示させる。
     """
+    if not job.done():
+        st.caption(f"⏳ 音声を合成中... {job.ready_count()} / {len(job)} 文")
+        return
+    if not job.errors():
+        try:
+            with st.spinner("音声ファイルを作成中..."):
+                renderer.assemble(job, audio_format)
+        except Exception:
+            # 再実行後の render_server_audio で作り直し、エラーを表示する
+            pass
+    st.rerun()
+
+# サーバーで合成した音声の再生とダウンロード
+def render_server_audio(renderer):
+    text = get_generated_text()
+    spans = sentence_spans(text)
+    # 単語を隠していても読み上げるのは元の文章(表示する文だけを隠す)
+    sentences = split_sentences(text, spans)
+    mask_key = current_mask_key()
+    display_sentences = sentences if mask_key is None else split_sentences(hide_words(text), spans)
+    rate = st.select_slider(
+        "話す速さ(1分あたりの語数)", options=RATES, value=DEFAULT_RATE, key="tts_rate"
+    )
+    voice = VOICES.get(st.session_state.speaker_gender, VOICES["neutral"])
+    job = renderer.render(sentences, voice, rate)
+    audio_format = st.secrets.get("TTS_FORMAT", "mp3")
+    
+    # プレーヤーは合成済みの文から順に再生する(残りの文の合成を待たない)
+    clip_urls = [CLIP_URL_PREFIX + name for name in job.names]
+    st.components.v1.html(
+        build_clip_player_html(display_sentences, clip_urls, spoken_sentences=sentences), height=PLAYER_HEIGHT
+    )
+    
+    if not job.done():
+        # ここで完了を待つと、下のパネルの表示まで遅れるのでフラグメントで見に行く
+        server_audio_progress(renderer, job, audio_format)
+        return
+    errors = job.errors()
+    if errors:
+        st.error(f"音声の合成に失敗しました: {errors[0]}")
+        return
+    try:
+        with st.spinner("音声ファイルを作成中..."):
+            audio, audio_format = renderer.assemble(job, audio_format)
+    except Exception as e:
+        st.error(f"音声ファイルの作成に失敗しました: {str(e)}")
+        return
+    st.audio(audio, format=MIME_TYPES[audio_format])
+    st.download_button(
+        "⬇️ 音声をダウンロード",
+        audio,
+        file_name=f"passage.{audio_format}",
+        mime=MIME_TYPES[audio_format],
+        use_container_width=True
+    )
+
+# 各パネルはフラグメントとして独立に再実行し、
+# 他のパネルのボタン操作で読み上げプレーヤーや学習ガイドを作り直さないようにする
+@st.fragment
+@metrics.timed("render:speech_panel")
+def speech_panel():
+    st.subheader("🔊 音声読み上げ")
+    renderer = get_audio_renderer()
+    if renderer is not None and st.toggle(
+        "サーバーで音声を作成",
+        key="server_audio",
+        help="サーバーで合成した音声を再生します。どの端末でも同じ声で聞け、音声ファイルをダウンロードできます"
+    ):
+        render_server_audio(renderer)
+    else:
+        render_speech_controls()
+
+@st.fragment
+@metrics.timed("render:text_panel")
+def text_panel():
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("📄 テキストを表示/非表示", use_container_width=True):
+            st.session_state.text_visible = not st.session_state.text_visible
+    
+    with col2:
+        if st.session_state.text_visible:
+            if st.button(
+                "🔤 単語を隠す/表示" if st.session_state.show_original_text else "✨ 全文を表示",
+                use_container_width=True
+            ):
+                st.session_state.show_original_text = not st.session_state.show_original_text
+                # 読み上げる文章も切り替わるためアプリ全体を再実行
+                st.rerun()
+    
+    # テキスト表示エリア
+    if st.session_state.text_visible:
+        st.subheader("📖 生成されたテキスト")
+        display_text = get_generated_text()
+        if not st.session_state.show_original_text:
+            display_text = hide_words(display_text)
+        
+        st.markdown(f'<div class="text-display">{display_text}</div>', unsafe_allow_html=True)
+
+# 練習問題は (文章, レベル, シード) ごとにメモ化(同じ文章を開いている他のセッションとも共有)
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_quiz(text_key, cefr_level, seed, _text):
+    return build_quiz(_text, get_vocabulary_index(), cefr_level, seed=seed)
+
+QUIZ_KINDS = {"cloze": "穴埋め", "word_order": "並べ替え", "dictation": "ディクテーション"}
+
+# ディクテーションの採点結果の表示
+DICTATION_STYLES = {
+    "equal": "",
+    "replace": "color: #d93025; text-decoration: line-through;",
+    "delete": "color: #e37400; text-decoration: underline;",
+    "insert": "color: #80868b; text-decoration: line-through;",
+}
+
+def render_dictation_diff(result):
+    """語ごとに色分けした採点結果(誤りは入力した語に取り消し線を引き、正しい語を添える)"""
+    pieces = []
+    for op, expected, typed in result.ops:
+        if op == "equal":
+            pieces.append(html.escape(expected))
+        elif op == "replace":
+            pieces.append(
+                f'<span style="{DICTATION_STYLES[op]}">{html.escape(typed)}</span>'
+                f' <span style="color: #188038;">{html.escape(expected)}</span>'
+            )
+        elif op == "delete":
+            pieces.append(f'<span style="{DICTATION_STYLES[op]}">{html.escape(expected)}</span>')
+        else:
+            pieces.append(f'<span style="{DICTATION_STYLES[op]}">{html.escape(typed)}</span>')
+    st.markdown(f'<div class="text-display">{" ".join(pieces)}</div>', unsafe_allow_html=True)
+    st.caption("赤の取り消し線: 誤り(緑が正解) / オレンジの下線: 聞き落とし / 灰色の取り消し線: 余分な語")
+
+def render_cloze(quiz, prefix):
+    if not quiz.cloze:
+        st.caption("穴埋めにできる語がありません")
+        return
+    with st.form(f"{prefix}_cloze"):
+        for i, item in enumerate(quiz.cloze):
+            st.radio(f"{i + 1}. {item.sentence}", item.choices, index=None, key=f"{prefix}_cloze_{i}")
+        submitted = st.form_submit_button("採点")
+    if submitted:
+        correct = 0
+        for i, item in enumerate(quiz.cloze):
+            if item.check(st.session_state.get(f"{prefix}_cloze_{i}")):
+                correct += 1
+            else:
+                st.markdown(f"❌ {i + 1}. 正解: **{item.answer}**({item.level})")
+        st.success(f"{correct} / {len(quiz.cloze)} 問正解")
+
+def render_word_order(quiz, prefix):
+    if not quiz.word_order:
+        st.caption("並べ替えにできる文がありません")
+        return
+    with st.form(f"{prefix}_order"):
+        for i, item in enumerate(quiz.word_order):
+            st.multiselect(
+                f"{i + 1}. 語を正しい順にクリックしてください",
+                list(range(len(item.shuffled))),
+                format_func=lambda j, item=item: item.shuffled[j],
+                key=f"{prefix}_order_{i}"
+            )
+        submitted = st.form_submit_button("採点")
+    if submitted:
+        correct = 0
+        for i, item in enumerate(quiz.word_order):
+            if item.check(st.session_state.get(f"{prefix}_order_{i}", [])):
+                correct += 1
+            else:
+                st.markdown(f"❌ {i + 1}. 正解: **{item.answer}**")
+        st.success(f"{correct} / {len(quiz.word_order)} 問正解")
+
+def render_dictation(quiz, text, prefix):
+    with st.form(f"{prefix}_dictation"):
+        # 文の番号は読み上げプレーヤーの文の番号と同じ
+        target = st.selectbox(
+            "書き取る範囲",
+            [None, *range(len(quiz.sentences))],
+            format_func=lambda i: "全文" if i is None else f"文 {i + 1}",
+            key=f"{prefix}_dictation_target"
+        )
+        typed = st.text_area("聞き取った英文を入力してください", key=f"{prefix}_dictation_text")
+        submitted = st.form_submit_button("採点")
+    if submitted and typed.strip():
+        reference = text if target is None else quiz.sentences[target]
+        result = diff_dictation(reference, typed)
+        st.success(f"正答率 {result.accuracy:.0%}({result.correct} / {result.total} 語)")
+        render_dictation_diff(result)
+
+@st.fragment
+@metrics.timed("render:quiz_panel")
+def quiz_panel(cefr_level):
+    """文章からローカルで作る練習問題(モデルは呼ばない)"""
+    st.markdown("---")
+    st.subheader("✏️ 練習問題")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        kind = st.radio("問題の種類", list(QUIZ_KINDS), format_func=QUIZ_KINDS.get, horizontal=True, key="quiz_kind")
+    with col2:
+        seed = st.number_input("シード", min_value=0, value=0, key="quiz_seed")
+    
+    text = get_generated_text()
+    quiz = get_quiz(st.session_state.passage_key, cefr_level, seed, text)
+    # 文章・シードが変わったら回答欄を作り直す
+    prefix = f"quiz_{st.session_state.passage_key[:12]}_{seed}"
+    if kind == "cloze":
+        render_cloze(quiz, prefix)
+    elif kind == "word_order":
+        render_word_order(quiz, prefix)
+    else:
+        render_dictation(quiz, text, prefix)
+
+@st.fragment
+@metrics.timed("render:study_guide_panel")
+def study_guide_panel(cefr_level):
+    # 必要な項目だけを作成する(文法/構造の解析は長い文章ほど時間がかかる)
+    st.multiselect(
+        "学習ガイドの項目",
+        list(STUDY_GUIDE_SECTIONS),
+        default=list(STUDY_GUIDE_SECTIONS),
+        format_func=lambda section: STUDY_GUIDE_SECTIONS[section]["title"],
+        key="guide_sections"
+    )
+    col1, col2 = st.columns(2)
+    sections = st.session_state.pop("guide_requested", [])
+    
+    with col1:
+        if st.button("📚 学習ガイド作成", use_container_width=True):
+            sections = st.session_state.guide_sections + sections
+    
+    with col2:
+        if st.session_state.study_guide:
+            if st.button("👀 学習ガイドを表示/非表示", use_container_width=True):
+                st.session_state.show_study_guide = not st.session_state.show_study_guide
     
-    st.components.v1.html(html_code, height=350)
+    tickets = {}
+    if sections:
+        try:
+            tickets = request_study_guide(get_generated_text(), cefr_level, sections)
+        except Exception as e:
+            st.error(f"学習ガイドの生成に失敗しました: {str(e)}")
+    
+    # 学習ガイド表示エリア
+    if st.session_state.show_study_guide and (st.session_state.study_guide or tickets):
+        st.markdown("---")
+        st.subheader("📚 学習ガイド")
+        render_study_guide(tickets)
+
+@st.fragment
+def metrics_dashboard():
+    """管理者向け: 操作ごとの所要時間の分位数と、計測値の書き出し"""
+    st.markdown("---")
+    st.subheader("📈 メトリクス(管理者)")
+    st.button("🔄 更新", key="refresh_metrics")
+    
+    rows = metrics.summary()
+    if not rows:
+        st.caption("まだ記録がありません")
+        return
+    import pandas as pd
+
+    summary = pd.DataFrame(rows).set_index("operation")
+    st.dataframe(
+        summary.style.format(
+            {"p50": "{:.3f}", "p95": "{:.3f}", "p99": "{:.3f}", "ttft_p50": "{:.3f}"}, na_rep="-"
+        ),
+        use_container_width=True
+    )
+    st.caption(
+        f"所要時間は秒(直近 {len(metrics.records())} 件から計算)"
+        f" | 待機中のリクエスト: {scheduler.queue_length()} | スケジューラー: {scheduler.stats}"
+    )
+
+    # 共有ブロブストアとこのセッションの状態の大きさ
+    usage = blob_store.usage()
+    st.caption(
+        f"ブロブストア: メモリ {usage['memory_items']} 件 / {usage['memory_bytes'] / 1024:,.0f} KB"
+        f"(上限 {blob_store.memory_limit / 1024 / 1024:,.0f} MB)"
+        f" | ディスク {usage['disk_items']} 件 / {usage['disk_bytes'] / 1024:,.0f} KB"
+        f" | 圧縮前の合計 {usage['raw_bytes'] / 1024:,.0f} KB | 重複 {usage['deduplicated']} 件"
+        f" | このセッションの状態: {session_state_bytes() / 1024:,.1f} KB"
+    )
+
+    # 学習ガイドの先読みの効果(項目単位)
+    hits = metrics.total("guide_speculation_total", outcome="hit")
+    speculated = metrics.total("guide_speculation_total")
+    if speculated:
+        st.caption(
+            f"学習ガイドの先読み: 的中率 {hits / speculated:.0%}({hits}/{speculated} 項目)"
+            f" | 無駄になったトークン: {metrics.total('guide_speculation_tokens_total', outcome='wasted'):,}"
+            f" | 取り消し: {metrics.total('guide_speculation_total', outcome='cancelled')} 項目"
+        )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("CSV", metrics.to_csv(), file_name="metrics.csv", mime="text/csv")
+    with col2:
+        st.download_button("JSONL", metrics.to_jsonl(), file_name="metrics.jsonl", mime="application/json")
+    with col3:
+        st.download_button("Prometheus", metrics.prometheus_text(), file_name="metrics.prom", mime="text/plain")
+    with st.expander("Prometheus テキスト形式"):
+        st.code(metrics.prometheus_text(), language="text")
 
 # メインUI
 st.title("🎧 英語リスニング・リーディング練習アプリ")
 st.markdown("**Gemini AI**で文章を生成し、**ブラウザのWeb Speech API**で読み上げを行います")
 
+# ストリーミング生成中の文章表示領域
+stream_placeholder = st.empty()
+
 # サイドバー - パラメータ設定
 with st.sidebar:
     st.header("⚙️ パラメータ設定")
@@ -518,79 +1243,174 @@ with st.sidebar:
         step=10
     )
     
+    with st.expander("📊 語彙レベルチェック"):
+        st.slider(
+            "目標レベル以下の語の割合(しきい値)",
+            min_value=0.5,
+            max_value=1.0,
+            value=0.9,
+            step=0.01,
+            key="lexical_threshold"
+        )
+        st.radio(
+            "しきい値を下回った場合",
+            list(LEXICAL_ACTIONS),
+            format_func=LEXICAL_ACTIONS.get,
+            key="lexical_action",
+            help="書き換えは表示前の文章だけに行います(ストリーミング・長文モードでは警告のみ)"
+        )
+    
+    with st.expander("🔤 単語隠しモード"):
+        hide_mode = st.selectbox(
+            "隠し方",
+            list(HIDE_MODES),
+            format_func=HIDE_MODES.get,
+            key="hide_mode"
+        )
+        if hide_mode == "above_level":
+            st.selectbox("このレベルより上の語を隠す", WORD_LIST_LEVELS, index=1, key="hide_level")
+        elif hide_mode == "every_nth":
+            st.number_input("何語ごとに隠すか", min_value=2, max_value=10, value=3, key="hide_every_n")
+        elif hide_mode == "random":
+            st.slider("隠す割合", min_value=0.1, max_value=0.9, value=0.3, step=0.05, key="hide_ratio")
+            st.number_input("シード", min_value=0, value=0, key="hide_seed")
+    
+    stream_mode = st.toggle(
+        "ストリーミング表示",
+        value=True,
+        help="生成中の文章を逐次表示します"
+    )
+    
+    st.toggle(
+        "学習ガイドを先読み",
+        value=bool(st.secrets.get("SPECULATIVE_GUIDE", False)),
+        key="speculative_guide",
+        help="文章の生成直後から学習ガイドをバックグラウンドで作成しておきます(使われなかった分のトークンは無駄になります)"
+    )
+    
+    library_mode = st.toggle(
+        "ライブラリから出題",
+        value=False,
+        help="過去に生成した文章から、レベルと単語数が合うものを即座に出題します(このセッションで出題済みのものは除きます)"
+    )
+    
     if st.button("🔍 文章を生成", type="primary", use_container_width=True):
-        generate_text(cefr_level, word_count)
+        served = False
+        if library_mode:
+            served = serve_library_passage(cefr_level, word_count)
+            if not served:
+                st.info("条件に合う未出題の文章がライブラリに無いため、新しく生成します")
+        # 先読み済みの文章があれば即座に表示し、無ければその場で生成する
+        if not served and not serve_prefetched_passage(cefr_level, word_count):
+            if word_count >= LONG_PASSAGE_THRESHOLD:
+                generate_long_text(cefr_level, word_count, stream_placeholder)
+            elif stream_mode:
+                generate_text_stream(cefr_level, word_count, stream_placeholder)
+            else:
+                generate_text(cefr_level, word_count)
+    
+    with st.expander("📚 ライブラリ検索"):
+        counts = passage_library.level_counts()
+        st.caption(
+            f"保存済み: {sum(counts.values())} 件"
+            + (" (" + ", ".join(f"{level}: {count}" for level, count in counts.items()) + ")" if counts else "")
+        )
+        query = st.text_input("キーワード(本文・テーマ)", key="library_query")
+        query_level = st.selectbox("レベル", ["すべて", "A0", "A1", "A2", "B1", "B2", "C1"], key="library_level")
+        if query:
+            results = passage_library.search(query, None if query_level == "すべて" else query_level)
+            if not results:
+                st.caption("該当する文章はありません")
+            for entry in results:
+                st.markdown(f"**{entry['theme']}**({entry['cefr_level']} / {entry['actual_words']} 語)")
+                st.caption(entry["snippet"])
+                st.button(
+                    "この文章で練習",
+                    key=f"library_use_{entry['id']}",
+                    on_click=load_library_passage,
+                    args=(entry["id"],)
+                )
+    
+    # 管理者メニュー(secrets に admin_password を設定した場合のみ表示)
+    if "admin_password" in st.secrets:
+        with st.expander("🛠️ 管理者"):
+            if st.session_state.get("is_admin"):
+                st.toggle("メトリクスを表示", key="show_metrics")
+            else:
+                admin_password = st.text_input("管理者パスワード", type="password", key="admin_password_input")
+                if admin_password:
+                    if hmac.compare_digest(admin_password, st.secrets["admin_password"]):
+                        st.session_state.is_admin = True
+                        st.rerun()
+                    else:
+                        st.error("😕 パスワードが違います")
 
 # メインエリア
-if st.session_state.generated_text:
+if st.session_state.passage_key is not None and not get_generated_text():
+    st.warning("文章の保存期間が過ぎたため表示できません。もう一度生成してください")
+    st.session_state.passage_key = None
+
+if st.session_state.passage_key is not None:
     # 話者情報
     gender_display = {"male": "男性", "female": "女性", "neutral": "中性"}.get(
         st.session_state.speaker_gender, "中性"
     )
     st.markdown(f'<div class="speaker-info">👤 話者: {gender_display}</div>', unsafe_allow_html=True)
     
-    # 音声コントロール
-    st.subheader("🔊 音声読み上げ")
-    render_speech_controls()
-    
-    # テキスト表示コントロール
-    st.markdown("---")
-    col1, col2, col3 = st.columns(3)
+    stats = st.session_state.generation_stats
+    if stats and stats.get("ttft") is not None:
+        st.caption(f"⏱️ 最初のトークンまで {stats['ttft']:.2f} 秒 / 生成完了まで {stats['total']:.2f} 秒")
+    elif stats and stats.get("paragraphs"):
+        st.caption(
+            f"🧩 {stats['paragraphs']} 段落を並行生成({stats['words']} 語, 書き直し {stats['rewritten_paragraphs']} 段落)"
+            f" / 生成完了まで {stats['total']:.2f} 秒"
+        )
     
-    with col1:
-        if st.button("📄 テキストを表示/非表示", use_container_width=True):
-            st.session_state.text_visible = not st.session_state.text_visible
+    # 語彙レベル
+    profile = st.session_state.lexical_profile
+    if profile:
+        note = "(難しい語を書き換え済み)" if profile["rewritten"] else ""
+        st.caption(f"📊 語彙カバー率: {profile['coverage']:.0%}({profile['target_level']} 以下の語の割合){note}")
+        if profile["flagged"]:
+            st.warning(
+                "目標レベルを超える語が多く含まれています: "
+                + ", ".join(profile["off_level_words"][:15])
+            )
+        with st.expander("📊 語彙レベルの内訳"):
+            # pandas は重いので、グラフを描くときまで読み込まない
+            import pandas as pd
+            st.bar_chart(pd.Series(profile["level_shares"], name="割合"))
+            if len(st.session_state.lexical_history) > 1:
+                history = pd.DataFrame(st.session_state.lexical_history).set_index("timestamp")
+                st.line_chart(history["coverage"])
     
-    with col2:
-        if st.session_state.text_visible:
-            if st.button(
-                "🔤 単語を隠す/表示" if st.session_state.show_original_text else "✨ 全文を表示",
-                use_container_width=True
-            ):
-                st.session_state.show_original_text = not st.session_state.show_original_text
+    # 音声コントロール
+    speech_panel()
     
-    with col3:
-        if st.button("📚 学習ガイド作成", use_container_width=True):
-            generate_study_guide(st.session_state.generated_text, cefr_level)
+    # テキスト表示
+    text_panel()
     
-    # テキスト表示エリア
-    if st.session_state.text_visible:
-        st.subheader("📖 生成されたテキスト")
-        display_text = st.session_state.generated_text
-        if not st.session_state.show_original_text:
-            display_text = hide_word_endings(display_text)
-        
-        st.markdown(f'<div class="text-display">{display_text}</div>', unsafe_allow_html=True)
+    # 練習問題
+    quiz_panel(cefr_level)
     
-    # 学習ガイド表示エリア
-    if st.session_state.show_study_guide and st.session_state.study_guide:
-        st.markdown("---")
-        st.subheader("📚 学習ガイド")
-        st.html(st.session_state.study_guide)
+    # 学習ガイド
+    study_guide_panel(cefr_level)
 
 else:
     st.info("👈 左のサイドバーから「文章を生成」ボタンをクリックして開始してください")
     
     # 使い方
     with st.expander("📚 使い方"):
-        st.markdown("""
-        1. **サイドバー**でCEFRレベルと単語数を設定
-        2. **文章を生成**ボタンをクリック
-        3. 生成された文章が表示されます
-        4. **読み上げ速度**と**話者**を選択
-        5. **読み上げ開始**ボタンで音声再生
-        6. **テキストを表示**ボタンでテキストの確認
-        7. **単語を隠す**ボタンでリスニング練習
-        8. **学習ガイド作成**で詳しい解説を表示
-        
-        ※ ブラウザのWeb Speech APIを使用しているため、インターネット接続が必要です
-        ※ 過去5件のテーマは自動的に避けられます
-        ※ 学習ガイドは一つ下のCEFRレベルの学習者を対象に作成されます
-        """)
+        st.markdown(USAGE_MARKDOWN)
+
+if st.session_state.get("is_admin") and st.session_state.get("show_metrics"):
+    metrics_dashboard()
 
 # フッター
 st.markdown("---")
-st.markdown("Made with Streamlit 🎈 | Powered by Gemini AI 🤖 | Speech by Web Speech API 🗣️")
+st.markdown(FOOTER_MARKDOWN)
+
+metrics.record("render:script", time.perf_counter() - script_start)
 
 
 
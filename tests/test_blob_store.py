@@ -0,0 +1,72 @@
+import os
+
+from blob_store import COMPRESS_MIN_BYTES, BlobStore, blob_digest
+
+
+def blob(letter):
+    # 圧縮しない大きさ(符号化すると11バイト)
+    return letter * 10
+
+
+def test_put_is_content_addressed_and_deduplicated():
+    store = BlobStore()
+    key = store.put(blob("a"))
+    assert key == blob_digest(blob("a")) and store.put(blob("a")) == key
+    assert store.get(key) == blob("a") and key in store
+    assert store.get("missing", "") == ""
+    usage = store.usage()
+    assert (usage["memory_items"], usage["deduplicated"], usage["misses"]) == (1, 1, 1)
+
+
+def test_large_text_is_compressed():
+    store = BlobStore()
+    text = "The quick brown fox jumps over the lazy dog. " * 100
+    key = store.put(text)
+    assert len(text) > COMPRESS_MIN_BYTES and store.usage()["memory_bytes"] < len(text) / 4
+    assert store.get(key) == text
+
+
+def test_least_recently_used_spills_to_disk(tmp_path):
+    store = BlobStore(str(tmp_path), memory_limit=25)
+    a, b = store.put(blob("a")), store.put(blob("b"))
+    store.get(a)
+    c = store.put(blob("c"))
+    usage = store.usage()
+    assert (usage["memory_items"], usage["disk_items"], usage["spilled"]) == (2, 1, 1)
+    assert os.path.exists(tmp_path / b[:2] / b)
+    # 書き出したものは読み直すとメモリへ戻り、代わりに a が書き出される
+    assert store.get(b) == blob("b")
+    assert store.usage()["disk_reads"] == 1
+    assert os.path.exists(tmp_path / a[:2] / a)
+    assert store.get(c) == blob("c") and store.get(a) == blob("a")
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    store = BlobStore(str(tmp_path), memory_limit=11, disk_limit=25)
+    keys = [store.put(blob(letter)) for letter in "abcd"]
+    # d はメモリ、b と c はディスク、最古の a は削除済み
+    assert store.get(keys[0]) is None
+    assert not os.path.exists(tmp_path / keys[0][:2] / keys[0])
+    assert store.usage()["evicted"] == 1
+    assert sorted(name for _root, _dirs, files in os.walk(tmp_path) for name in files) == sorted(keys[1:3])
+    assert store.usage()["disk_bytes"] <= 25
+
+
+def test_without_directory_overflow_is_dropped():
+    store = BlobStore(memory_limit=25)
+    keys = [store.put(blob(letter)) for letter in "abc"]
+    assert store.get(keys[0]) is None
+    assert store.usage()["evicted"] == 1
+
+
+def test_reopened_store_finds_spilled_blobs(tmp_path):
+    store = BlobStore(str(tmp_path), memory_limit=11)
+    a = store.put(blob("a"))
+    store.put(blob("b"))
+    reopened = BlobStore(str(tmp_path))
+    assert reopened.get(a) == blob("a")
+    # 索引にあってもファイルが消えていれば、無いものとして扱う
+    fresh = BlobStore(str(tmp_path))
+    os.remove(tmp_path / a[:2] / a)
+    assert fresh.get(a, "gone") == "gone"
+    assert fresh.usage()["disk_items"] == 0
@@ -0,0 +1,67 @@
+import pytest
+
+import cassette as cassette_module
+from cassette import Cassette, CassetteMiss, RecordingBackend, ReplayBackend, StaleRecording
+from gemini_client import FakeBackend
+from prompts import build_passage_prompt
+
+MODEL = "gemini-2.0-flash-lite"
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    return Cassette(str(tmp_path / "cassette.sqlite3"))
+
+
+def test_exact_then_normalized_match(cassette):
+    recorded = build_passage_prompt("B1", 200, ["Cooking at home"])
+    cassette.record(MODEL, recorded, None, "recorded passage")
+    assert cassette.find(MODEL, recorded).match == "exact"
+    # 避けるテーマの一覧と空白の違いは照合に使わない
+    for prompt in (build_passage_prompt("B1", 200, ["Space travel", "Pets"]), "  " + recorded.replace("\n", "\n\n")):
+        recording = cassette.find(MODEL, prompt)
+        assert (recording.text, recording.match) == ("recorded passage", "normalized")
+    assert (cassette.stats["exact"], cassette.stats["normalized"]) == (1, 2)
+    # レベルやモデルが違えば一致しない
+    with pytest.raises(CassetteMiss):
+        cassette.find(MODEL, build_passage_prompt("B2", 200, []))
+    with pytest.raises(CassetteMiss):
+        cassette.find("gemini-2.0-flash", recorded)
+
+
+def test_normalized_match_returns_the_first_recording(cassette):
+    cassette.record(MODEL, build_passage_prompt("B1", 200, ["Cooking"]), None, "first")
+    cassette.record(MODEL, build_passage_prompt("B1", 200, ["Travel"]), None, "second")
+    assert cassette.find(MODEL, build_passage_prompt("B1", 200, ["Music"])).text == "first"
+
+
+def test_stale_template_is_reported(cassette, monkeypatch):
+    recorded = build_passage_prompt("A2", 100, [])
+    cassette.record(MODEL, recorded, None, "old passage")
+    assert cassette.stale_templates() == {}
+
+    # テンプレートの文面を変えたのと同じ状態にする
+    monkeypatch.setattr(cassette_module, "template_hash", lambda name: "0" * 16)
+    with pytest.raises(StaleRecording) as excinfo:
+        cassette.find(MODEL, recorded)
+    assert excinfo.value.template == "passage"
+    assert cassette.find(MODEL, recorded, allow_stale=True).text == "old passage"
+    assert cassette.stale_templates() == {"passage": 1}
+    # 一致しなかった理由が古い録画なら、ただの CassetteMiss ではなく StaleRecording にする
+    with pytest.raises(StaleRecording):
+        cassette.find(MODEL, build_passage_prompt("C1", 100, []))
+
+
+def test_replay_returns_what_was_recorded(cassette):
+    recorder = RecordingBackend(FakeBackend(stream_chunk_words=3), cassette)
+    prompt = build_passage_prompt("B1", 30, [])
+    recorded = recorder.generate(MODEL, prompt)
+    streamed = list(recorder.stream(MODEL, prompt + " (stream)"))
+    assert len(cassette) == 2
+
+    replay = ReplayBackend(cassette)
+    replayed = replay.generate(MODEL, prompt)
+    assert (replayed.text, replayed.usage) == (recorded.text, recorded.usage)
+    # ストリーミングは録画したときの区切りのまま返す
+    assert list(replay.stream(MODEL, prompt + " (stream)")) == streamed
+    assert "".join(ReplayBackend(cassette, chunk_words=2).stream(MODEL, prompt + " (stream)")) == "".join(streamed)
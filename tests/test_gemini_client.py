@@ -0,0 +1,34 @@
+import asyncio
+
+from gemini_client import FakeBackend, GeminiClient
+
+
+def test_cancelled_agenerate_does_not_leak_concurrency_slot():
+    client = GeminiClient(FakeBackend(), max_concurrency=1)
+
+    async def cancel_while_waiting():
+        # 同期側が枠を使っている間に非同期呼び出しを待たせ、取り消す
+        client._semaphore.acquire()
+        task = asyncio.create_task(client.agenerate("gemini-2.0-flash-lite", "prompt"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0)
+        client._semaphore.release()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # 取得待ちのスレッドが取得して返すまで待つ
+        await asyncio.sleep(0.1)
+
+    asyncio.run(cancel_while_waiting())
+    assert client._semaphore.acquire(timeout=1)
+    client._semaphore.release()
+
+
+def test_agenerate_releases_slot_after_success():
+    client = GeminiClient(FakeBackend(), max_concurrency=1)
+    for _ in range(3):
+        response = asyncio.run(client.agenerate("gemini-2.0-flash-lite", "prompt"))
+        assert response.text
+    assert client._semaphore.acquire(timeout=1)
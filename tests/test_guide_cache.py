@@ -0,0 +1,55 @@
+import itertools
+
+import pytest
+
+import guide_cache
+from guide_cache import GuideCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 最終アクセス時刻が同じにならないよう、呼び出しごとに1秒進む時計にする
+    ticks = itertools.count(1)
+    monkeypatch.setattr(guide_cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_evicts_least_recently_used_by_entry_count(tmp_path, clock):
+    cache = GuideCache(str(tmp_path / "guides.sqlite3"), max_entries=2)
+    cache.put("a", "guide a")
+    cache.put("b", "guide b")
+    assert cache.get("a") == "guide a"
+    cache.put("c", "guide c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "guide a" and cache.get("c") == "guide c"
+
+
+def test_evicts_least_recently_used_by_total_bytes(tmp_path, clock):
+    cache = GuideCache(str(tmp_path / "guides.sqlite3"), max_entries=100, max_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    cache.get("a")
+    cache.put("c", "z" * 10)
+    assert cache.stats()["bytes"] <= 25
+    assert cache.get("b") is None and cache.get("a") is not None
+    # 日本語は UTF-8 のバイト数で数える(10文字 = 30バイトは単独でも上限を超える)
+    cache.put("d", "あ" * 10)
+    assert cache.stats()["entries"] == 0
+
+
+def test_counts_hits_and_misses(tmp_path):
+    cache = GuideCache(str(tmp_path / "guides.sqlite3"))
+    key = GuideCache.make_key("Some passage.", "A2", 1)
+    assert cache.get(key) is None
+    cache.put(key, "<h2>Guide</h2>")
+    assert cache.get(key) == "<h2>Guide</h2>"
+    assert cache.get(key) == "<h2>Guide</h2>"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_key_depends_on_level_and_template_version():
+    key = GuideCache.make_key("Some passage.", "A2", 1)
+    assert key == GuideCache.make_key("Some passage.", "A2", 1)
+    assert key != GuideCache.make_key("Some passage.", "B1", 1)
+    assert key != GuideCache.make_key("Some passage.", "A2", 2)
@@ -0,0 +1,52 @@
+import re
+
+import pytest
+
+from hiding import WordHider, mask_spans
+
+
+def hide_word_endings(text):
+    """置き換える前のアプリの実装(既定モードはこれと同じ結果になる)"""
+    def hide_word(match):
+        word = match.group(0)
+        if len(word) <= 2:
+            return word
+        else:
+            return word[:2] + '-' * (len(word) - 2)
+
+    pattern = r'\b[a-zA-Z]+(?:\'[a-zA-Z]+)?\b'
+    return re.sub(pattern, hide_word, text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "I am at home.",
+        "Tom's sister didn't go to the well-known café on May 3rd, 2024.",
+        "\"Hello,\" she said. 'It's fine!' (Really?)\nNext line—with a dash…",
+        "Naïve résumé: x2 y3z ABC def'g h'",
+    ],
+)
+def test_default_mode_matches_hide_word_endings(text):
+    hider = WordHider(text)
+    assert hider.mask() == hide_word_endings(text)
+    # 2回目は保持した結果を返す
+    assert hider.mask() is hider.mask()
+
+
+def test_every_nth_hides_content_words_only():
+    hider = WordHider("The cat and the dog ran to the big park with a ball")
+    hidden = [hider.text[start:end] for start, end in (hider.spans[i] for i in hider.select("every_nth", n=2))]
+    assert hidden == ["dog", "big", "ball"]
+
+
+def test_random_mode_is_fixed_by_seed():
+    hider = WordHider("Every morning the young farmer walks slowly across the green fields near the river")
+    first = hider.select("random", ratio=0.5, seed=7)
+    assert first == WordHider(hider.text).select("random", ratio=0.5, seed=7)
+    assert len(first) == round(len(hider._content_indexes()) * 0.5)
+
+
+def test_mask_spans_keeps_first_characters():
+    assert mask_spans("hello world", [(0, 5), (6, 11)]) == "he--- wo---"
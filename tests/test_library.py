@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import library
+from library import PassageLibrary
+
+
+class NoTrigramConnection(sqlite3.Connection):
+    """trigram トークナイザーの無い古い SQLite の代わり"""
+
+    def execute(self, sql, *args):
+        if "tokenize='trigram'" in sql:
+            raise sqlite3.OperationalError("no such tokenizer: trigram")
+        return super().execute(sql, *args)
+
+
+@pytest.fixture
+def passages(tmp_path):
+    lib = PassageLibrary(str(tmp_path / "library.sqlite3"))
+    lib.add("Tom went to the museum with his sister on Sunday.", "A2", 10, "博物館への外出", "male")
+    lib.add("The weather was sunny, so we had a picnic in the park.", "A2", 12, "公園でのピクニック", "female")
+    lib.add("Go to a museum to learn about the city's long history.", "B1", 12, "町の歴史", "neutral")
+    return lib
+
+
+def fts_sql(lib):
+    return lib._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'passages_fts'").fetchone()[0]
+
+
+def test_same_passage_is_stored_once(passages):
+    first = passages.search("picnic")[0]
+    assert passages.add(first["passage"], "A2", 12, "別のテーマ", "female") == first["id"]
+    assert len(passages) == 3
+
+
+def test_search_matches_words_and_japanese_theme_substrings(passages):
+    assert "trigram" in fts_sql(passages)
+    assert [entry["theme"] for entry in passages.search("museum")] == ["町の歴史", "博物館への外出"]
+    assert [entry["theme"] for entry in passages.search("museum", cefr_level="A2")] == ["博物館への外出"]
+    assert "**museum**" in passages.search("museum")[0]["snippet"]
+    # trigram なので語の途中や日本語のテーマの一部でも一致する
+    assert [entry["theme"] for entry in passages.search("ピクニ")] == ["公園でのピクニック"]
+    # 記号はフレーズの一部として扱う
+    assert [entry["theme"] for entry in passages.search("city's")] == ["町の歴史"]
+
+
+def test_short_queries_use_like(passages):
+    assert [entry["theme"] for entry in passages.search("歴史")] == ["町の歴史"]
+    assert [entry["cefr_level"] for entry in passages.search("Go")] == ["B1"]
+    # LIKE のワイルドカードは文字どおりに探す
+    assert passages.search("%") == [] and passages.search("_") == []
+    assert passages.search("  ") == []
+
+
+def test_falls_back_to_unicode61_without_trigram(tmp_path, monkeypatch):
+    connect = sqlite3.connect
+    monkeypatch.setattr(
+        library.sqlite3, "connect", lambda *args, **kwargs: connect(*args, factory=NoTrigramConnection, **kwargs)
+    )
+    lib = PassageLibrary(str(tmp_path / "library.sqlite3"))
+    assert "unicode61" in fts_sql(lib)
+    lib.add("The weather was sunny, so we had a picnic in the park.", "A2", 12, "公園でのピクニック", "female")
+    assert len(lib.search("picnic")) == 1
+    # unicode61 は語単位の索引なので、語の一部では一致しない
+    assert lib.search("picn") == []
+    assert len(lib.search("公園")) == 1
+
+
+def test_find_prefers_least_served(passages):
+    served = [passages.find("A2", 11)["id"] for _ in range(4)]
+    assert sorted(served[:2]) == sorted(served[2:]) and len(set(served)) == 2
+    assert passages.find("A2", 11, exclude_ids=served) is None
+    assert passages.find("C1", 11) is None
+    assert passages.level_counts() == {"A2": 2, "B1": 1}
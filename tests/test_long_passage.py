@@ -0,0 +1,129 @@
+import pytest
+
+import long_passage
+from gemini_client import ModelResponse
+from long_passage import count_words, generate_long_passage, paragraph_targets
+from prompts import PassageOutline
+
+
+class FakeFuture:
+    """submit が返す Future 風のオブジェクト(pending=True ならいつまでも終わらない)"""
+
+    def __init__(self, response=None, error=None, pending=False):
+        self.response = response
+        self.error = error
+        self.pending = pending
+        self.cancelled = False
+
+    def done(self):
+        return not self.pending
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+class FakeSubmit:
+    """構成の次に、段落の依頼へ replies を順に返す"""
+
+    def __init__(self, paragraph_count, replies):
+        outline = PassageOutline(
+            title="A Day Out", theme="週末の外出", speaker_gender="female",
+            paragraphs=[f"Part {i + 1}" for i in range(paragraph_count)],
+        )
+        self.outline = FakeFuture(ModelResponse(text=outline.model_dump_json(), parsed=outline))
+        self.replies = list(replies)
+        self.operations = []
+        self.futures = []
+
+    def __call__(self, prompt, schema, operation):
+        self.operations.append(operation)
+        if operation == "long_outline":
+            return self.outline
+        reply = self.replies.pop(0)
+        future = reply if isinstance(reply, FakeFuture) else FakeFuture(ModelResponse(text=words(reply)))
+        self.futures.append(future)
+        return future
+
+
+def words(count):
+    return " ".join(["word"] * count)
+
+
+@pytest.mark.parametrize(
+    "word_count, expected", [(200, [100, 100]), (1000, [200] * 5), (1001, [201, 200, 200, 200, 200])]
+)
+def test_paragraph_targets_split_evenly(word_count, expected):
+    assert paragraph_targets(word_count) == expected
+
+
+def test_paragraph_targets_with_fixed_count():
+    assert paragraph_targets(10, paragraph_count=3) == [4, 3, 3]
+    assert sum(paragraph_targets(999, paragraph_count=4)) == 999
+
+
+def test_joins_paragraphs_and_reports_progress():
+    submit = FakeSubmit(2, [100, 95])
+    progress = []
+    result = generate_long_passage(submit, "B1", 200, [], on_progress=progress.append, poll_interval=0)
+    assert result["passage"] == words(100) + "\n\n" + words(95)
+    assert (result["theme"], result["speaker_gender"], result["targets"]) == ("週末の外出", "female", [100, 100])
+    assert result["rewritten_paragraphs"] == 0
+    assert progress[-1] == [words(100), words(95)]
+    assert sum(paragraph is not None for paragraph in progress[0]) == 1
+
+
+@pytest.mark.parametrize("first, retry, kept", [(50, 70, 70), (150, 40, 150), (50, 100, 100)])
+def test_off_target_paragraph_is_retried_once_and_closest_kept(first, retry, kept):
+    submit = FakeSubmit(2, [first, 100, retry])
+    result = generate_long_passage(submit, "B1", 200, [], poll_interval=0)
+    assert submit.operations.count("long_paragraph_retry") == 1
+    assert result["paragraph_words"] == [kept, 100]
+    assert result["rewritten_paragraphs"] == 1
+    assert count_words(result["passage"]) == kept + 100
+
+
+def test_invalid_outline_raises():
+    submit = FakeSubmit(2, [])
+    submit.outline = FakeFuture(ModelResponse(text="not json"))
+    with pytest.raises(ValueError):
+        generate_long_passage(submit, "B1", 200, [], poll_interval=0)
+
+
+def test_failed_paragraph_cancels_the_rest():
+    waiting = [FakeFuture(pending=True), FakeFuture(pending=True)]
+    failed = FakeFuture(error=RuntimeError("boom"))
+    submit = FakeSubmit(4, [waiting[0], failed, waiting[1], 250])
+    with pytest.raises(RuntimeError):
+        generate_long_passage(submit, "B1", 1000, [], paragraph_words=250, poll_interval=0)
+    assert all(future.cancelled for future in waiting)
+    assert not failed.cancelled
+
+
+def test_failed_submit_cancels_paragraphs_already_requested():
+    waiting = FakeFuture(pending=True)
+    submit = FakeSubmit(2, [waiting])
+    # 2段落目の依頼で replies が尽きる(回数上限などで submit 自体が失敗する場合)
+    with pytest.raises(IndexError):
+        generate_long_passage(submit, "B1", 200, [], poll_interval=0)
+    assert waiting.cancelled
+
+
+def test_interrupted_wait_cancels_pending_paragraphs(monkeypatch):
+    class StopRun(Exception):
+        """Streamlit の再実行・停止で待機中に送出される例外の代わり"""
+
+    def interrupted(seconds):
+        raise StopRun()
+
+    monkeypatch.setattr(long_passage.time, "sleep", interrupted)
+    waiting = FakeFuture(pending=True)
+    submit = FakeSubmit(2, [100, waiting])
+    with pytest.raises(StopRun):
+        generate_long_passage(submit, "B1", 200, [], poll_interval=0.2)
+    assert waiting.cancelled
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from metrics import MetricsRecorder
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_rotates_and_keeps_backups(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    recorder = MetricsRecorder(str(path), max_bytes=300, backups=2)
+    for i in range(30):
+        recorder.record(f"op{i}", 0.01)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.jsonl", "metrics.jsonl.1", "metrics.jsonl.2"]
+    # 新しい記録ほど番号の小さいファイルにあり、最古のものは捨てられる
+    current, first, second = (read_lines(f"{path}{suffix}") for suffix in ("", ".1", ".2"))
+    assert current[-1]["operation"] == "op29"
+    assert second[-1]["ts"] <= first[0]["ts"] and first[-1]["ts"] <= current[0]["ts"]
+    assert len(current) + len(first) + len(second) < 30
+    assert all(p.stat().st_size < 300 + 200 for p in tmp_path.iterdir())
+
+
+def test_ring_buffer_drops_old_records_but_counters_keep_counting():
+    recorder = MetricsRecorder(capacity=3)
+    for _ in range(5):
+        recorder.record("generate_text", 0.5)
+    assert len(recorder.records()) == 3
+    assert 'quiz_app_operations_total{operation="generate_text",outcome="ok"} 5' in recorder.prometheus_text()
+
+
+def test_prometheus_text():
+    recorder = MetricsRecorder()
+    recorder.observe_call({
+        "operation": "study_guide", "duration": 2.0, "ttft": None, "model": "gemini-2.0-flash",
+        "input_tokens": 120, "output_tokens": 800, "retries": 1, "outcome": "ok",
+    })
+    recorder.record("study_guide", 4.0, outcome="TimeoutError")
+    recorder.record('say "hi"', 0.1)
+    lines = recorder.prometheus_text().splitlines()
+
+    assert "# TYPE quiz_app_operation_duration_seconds summary" in lines
+    assert 'quiz_app_operation_duration_seconds{operation="study_guide",quantile="0.5"} 3.000000' in lines
+    assert 'quiz_app_operations_total{operation="study_guide",outcome="TimeoutError"} 1' in lines
+    assert 'quiz_app_model_tokens_total{model="gemini-2.0-flash",direction="output"} 800' in lines
+    assert 'quiz_app_model_retries_total{model="gemini-2.0-flash"} 1' in lines
+    assert 'quiz_app_operations_total{operation="say \\"hi\\"",outcome="ok"} 1' in lines
+    # TYPE 行はカウンターごとに1回だけ
+    assert lines.count("# TYPE quiz_app_operations_total counter") == 1
+    assert lines.index("# TYPE quiz_app_operations_total counter") < min(
+        i for i, line in enumerate(lines) if line.startswith("quiz_app_operations_total")
+    )
+
+
+def test_timer_records_exception_name():
+    recorder = MetricsRecorder()
+    with pytest.raises(ValueError):
+        with recorder.timer("render:script"):
+            raise ValueError("boom")
+    assert recorder.records("render:script")[0]["outcome"] == "ValueError"
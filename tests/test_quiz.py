@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from quiz import BLANK, build_quiz, diff_dictation
+from vocab import VocabularyIndex
+
+PASSAGE = (
+    "Last summer my family travelled to a small village near the mountains. "
+    "We stayed in an old wooden house with a beautiful garden. "
+    "Every morning my brother and I walked to the bakery to buy fresh bread. "
+    "The local people were friendly and told us interesting stories about the area. "
+    "On the last day we climbed a steep hill and enjoyed the magnificent view. "
+    "I hope we can return next year."
+)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return VocabularyIndex.from_directory(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_same_seed_builds_the_same_quiz(index):
+    first = build_quiz(PASSAGE, index, "A2", seed=3)
+    assert first == build_quiz(PASSAGE, index, "A2", seed=3)
+    seeds = [build_quiz(PASSAGE, index, "A2", seed=seed) for seed in range(5)]
+    assert len({repr(quiz) for quiz in seeds}) > 1
+
+
+def test_cloze_items(index):
+    quiz = build_quiz(PASSAGE, index, "A2", seed=0)
+    assert len(quiz.cloze) == 5
+    # 1文に1問まで、本文での出現順
+    assert [item.sentence_index for item in quiz.cloze] == sorted({item.sentence_index for item in quiz.cloze})
+    for item in quiz.cloze:
+        assert item.sentence.count(BLANK) == 1
+        assert item.sentence.replace(BLANK, item.answer) == quiz.sentences[item.sentence_index]
+        assert len(item.choices) == 4 and item.choices.count(item.answer) == 1
+        assert item.check(item.answer.upper()) and not item.check(None)
+
+
+def test_word_order_items(index):
+    quiz = build_quiz(PASSAGE, index, "A2", seed=0)
+    assert quiz.word_order
+    for item in quiz.word_order:
+        assert sorted(item.shuffled) == sorted(item.answer.split())
+        assert item.shuffled != item.answer.split()
+        order = sorted(range(len(item.shuffled)), key=lambda i: item.answer.split().index(item.shuffled[i]))
+        assert item.check(order) and not item.check(list(reversed(order)))
+
+
+def test_dictation_diff_marks_each_kind_of_error():
+    result = diff_dictation("The cat sat on the mat.", "the cat sit on mat extra")
+    assert result.ops == [
+        ("equal", "The", "the"),
+        ("equal", "cat", "cat"),
+        ("replace", "sat", "sit"),
+        ("equal", "on", "on"),
+        ("delete", "the", None),
+        ("equal", "mat.", "mat"),
+        ("insert", None, "extra"),
+    ]
+    assert (result.correct, result.total) == (4, 6)
+    assert result.accuracy == pytest.approx(4 / 6)
+
+
+def test_dictation_ignores_case_and_punctuation():
+    result = diff_dictation("Hello, world! It's fine.", "hello world it’s fine")
+    assert all(op == "equal" for op, _expected, _typed in result.ops)
+    assert result.accuracy == 1.0
+    assert diff_dictation("", "").accuracy == 1.0
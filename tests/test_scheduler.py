@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+from scheduler import QuotaExceeded, RequestScheduler, request_key
+
+MODEL = "gemini-2.0-flash-lite"
+
+
+@pytest.fixture
+def scheduler():
+    # 流量制限で待たないよう、十分な流量とバーストにする
+    return RequestScheduler(rpm={MODEL: 60000}, workers=1, burst=100)
+
+
+@pytest.fixture
+def blocked(scheduler):
+    """唯一のワーカーを止めておき、その間に投入したリクエストを待ち行列に残す"""
+    started, release = threading.Event(), threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    ticket = scheduler.submit("blocker", MODEL, blocker)
+    assert started.wait(5)
+    yield release
+    release.set()
+    ticket.result(timeout=5)
+
+
+def test_same_key_shares_one_call(scheduler, blocked):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return object()
+
+    key = request_key(MODEL, "prompt")
+    first = scheduler.submit("a", MODEL, fn, key=key)
+    second = scheduler.submit("b", MODEL, fn, key=key)
+    blocked.set()
+    assert second.coalesced and not first.coalesced
+    assert first.result(timeout=5) is second.result(timeout=5)
+    assert len(calls) == 1
+    assert scheduler.stats["coalesced"] == 1
+
+
+def test_without_key_every_submit_runs(scheduler, blocked):
+    calls = []
+    tickets = [scheduler.submit("a", MODEL, lambda: calls.append(1) or len(calls)) for _ in range(2)]
+    blocked.set()
+    assert [ticket.result(timeout=5) for ticket in tickets] == [1, 2]
+    assert scheduler.stats["coalesced"] == 0
+
+
+def test_completed_key_runs_again(scheduler):
+    key = request_key(MODEL, "prompt")
+    calls = []
+    first = scheduler.submit("a", MODEL, lambda: calls.append(1), key=key)
+    first.result(timeout=5)
+    second = scheduler.submit("a", MODEL, lambda: calls.append(1), key=key)
+    second.result(timeout=5)
+    assert not second.coalesced and len(calls) == 2
+
+
+def test_sessions_take_turns(scheduler, blocked):
+    order = []
+    tickets = []
+    for session_id, count in (("a", 3), ("b", 2), ("c", 1)):
+        for i in range(count):
+            tickets.append(scheduler.submit(session_id, MODEL, lambda name=f"{session_id}{i}": order.append(name)))
+    # 待ち順は取り出される順(ラウンドロビン)で数える
+    assert [ticket.position() for ticket in tickets] == [1, 4, 6, 2, 5, 3]
+    blocked.set()
+    for ticket in tickets:
+        ticket.result(timeout=5)
+    assert order == ["a0", "b0", "c0", "a1", "b1", "a2"]
+    assert all(ticket.position() == 0 for ticket in tickets)
+
+
+def test_background_waits_for_interactive_requests(scheduler, blocked):
+    order = []
+    background = scheduler.submit("__background__", MODEL, lambda: order.append("background"), background=True)
+    interactive = scheduler.submit("a", MODEL, lambda: order.append("interactive"))
+    blocked.set()
+    background.result(timeout=5)
+    interactive.result(timeout=5)
+    assert order == ["interactive", "background"]
+
+
+def test_session_quota():
+    scheduler = RequestScheduler(rpm={MODEL: 60000}, workers=1, burst=100, session_quota=2)
+    for _ in range(2):
+        scheduler.submit("a", MODEL, lambda: None).result(timeout=5)
+    with pytest.raises(QuotaExceeded) as excinfo:
+        scheduler.submit("a", MODEL, lambda: None)
+    assert 0 < excinfo.value.retry_after <= scheduler.quota_window
+    assert scheduler.stats["rejected"] == 1
+    # 他のセッションとバックグラウンドのリクエストは影響を受けない
+    scheduler.submit("b", MODEL, lambda: None).result(timeout=5)
+    scheduler.submit("a", MODEL, lambda: None, background=True).result(timeout=5)
+
+
+def test_cancel_waits_for_every_holder(scheduler, blocked):
+    calls = []
+    key = request_key(MODEL, "guide")
+    first = scheduler.submit("a", MODEL, lambda: calls.append(1) or "guide", key=key)
+    second = scheduler.submit("b", MODEL, lambda: calls.append(1) or "guide", key=key)
+    # 同じチケットを何度取り消しても、相乗りしている他のチケットの分は減らさない
+    assert first.cancel() is False
+    assert first.cancel() is False
+    assert not second.cancelled()
+    blocked.set()
+    assert second.result(timeout=5) == "guide" and calls == [1]
+
+
+def test_cancel_by_last_holder_drops_the_call(scheduler, blocked):
+    calls = []
+    key = request_key(MODEL, "guide")
+    tickets = [scheduler.submit(session_id, MODEL, lambda: calls.append(1), key=key) for session_id in "ab"]
+    assert [ticket.cancel() for ticket in tickets] == [False, True]
+    assert all(ticket.cancelled() for ticket in tickets)
+    assert scheduler.stats["cancelled"] == 1 and scheduler.queue_length() == 0
+    # 取り消したキーは相乗りの対象から外れる
+    again = scheduler.submit("a", MODEL, lambda: calls.append(1), key=key)
+    assert not again.coalesced
+    blocked.set()
+    again.result(timeout=5)
+    assert calls == [1]
+
+
+def test_started_job_cannot_be_cancelled(scheduler):
+    ticket = scheduler.submit("a", MODEL, lambda: "done")
+    assert ticket.result(timeout=5) == "done"
+    assert ticket.cancel() is False and not ticket.cancelled()
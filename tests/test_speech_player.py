@@ -0,0 +1,25 @@
+import pytest
+
+from speech_player import sentence_spans, split_sentences
+
+
+@pytest.mark.parametrize(
+    "text, sentences",
+    [
+        ("Yes, I am. Let us go.", ["Yes, I am.", "Let us go."]),
+        ("She said no. Then she left.", ["She said no.", "Then she left."]),
+        ("Come with us. It is fun.", ["Come with us.", "It is fun."]),
+        ("Mr. Smith met Dr. Brown on Main St. at noon.", ["Mr. Smith met Dr. Brown on Main St. at noon."]),
+        ("We open at 9 a.m. on Monday. Please come.", ["We open at 9 a.m. on Monday.", "Please come."]),
+        ("Room No. 5 is open. Go now.", ["Room No. 5 is open.", "Go now."]),
+        ("J. K. Rowling wrote it. We read it.", ["J. K. Rowling wrote it.", "We read it."]),
+        ('"Wow." she said. It was late.', ['"Wow." she said.', "It was late."]),
+    ],
+)
+def test_split_sentences(text, sentences):
+    assert split_sentences(text) == sentences
+
+
+def test_spans_point_into_original_text():
+    text = "  Yes, I am.  Let us go.\nSee you."
+    assert [text[start:end] for start, end in sentence_spans(text)] == ["Yes, I am.", "Let us go.", "See you."]
@@ -0,0 +1,23 @@
+from theme_store import ThemeStore
+
+
+def test_index_is_bounded_and_keeps_recent_themes(tmp_path):
+    store = ThemeStore(str(tmp_path / "themes.sqlite3"), max_items=8)
+    themes = [f"テーマ番号{i:03d}の話題" for i in range(40)]
+    for theme in themes:
+        store.add(theme, cefr_level="A2")
+    assert len(store) <= 8 + store._slack
+    assert store.find_near_duplicates(themes[-1], threshold=0.99)[0][1] == themes[-1]
+    assert not store.find_near_duplicates(themes[0], threshold=0.99)
+    # 永続化した履歴は全件残り、読み込み直しても直近 max_items 件だけを索引に入れる
+    reopened = ThemeStore(str(tmp_path / "themes.sqlite3"), max_items=8)
+    assert len(reopened) == 8
+    assert reopened._conn.execute("SELECT COUNT(*) FROM themes").fetchone()[0] == 40
+
+
+def test_sample_diverse_uses_bounded_index(tmp_path):
+    store = ThemeStore(str(tmp_path / "themes.sqlite3"), max_items=4)
+    for theme in ("公園での散歩", "図書館での読書", "海辺での写真撮影", "市場での買い物", "駅での待ち合わせ", "山小屋での料理"):
+        store.add(theme, cefr_level="A2")
+    sampled = store.sample_diverse(k=6, cefr_level="A2")
+    assert "公園での散歩" not in sampled and "山小屋での料理" in sampled
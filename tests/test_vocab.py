@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from vocab import VocabularyIndex, lemma_candidates, profile_passage
+
+
+@pytest.fixture(scope="module")
+def index():
+    # 語彙リスト(CSV)はリポジトリの直下にある
+    return VocabularyIndex.from_directory(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.parametrize(
+    "word, headword",
+    [
+        ("hopes", "hope"), ("hoped", "hope"), ("hoping", "hope"), ("riding", "ride"),
+        ("uses", "use"), ("using", "use"), ("cares", "care"), ("rates", "rate"),
+        ("hates", "hate"), ("planes", "plane"), ("taped", "tape"),
+        # e を補わない形が正しいもの
+        ("visited", "visit"), ("opened", "open"), ("buses", "bus"), ("boxes", "box"),
+        ("stopped", "stop"), ("planned", "plan"), ("played", "play"), ("needed", "need"),
+    ],
+)
+def test_lookup_restores_lemma(index, word, headword):
+    assert index.lookup(word)[1] == headword
+
+
+def test_short_syllable_stem_tries_silent_e_first():
+    assert lemma_candidates("hoping")[:2] == ["hope", "hop"]
+    assert lemma_candidates("wanted")[:2] == ["want", "wante"]
+
+
+def test_analyze_maps_inflections_to_their_headwords(index):
+    tokens = index.analyze("She hopes to see her friends. We are using the planes he rates.")
+    headwords = {token.text: token.headword for token in tokens}
+    assert [headwords[word] for word in ("hopes", "using", "planes", "rates")] == ["hope", "use", "plane", "rate"]
+
+
+def test_inflections_are_not_reported_off_level(index):
+    text = "She hopes to see her friends. They hoped it would rain. We are using the planes he rates."
+    off_level = profile_passage(index, text, "A2")["off_level_words"]
+    assert not {"hop", "us", "rat", "plan"} & set(off_level)
@@ -0,0 +1,206 @@
+"""全セッション共有・永続化されたテーマ履歴と、ローカルの類似検索インデックス
+
+テーマ(文字 2-gram)と文章冒頭(文字 3-gram)それぞれの MinHash 署名を作り、
+LSH(バンド分割)で候補を絞って近似重複を判定する。類似度は両者の大きい方。プロンプトには履歴全体ではなく、互いに
+似ていないテーマを少数選んで渡す。
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+THEME_NGRAM = 2
+PREVIEW_NGRAM = 3
+PREVIEW_CHARS = 120
+# 2^32 未満の素数(a*x+b が uint64 に収まる)
+PRIME = 4294967291
+
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text, n):
+    """空白を除いて小文字化した文字 n-gram の集合"""
+    normalized = "".join(text.lower().split())
+    if len(normalized) <= n:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def minhash(text, n=THEME_NGRAM):
+    """文字 n-gram の MinHash 署名 (uint64 × NUM_PERM)"""
+    grams = shingles(text, n)
+    if not grams:
+        return np.full(NUM_PERM, PRIME, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % PRIME).min(axis=1)
+
+
+def similarity(signature, other):
+    """署名から推定した Jaccard 係数"""
+    return float(np.mean(signature == other))
+
+
+def signatures(theme, preview):
+    """(テーマの署名, 文章冒頭の署名)。文章冒頭が空なら後者は None"""
+    preview = preview[:PREVIEW_CHARS]
+    return minhash(theme), (minhash(preview, PREVIEW_NGRAM) if preview.strip() else None)
+
+
+class ThemeStore:
+    """SQLite に永続化するテーマ履歴と、メモリ上の MinHash/LSH インデックス
+
+    テーマの署名と文章冒頭の署名は別々のバケットに入れる。インデックスは直近 max_items 件
+    だけを持ち、それを超えたら古いものを捨てて作り直す(SQLite には全件残る)。
+    """
+
+    def __init__(self, path, max_items=50000):
+        self.path = path
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS themes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                cefr_level TEXT,
+                theme TEXT NOT NULL,
+                preview TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._themes = []
+        self._levels = []
+        self._signatures = []
+        self._preview_signatures = []
+        self._buckets = {}
+        # 作り直しの回数を抑えるため、max_items をこの件数まで超えてから捨てる
+        self._slack = max(1, max_items // 4)
+        rows = self._conn.execute(
+            "SELECT cefr_level, theme, signature FROM themes ORDER BY id DESC LIMIT ?", (max_items,)
+        ).fetchall()
+        for cefr_level, theme, blob in reversed(rows):
+            stored = np.frombuffer(blob, dtype=np.uint64)
+            preview_signature = stored[NUM_PERM:] if len(stored) > NUM_PERM else None
+            self._index(cefr_level, theme, stored[:NUM_PERM], preview_signature)
+
+    def __len__(self):
+        return len(self._themes)
+
+    def _band_keys(self, kind, signature):
+        if signature is None:
+            return []
+        return [
+            (kind, band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            for band in range(BANDS)
+        ]
+
+    def _index(self, cefr_level, theme, signature, preview_signature):
+        position = len(self._themes)
+        self._themes.append(theme)
+        self._levels.append(cefr_level)
+        self._signatures.append(signature)
+        self._preview_signatures.append(preview_signature)
+        for key in self._band_keys("theme", signature) + self._band_keys("preview", preview_signature):
+            self._buckets.setdefault(key, []).append(position)
+
+    def add(self, theme, preview="", cefr_level=None):
+        """テーマを保存して索引に加える"""
+        signature, preview_signature = signatures(theme, preview)
+        blob = signature.tobytes() + (preview_signature.tobytes() if preview_signature is not None else b"")
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO themes (created_at, cefr_level, theme, preview, signature) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), cefr_level, theme, preview, blob),
+            )
+            self._conn.commit()
+            self._index(cefr_level, theme, signature, preview_signature)
+            if len(self._themes) > self.max_items + self._slack:
+                self._compact()
+
+    def _compact(self):
+        """古いものを捨てて直近 max_items 件に戻し、バケットを作り直す(ロックを持って呼ぶ)"""
+        entries = list(zip(self._levels, self._themes, self._signatures, self._preview_signatures))
+        self._themes, self._levels, self._signatures, self._preview_signatures = [], [], [], []
+        self._buckets = {}
+        for cefr_level, theme, signature, preview_signature in entries[-self.max_items:]:
+            self._index(cefr_level, theme, signature, preview_signature)
+
+    def _scores(self, positions, signature, preview_signature):
+        """候補ごとの類似度(テーマと文章冒頭の大きい方)をまとめて計算する"""
+        scores = (np.stack([self._signatures[p] for p in positions]) == signature).mean(axis=1)
+        if preview_signature is not None:
+            with_preview = [i for i, p in enumerate(positions) if self._preview_signatures[p] is not None]
+            if with_preview:
+                others = np.stack([self._preview_signatures[positions[i]] for i in with_preview])
+                scores[with_preview] = np.maximum(scores[with_preview], (others == preview_signature).mean(axis=1))
+        return scores
+
+    def find_near_duplicates(self, theme, preview="", threshold=0.5, limit=3):
+        """テーマか文章冒頭が似ている過去のテーマを (類似度, テーマ) の降順で返す"""
+        signature, preview_signature = signatures(theme, preview)
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys("theme", signature) + self._band_keys("preview", preview_signature):
+                candidates.update(self._buckets.get(key, ()))
+            positions = list(candidates)
+            scores = self._scores(positions, signature, preview_signature) if positions else []
+            scored = [(float(score), self._themes[position]) for score, position in zip(scores, positions)]
+        scored = [item for item in scored if item[0] >= threshold]
+        scored.sort(key=lambda item: -item[0])
+        return scored[:limit]
+
+    def sample_diverse(self, k=6, seed_themes=(), window=500, cefr_level=None, max_similarity=0.5):
+        """直近 window 件から、互いに(と seed_themes に)似ていないテーマを k 件まで選ぶ
+
+        seed_themes(そのセッションの最近のテーマなど)は必ず先頭に含める。
+        残りは選択済みとの最大類似度が最も低いものから貪欲に選び、
+        max_similarity 以上(選択済みの近似重複)しか残っていなければそこで止める。
+        """
+        selected = list(dict.fromkeys(seed_themes))[:k]
+        with self._lock:
+            positions = [
+                position for position in range(max(0, len(self._themes) - window), len(self._themes))
+                if cefr_level is None or self._levels[position] == cefr_level
+            ]
+            themes = [self._themes[position] for position in positions]
+            matrix = np.array([self._signatures[position] for position in positions]).reshape(-1, NUM_PERM)
+        if len(selected) >= k or not themes:
+            return selected
+
+        row_of = {theme: row for row, theme in enumerate(themes)}
+        taken = np.zeros(len(themes), dtype=bool)
+        # 各候補と選択済みとの最大類似度
+        closest = np.zeros(len(themes))
+        for theme in selected:
+            if theme in row_of:
+                taken[row_of[theme]] = True
+                signature = matrix[row_of[theme]]
+            else:
+                signature = minhash(theme)
+            closest = np.maximum(closest, (matrix == signature).mean(axis=1))
+        # 同点なら新しいものを優先
+        recency = np.arange(len(themes)) * 1e-9
+        while len(selected) < k:
+            score = np.where(taken, np.inf, closest - recency)
+            best = int(np.argmin(score))
+            if taken[best] or closest[best] >= max_similarity:
+                break
+            taken[best] = True
+            if themes[best] in selected:
+                continue
+            selected.append(themes[best])
+            closest = np.maximum(closest, (matrix == matrix[best]).mean(axis=1))
+        return selected
@@ -0,0 +1,323 @@
+"""サーバー側の音声合成: 文ごとの合成・クリップのキャッシュ・pydub での結合
+
+ブラウザの Web Speech API は端末ごとに使える声や品質が違い、音声を保存することもできない。
+ここでは TTS バックエンド(既定はオフラインで動く espeak-ng / espeak)で文ごとに WAV を作る。
+
+- 合成はワーカースレッドで並行に行い、各文章の先頭の文から順に処理する
+  (どのセッションも最初の文が早くできて、すぐに再生を始められる)
+- クリップは (本文, 声, 速さ) をキーにディスクへ保存し、同じ文は作り直さない。
+  合成中の同じクリップの依頼は1回の合成にまとめる
+- 保存先は Streamlit の静的ファイル配信(static/ 以下)の中なので、プレーヤーは
+  できた文から順に取りに行ける(最後の文を待たずに再生できる)
+- 文章全体の音声は、すべての文がそろってから pydub で結合して MP3 / OGG にする
+  (ffmpeg が無ければ WAV)
+"""
+import hashlib
+import io
+import itertools
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+# クリップを置くディレクトリと、ブラウザから見た URL(server.enableStaticServing で配信)
+CLIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "tts")
+CLIP_URL_PREFIX = "app/static/tts/"
+# 話者の性別ごとの espeak の声
+VOICES = {"male": "en-us+m3", "female": "en-us+f3", "neutral": "en-us"}
+# 話す速さ(1分あたりの語数)
+DEFAULT_RATE = 160
+RATES = (120, 140, 160, 180, 200)
+# 結合するときに文と文の間に入れる無音(ミリ秒)
+SENTENCE_PAUSE_MS = 300
+MIME_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "wav": "audio/wav"}
+# 結合した音声のビットレート(声なので低めで十分)
+BITRATE = "64k"
+
+
+class TTSError(Exception):
+    pass
+
+
+def _fix_wav_header(data):
+    """パイプへ書き出した WAV(長さが未確定のヘッダー)の長さを実際の値に直す"""
+    from pydub.audio_segment import fix_wav_headers
+
+    data = bytearray(data)
+    fix_wav_headers(data)
+    return bytes(data)
+
+
+class EspeakBackend:
+    """espeak-ng(無ければ espeak)のコマンドで合成するオフラインのバックエンド"""
+
+    name = "espeak"
+
+    def __init__(self, executable=None, timeout=30):
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.executable:
+            raise TTSError("espeak-ng / espeak が見つかりません")
+        self.timeout = timeout
+
+    def synthesize(self, text, voice, rate):
+        """text を読み上げた WAV のバイト列を返す"""
+        result = subprocess.run(
+            [self.executable, "-v", voice, "-s", str(int(rate)), "--stdin", "--stdout"],
+            input=text.encode("utf-8"), capture_output=True, timeout=self.timeout,
+        )
+        if result.returncode != 0 or not result.stdout:
+            message = result.stderr.decode("utf-8", "replace").strip()
+            raise TTSError(message or f"espeak が終了コード {result.returncode} で終了しました")
+        return _fix_wav_header(result.stdout)
+
+
+class FakeTTSBackend:
+    """語数と速さに応じた長さの無音の WAV を返すフェイクバックエンド(開発・テスト・負荷試験用)"""
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, sample_rate=22050):
+        self.latency = latency
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text, voice, rate):
+        time.sleep(self.latency)
+        seconds = max(0.2, len(text.split()) * 60 / rate)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(b"\0\0" * int(seconds * self.sample_rate))
+        return buffer.getvalue()
+
+
+def create_tts_backend(name="espeak", fake_latency=0.0):
+    """名前から TTS バックエンドを作る("none" なら None = サーバー側の合成を使わない)"""
+    if name == "none":
+        return None
+    if name == "espeak":
+        return EspeakBackend()
+    if name == "fake":
+        return FakeTTSBackend(latency=fake_latency)
+    raise ValueError(f"不明な TTS バックエンド: {name}")
+
+
+def encoder_available():
+    """MP3 / OGG への変換に使う ffmpeg(または avconv)があるか"""
+    return bool(shutil.which("ffmpeg") or shutil.which("avconv"))
+
+
+class ClipCache:
+    """音声ファイルを置くディレクトリ(合計サイズに上限のある LRU)
+
+    ファイル名はキー + 拡張子。書きかけのファイルが配信されないよう、
+    別名で書いてから置き換える。プロセスで1つ作って全セッションで共有する。
+    """
+
+    def __init__(self, directory=CLIP_DIR, limit=256 * 1024 * 1024):
+        self.directory = directory
+        self.limit = limit
+        self._lock = threading.Lock()
+        # ファイル名 → 大きさ(末尾ほど最近使われた)
+        self._files = OrderedDict()
+        self._bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _mtime, name, size in sorted(entries):
+            self._files[name] = size
+            self._bytes += size
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._files
+
+    def get(self, name):
+        """ファイルの中身(無ければ None)"""
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(self.path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._files.pop(name, 0)
+            return None
+
+    def put(self, name, data):
+        path = self.path(name)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            # 今入れたもの以外を、古いものから上限に収まるまで削除する
+            while self._bytes > self.limit and len(self._files) > 1:
+                old_name, size = self._files.popitem(last=False)
+                self._bytes -= size
+                try:
+                    os.remove(self.path(old_name))
+                except FileNotFoundError:
+                    pass
+
+    def usage(self):
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes}
+
+
+class AudioJob:
+    """1つの文章の合成状況(names[i] が i 番目の文のクリップのファイル名)"""
+
+    def __init__(self, sentences, voice, rate, names, futures):
+        self.sentences = sentences
+        self.voice = voice
+        self.rate = rate
+        self.names = names
+        self.futures = futures
+
+    def __len__(self):
+        return len(self.names)
+
+    def ready_count(self):
+        return sum(1 for future in self.futures if future.done() and future.exception() is None)
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def wait(self, timeout=None):
+        """すべての文が終わるまで最大 timeout 秒待ち、終わったかどうかを返す"""
+        wait(self.futures, timeout=timeout)
+        return self.done()
+
+    def errors(self):
+        return [future.exception() for future in self.futures if future.done() and future.exception() is not None]
+
+
+class AudioRenderer:
+    """文ごとの合成をワーカースレッドで行い、クリップのキャッシュと結合を受け持つ
+
+    待ち行列は文の番号の小さい順(同じ番号なら依頼順)に処理するので、
+    後から来たセッションの最初の文も、先に来た長い文章の残りの文より先に合成される。
+    observer を渡すと、合成が終わるたびに計測値の dict(operation, model, duration, outcome)を渡して呼ぶ。
+    """
+
+    def __init__(self, backend, cache, workers=2, observer=None):
+        self.backend = backend
+        self.cache = cache
+        self.observer = observer
+        self._lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        # 合成待ち・合成中のクリップ(同じクリップの依頼を1回にまとめる)
+        self._pending = {}
+        self.stats = {"synthesized": 0, "cache_hits": 0, "coalesced": 0, "failed": 0}
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"tts-{i}", daemon=True).start()
+
+    def clip_name(self, sentence, voice, rate):
+        key = f"{self.backend.name}\0{voice}\0{rate}\0{sentence}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ".wav"
+
+    def render(self, sentences, voice, rate):
+        """文章の各文の合成を依頼して AudioJob を返す(保存済みの文はすぐに完了する)"""
+        names = []
+        futures = []
+        with self._lock:
+            for index, sentence in enumerate(sentences):
+                name = self.clip_name(sentence, voice, rate)
+                future = self._pending.get(name)
+                if future is not None:
+                    self.stats["coalesced"] += 1
+                elif name in self.cache:
+                    self.stats["cache_hits"] += 1
+                    future = Future()
+                    future.set_result(name)
+                else:
+                    future = Future()
+                    self._pending[name] = future
+                    self._queue.put((index, next(self._order), name, sentence, voice, rate, future))
+                names.append(name)
+                futures.append(future)
+        return AudioJob(list(sentences), voice, rate, names, futures)
+
+    def _worker(self):
+        while True:
+            _index, _order, name, sentence, voice, rate, future = self._queue.get()
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                self.cache.put(name, self.backend.synthesize(sentence, voice, rate))
+                future.set_result(name)
+            except Exception as e:
+                outcome = type(e).__name__
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(name, None)
+                    self.stats["synthesized" if outcome == "ok" else "failed"] += 1
+            self._observe(voice, start, outcome)
+
+    def _observe(self, voice, start, outcome):
+        if self.observer is None:
+            return
+        try:
+            self.observer({
+                "operation": "tts:sentence",
+                "model": f"{self.backend.name}:{voice}",
+                "duration": time.perf_counter() - start,
+                "outcome": outcome,
+            })
+        except Exception:
+            # 計測の失敗で合成自体を失敗させない
+            pass
+
+    def _clip(self, job, index):
+        """index 番目の文のクリップ(キャッシュから削除されていたら作り直す)"""
+        data = self.cache.get(job.names[index])
+        if data is None:
+            data = self.backend.synthesize(job.sentences[index], job.voice, job.rate)
+            self.cache.put(job.names[index], data)
+        return data
+
+    def assemble(self, job, audio_format="mp3"):
+        """全文の音声を1つのファイルにして (バイト列, 形式) を返す(結合結果もキャッシュする)
+
+        ffmpeg が無ければ形式は WAV になる。job のすべての文が完了してから呼ぶこと。
+        """
+        if audio_format not in MIME_TYPES or not encoder_available():
+            audio_format = "wav"
+        key = "\0".join(job.names) + f"\0{SENTENCE_PAUSE_MS}\0{BITRATE}"
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest() + "." + audio_format
+        data = self.cache.get(name)
+        if data is not None:
+            return data, audio_format
+
+        from pydub import AudioSegment
+
+        pause = AudioSegment.silent(duration=SENTENCE_PAUSE_MS)
+        combined = AudioSegment.empty()
+        for index in range(len(job)):
+            clip = AudioSegment.from_wav(io.BytesIO(self._clip(job, index)))
+            combined += clip if index == 0 else pause + clip
+        buffer = io.BytesIO()
+        parameters = {} if audio_format == "wav" else {"bitrate": BITRATE}
+        combined.export(buffer, format=audio_format, **parameters)
+        data = buffer.getvalue()
+        self.cache.put(name, data)
+        return data, audio_format
@@ -0,0 +1,295 @@
+"""同梱の CEFR 単語リスト (A1〜B2) から作る語彙インデックス"""
+import os
+import re
+from collections import namedtuple
+
+# 単語リストのレベルと順位(低いほどやさしい)
+WORD_LIST_LEVELS = ("A1", "A2", "B1", "B2")
+LEVEL_RANKS = {level: rank for rank, level in enumerate(WORD_LIST_LEVELS, start=1)}
+# どの単語リストにも載っていない語(B2 より上とみなす)
+OFF_LIST_RANK = len(WORD_LIST_LEVELS) + 1
+
+# アプリで選べるレベル → 単語リストの順位
+TARGET_LEVEL_RANKS = {"A0": 1, "A1": 1, "A2": 2, "B1": 3, "B2": 4, "C1": OFF_LIST_RANK}
+
+# 語の並び: a.m. のような略語 / 英単語(アポストロフィ・ハイフンを含む)
+TOKEN_PATTERN = re.compile(r"(?:[A-Za-z]\.){2,}|[A-Za-z]+(?:['’\-][A-Za-z]+)*")
+
+# 活用形の検索結果キャッシュの上限
+LOOKUP_CACHE_SIZE = 50000
+
+Token = namedtuple("Token", "start end text headword rank")
+
+# 規則変化で戻せない主な不規則変化形
+IRREGULAR_FORMS = {
+    "am": "be", "is": "be", "are": "be", "was": "be", "were": "be", "been": "be", "being": "be",
+    "has": "have", "had": "have", "does": "do", "did": "do", "done": "do",
+    "went": "go", "gone": "go", "made": "make", "said": "say", "got": "get", "gotten": "get",
+    "took": "take", "taken": "take", "came": "come", "saw": "see", "seen": "see",
+    "knew": "know", "known": "know", "thought": "think", "told": "tell", "became": "become",
+    "left": "leave", "felt": "feel", "brought": "bring", "began": "begin", "begun": "begin",
+    "kept": "keep", "held": "hold", "wrote": "write", "written": "write", "stood": "stand",
+    "heard": "hear", "meant": "mean", "met": "meet", "ran": "run", "paid": "pay",
+    "sat": "sit", "spoke": "speak", "spoken": "speak", "lay": "lie", "led": "lead",
+    "grew": "grow", "grown": "grow", "lost": "lose", "fell": "fall", "fallen": "fall",
+    "sent": "send", "built": "build", "understood": "understand", "drew": "draw", "drawn": "draw",
+    "broke": "break", "broken": "break", "spent": "spend", "rose": "rise", "risen": "rise",
+    "drove": "drive", "driven": "drive", "bought": "buy", "wore": "wear", "worn": "wear",
+    "chose": "choose", "chosen": "choose", "sought": "seek", "threw": "throw", "thrown": "throw",
+    "caught": "catch", "dealt": "deal", "won": "win", "forgot": "forget", "forgotten": "forget",
+    "sold": "sell", "fought": "fight", "taught": "teach", "ate": "eat", "eaten": "eat",
+    "flew": "fly", "flown": "fly", "gave": "give", "given": "give", "found": "find",
+    "slept": "sleep", "swam": "swim", "swum": "swim", "sang": "sing", "sung": "sing",
+    "drank": "drink", "drunk": "drink", "rode": "ride", "ridden": "ride", "woke": "wake",
+    "woken": "wake", "hid": "hide", "hidden": "hide", "shook": "shake", "shaken": "shake",
+    "stole": "steal", "stolen": "steal", "froze": "freeze", "frozen": "freeze",
+    "bit": "bite", "bitten": "bite", "blew": "blow", "blown": "blow", "fed": "feed",
+    "fled": "flee", "hung": "hang", "struck": "strike", "swore": "swear", "sworn": "swear",
+    "tore": "tear", "torn": "tear", "withdrew": "withdraw",
+    "better": "good", "best": "good", "worse": "bad", "worst": "bad", "further": "far",
+    "farther": "far", "more": "many", "most": "many", "less": "little", "least": "little",
+    "children": "child", "men": "man", "women": "woman", "people": "person", "feet": "foot",
+    "teeth": "tooth", "mice": "mouse", "geese": "goose", "lives": "life", "wives": "wife",
+    "knives": "knife", "leaves": "leaf", "halves": "half", "shelves": "shelf", "wolves": "wolf",
+    "me": "i", "my": "i", "mine": "i", "him": "he", "his": "he", "us": "we", "our": "we",
+    "them": "they", "their": "they", "her": "she", "hers": "she",
+    "can't": "can", "won't": "will", "shan't": "shall",
+}
+
+CONTRACTION_SUFFIXES = ("n't", "'s", "'re", "'ll", "'ve", "'d", "'m")
+
+VOWELS = set("aeiou")
+
+
+def normalize_word(word):
+    """比較用に正規化(小文字化・アポストロフィ統一・略語のピリオド除去)"""
+    return word.strip().lower().replace("’", "'").replace(".", "")
+
+
+def _ends_with_short_syllable(stem):
+    """母音1つ + 子音1つで終わるか(hop, rid, us など。w / x / y で終わるものは除く)"""
+    if len(stem) < 2 or stem[-1] in VOWELS or stem[-1] in "wxy" or stem[-2] not in VOWELS:
+        return False
+    return len(stem) == 2 or stem[-3] not in VOWELS
+
+
+def lemma_candidates(word):
+    """正規化済みの語から原形の候補を優先順に返す(語そのものは含まない)"""
+    candidates = []
+
+    def add(candidate):
+        if len(candidate) > 1 and candidate != word and candidate not in candidates:
+            candidates.append(candidate)
+
+    if word in IRREGULAR_FORMS:
+        add(IRREGULAR_FORMS[word])
+
+    for suffix in CONTRACTION_SUFFIXES:
+        if word.endswith(suffix) and len(word) > len(suffix) + 1:
+            base = word[: -len(suffix)]
+            add(base)
+            if base in IRREGULAR_FORMS:
+                add(IRREGULAR_FORMS[base])
+            return candidates
+
+    for suffix, replacements in (
+        ("ies", ("y",)),
+        ("ied", ("y",)),
+        ("ier", ("y",)),
+        ("iest", ("y",)),
+        ("ves", ("f", "fe")),
+        ("es", ("", "e")),
+        ("s", ("",)),
+        ("ed", ("", "e")),
+        ("ing", ("", "e")),
+        ("er", ("", "e")),
+        ("est", ("", "e")),
+    ):
+        if not word.endswith(suffix) or len(word) - len(suffix) < 2:
+            continue
+        stem = word[: -len(suffix)]
+        # 短母音 + 子音の語なら子音を重ねるはず(hop → hopping)なので、
+        # hoping / hoped / uses / cares は e を補った形(hope, use, care)を先に試す
+        if replacements == ("", "e") and _ends_with_short_syllable(stem):
+            replacements = ("e", "")
+        for replacement in replacements:
+            add(stem + replacement)
+        # stopped → stop, bigger → big
+        if len(stem) >= 3 and stem[-1] == stem[-2] and stem[-1] not in VOWELS:
+            add(stem[:-1])
+        # -ies/-ied などは1つの規則で十分
+        if suffix in ("ies", "ied", "ier", "iest", "ves"):
+            break
+    return candidates
+
+
+class VocabularyIndex:
+    """単語・熟語ごとに最も低い CEFR レベルを引けるインデックス
+
+    1語の見出し語は dict で O(1) に引き、熟語は先頭語からたどるトライで
+    文章を1回走査する間に最長一致させる。
+    """
+
+    def __init__(self):
+        self.words = {}
+        self.phrases = {}
+        self.max_phrase_length = 1
+        self._lookup_cache = {}
+        self._words_by_rank = None
+
+    @classmethod
+    def from_csv_files(cls, paths_by_level):
+        """{レベル: CSVパス} から読み込む(各 CSV は headword 列を持つ)"""
+        # pandas の読み込みは重いので、単語リストを読むときまで遅らせる
+        import pandas as pd
+
+        index = cls()
+        for level, path in paths_by_level.items():
+            headwords = pd.read_csv(path, dtype=str)["headword"].dropna().drop_duplicates()
+            for headword in headwords:
+                index.add(headword, LEVEL_RANKS[level])
+        return index
+
+    @classmethod
+    def from_directory(cls, directory):
+        """同梱の A1_word.csv〜B2_word.csv を読み込む"""
+        return cls.from_csv_files(
+            {level: os.path.join(directory, f"{level}_word.csv") for level in WORD_LIST_LEVELS}
+        )
+
+    def add(self, headword, rank):
+        """見出し語を登録(a.m./A.M./am や gray ; grey のような異表記はすべて登録)"""
+        for variant in re.split(r"\s*[/;]\s*", headword):
+            tokens = [normalize_word(part) for part in TOKEN_PATTERN.findall(variant)]
+            tokens = [token for token in tokens if token]
+            if not tokens:
+                continue
+            if len(tokens) == 1:
+                if rank < self.words.get(tokens[0], OFF_LIST_RANK + 1):
+                    self.words[tokens[0]] = rank
+                continue
+            node = self.phrases
+            for token in tokens:
+                node = node.setdefault(token, {})
+            if rank < node.get(None, (OFF_LIST_RANK + 1,))[0]:
+                node[None] = (rank, " ".join(tokens))
+            self.max_phrase_length = max(self.max_phrase_length, len(tokens))
+        self._lookup_cache.clear()
+        self._words_by_rank = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def words_at(self, rank):
+        """そのレベル順位の1語の見出し語(アルファベット順)"""
+        if self._words_by_rank is None:
+            by_rank = {}
+            for word, word_rank in self.words.items():
+                by_rank.setdefault(word_rank, []).append(word)
+            self._words_by_rank = {word_rank: sorted(words) for word_rank, words in by_rank.items()}
+        return self._words_by_rank.get(rank, [])
+
+    def lookup(self, word):
+        """1語のレベル順位と見出し語を返す。見つからなければ (None, 正規化した語)"""
+        normalized = normalize_word(word)
+        cached = self._lookup_cache.get(normalized)
+        if cached is not None:
+            return cached
+        result = (None, normalized)
+        if normalized in self.words:
+            result = (self.words[normalized], normalized)
+        else:
+            for candidate in lemma_candidates(normalized):
+                if candidate in self.words:
+                    result = (self.words[candidate], candidate)
+                    break
+        if len(self._lookup_cache) >= LOOKUP_CACHE_SIZE:
+            self._lookup_cache.clear()
+        self._lookup_cache[normalized] = result
+        return result
+
+    def tokenize(self, text):
+        """(開始位置, 終了位置, 語) のリスト"""
+        return [(match.start(), match.end(), match.group(0)) for match in TOKEN_PATTERN.finditer(text)]
+
+    def analyze(self, text, spans=None):
+        """文章中の各語に見出し語とレベル順位を付けた Token のリストを返す
+
+        熟語に一致した語は熟語の見出し語と順位を共有する。
+        どのリストにも無い語は OFF_LIST_RANK、大文字始まりの未知語は
+        固有名詞とみなして rank=None とする。
+        """
+        if spans is None:
+            spans = self.tokenize(text)
+        looked_up = [self.lookup(word) for _, _, word in spans]
+        tokens = []
+        i = 0
+        while i < len(spans):
+            match = self._match_phrase(spans, looked_up, i)
+            if match is not None:
+                length, rank, headword = match
+                for start, end, word in spans[i:i + length]:
+                    tokens.append(Token(start, end, word, headword, rank))
+                i += length
+                continue
+            start, end, word = spans[i]
+            rank, headword = looked_up[i]
+            if rank is None and not word[0].isupper():
+                rank = OFF_LIST_RANK
+            tokens.append(Token(start, end, word, headword, rank))
+            i += 1
+        return tokens
+
+    def _match_phrase(self, spans, looked_up, i):
+        """位置 i から始まる最長の熟語を (語数, 順位, 見出し語) で返す"""
+        node = self.phrases
+        best = None
+        for offset in range(min(self.max_phrase_length, len(spans) - i)):
+            surface = normalize_word(spans[i + offset][2])
+            lemma = looked_up[i + offset][1]
+            next_node = node.get(surface) or node.get(lemma)
+            if next_node is None:
+                break
+            node = next_node
+            if None in node:
+                best = (offset + 1, *node[None])
+        return best
+
+
+def rank_label(rank):
+    """レベル順位を表示用のラベルにする"""
+    return WORD_LIST_LEVELS[rank - 1] if rank < OFF_LIST_RANK else "B2+"
+
+
+def profile_passage(index, text, cefr_level, tokens=None):
+    """文章の語彙レベル構成を求める
+
+    目標レベル以下の語の割合 (coverage)、レベル別の語数・割合、
+    目標レベルを超える語 (出現回数の多い順) を dict で返す。固有名詞は数えない。
+    """
+    if tokens is None:
+        tokens = index.analyze(text)
+    target_rank = TARGET_LEVEL_RANKS.get(cefr_level, OFF_LIST_RANK)
+    level_counts = {rank_label(rank): 0 for rank in range(1, OFF_LIST_RANK + 1)}
+    off_level = {}
+    counted = 0
+    proper_nouns = 0
+    for token in tokens:
+        if token.rank is None:
+            proper_nouns += 1
+            continue
+        counted += 1
+        level_counts[rank_label(token.rank)] += 1
+        if token.rank > target_rank:
+            off_level[token.headword] = off_level.get(token.headword, 0) + 1
+    within = sum(count for label, count in level_counts.items()
+                 if LEVEL_RANKS.get(label, OFF_LIST_RANK) <= target_rank)
+    return {
+        "target_level": cefr_level,
+        "tokens": counted,
+        "proper_nouns": proper_nouns,
+        "coverage": within / counted if counted else 1.0,
+        "level_counts": level_counts,
+        "level_shares": {label: count / counted if counted else 0.0 for label, count in level_counts.items()},
+        "off_level_words": sorted(off_level, key=lambda word: (-off_level[word], word)),
+    }